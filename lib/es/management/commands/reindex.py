@@ -3,8 +3,10 @@ Marketplace ElasticSearch Indexer.
 
 Currently creates the indexes and re-indexes apps and feed elements.
 """
+import datetime
 import itertools
 import logging
+import random
 import sys
 import time
 from math import ceil
@@ -15,10 +17,14 @@ from celery import chain, chord, task
 
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
 
 import mkt.feed.indexers as f_indexers
-from lib.es.models import Reindexing
+import mkt.search.indexers as s_indexers
+from lib.es.models import (IndexingHighWaterMark, Reindexing,
+                           ReindexingChunk)
 from mkt.extensions.indexers import ExtensionIndexer
+from mkt.site.decorators import use_master
 from mkt.site.utils import chunked, timestamp_index
 from mkt.webapps.indexers import HomescreenIndexer, WebappIndexer
 from mkt.websites.indexers import WebsiteIndexer
@@ -27,6 +33,10 @@ from mkt.websites.indexers import WebsiteIndexer
 logger = logging.getLogger('z.elasticsearch')
 
 
+class ReindexingError(Exception):
+    pass
+
+
 # Enable these to get full debugging information.
 # logging.getLogger('elasticsearch').setLevel(logging.DEBUG)
 # logging.getLogger('elasticsearch.trace').setLevel(logging.DEBUG)
@@ -136,9 +146,19 @@ def post_index(new_index, old_index, alias, index_name, settings):
         )
     ES.indices.update_aliases(body=dict(actions=actions))
 
+    # Everything modified since the reindexing started was indexed in both
+    # indexes, incremental indexing can take it from there.
+    start_dates = Reindexing.objects.filter(alias=alias).values_list(
+        'start_date', flat=True)
+    if start_dates:
+        IndexingHighWaterMark.set_mark(index_name, start_dates[0])
+
     _print('Unflagging the database.', alias)
     Reindexing.unflag_reindexing(alias=alias)
 
+    # Results cached from the old index may be stale.
+    INDEXER_MAP[index_name].bump_generation()
+
     _print('Removing index {index}.'.format(index=old_index), alias)
     if old_index and ES.indices.exists(index=old_index):
         ES.indices.delete(index=old_index)
@@ -153,23 +173,85 @@ def post_index(new_index, old_index, alias, index_name, settings):
 
 
 @task(ignore_result=False)
-def run_indexing(index, index_name, ids):
-    """Index the objects.
+@use_master
+def run_indexing(index, index_name, chunk_id):
+    """Index the objects of a chunk and mark it as done.
 
     - index: name of the index
+    - chunk_id: id of the ReindexingChunk to index
+
+    If Elasticsearch fails to index some of the objects, the chunk is left
+    undone and the task fails, so that the chord callback swapping the alias
+    doesn't run and `--resume` indexes the chunk again.
 
     Note: `ignore_result=False` is required for the chord to work and trigger
     the callback.
 
     """
     indexer = INDEXER_MAP[index_name]
-    indexer.run_indexing(ids, ES, index=index)
+    chunk = ReindexingChunk.objects.get(pk=chunk_id)
+    ids = list(indexer.get_indexable()
+               .filter(id__gte=chunk.first_id, id__lte=chunk.last_id)
+               .values_list('id', flat=True))
+    success, errors = indexer.run_indexing(ids, ES, index=index)
+    if errors:
+        raise ReindexingError(
+            'Failed to index {n} items of chunk {chunk} ({first}-{last}) of '
+            '{index}.'.format(n=len(errors), chunk=chunk.pk,
+                              first=chunk.first_id, last=chunk.last_id,
+                              index=index))
+    chunk.mark_done()
+
+    _print_progress(chunk.alias, chunk.new_index)
+
+
+def _print_progress(alias, new_index):
+    progress = ReindexingChunk.get_progress(alias, new_index)
+    eta = progress['eta']
+    _print('Indexed {done}/{total} items ({rate:.1f} items/s), ETA: {eta}'
+           .format(done=progress['done'], total=progress['total'],
+                   rate=progress['rate'],
+                   eta=(datetime.timedelta(seconds=int(eta))
+                        if eta is not None else 'unknown')), alias)
+
+
+def chunk_indexing(indexer, chunk_size, start_id=0):
+    """
+    Chunk the items to index, yielding lists of ids in id order, starting
+    after `start_id`.
 
+    Ids are paginated using the last id of each chunk (keyset pagination)
+    so that they never all have to be loaded at once.
+    """
+    qs = indexer.get_indexable().order_by('id').values_list('id', flat=True)
+    while True:
+        ids = list(qs.filter(id__gt=start_id)[:chunk_size])
+        if not ids:
+            return
+        yield ids
+        start_id = ids[-1]
 
-def chunk_indexing(indexer, chunk_size):
-    """Chunk the items to index."""
-    chunks = list(indexer.get_indexable().values_list('id', flat=True))
-    return chunked(chunks, chunk_size), len(chunks)
+
+def sample_ids(indexer, size):
+    """
+    Return a random sample of at most `size` ids of objects to index, picked
+    from the range of existing ids so that the whole table isn't sorted.
+    """
+    qs = indexer.get_indexable()
+    bounds = qs.aggregate(low=Min('id'), high=Max('id'))
+    if bounds['low'] is None:
+        return []
+    ids = xrange(bounds['low'], bounds['high'] + 1)
+    ids = random.sample(ids, min(size, len(ids)))
+    return list(qs.filter(id__in=ids).values_list('id', flat=True))
+
+
+def create_chunks(indexer, alias, new_index, start_id=0):
+    """Create and yield the ReindexingChunks of the items to index."""
+    for ids in chunk_indexing(indexer, indexer.chunk_size, start_id):
+        yield ReindexingChunk.objects.create(
+            alias=alias, new_index=new_index, first_id=ids[0],
+            last_id=ids[-1], count=len(ids))
 
 
 class Command(BaseCommand):
@@ -185,6 +267,22 @@ class Command(BaseCommand):
                     help=('Bypass the database flag that says '
                           'another indexation is ongoing'),
                     default=False),
+        make_option('--resume', action='store_true',
+                    help=('Resume an unfinished indexation, only indexing '
+                          'the chunks that did not complete'),
+                    default=False),
+        make_option('--status', action='store_true',
+                    help='Show the progress of the ongoing indexation',
+                    default=False),
+        make_option('--incremental', action='store_true',
+                    help=('Only index the objects modified since the last '
+                          'indexation, in the current indexes'),
+                    default=False),
+        make_option('--verify-sample', action='store', type='int',
+                    dest='verify_sample', default=100,
+                    help=('With --incremental, number of random objects to '
+                          'check the indexed modified date of (default: '
+                          '100)')),
     )
 
     def handle(self, *args, **kwargs):
@@ -196,6 +294,15 @@ class Command(BaseCommand):
         index_choice = kwargs.get('index', None)
         prefix = kwargs.get('prefix', '')
         force = kwargs.get('force', False)
+        resume = kwargs.get('resume', False)
+
+        if kwargs.get('status', False):
+            reindexings = Reindexing.objects.all()
+            if not reindexings:
+                _print('No indexation ongoing.')
+            for reindexing in reindexings:
+                _print_progress(reindexing.alias, reindexing.new_index)
+            return
 
         if index_choice:
             # If we only want to reindex a subset of indexes.
@@ -207,77 +314,217 @@ class Command(BaseCommand):
         else:
             INDEXES = INDEXERS
 
-        if Reindexing.is_reindexing() and not force:
+        if kwargs.get('incremental', False):
+            for INDEXER in INDEXES:
+                self.catch_up(INDEXER)
+                self.verify(INDEXER, kwargs.get('verify_sample', 100))
+            return
+
+        if resume:
+            if force:
+                raise CommandError('--resume and --force are incompatible')
+        elif Reindexing.is_reindexing() and not force:
             raise CommandError('Indexation already occuring - use --force to '
-                               'bypass')
+                               'bypass, or --resume to resume it')
         elif force:
             Reindexing.unflag_reindexing()
 
         for INDEXER in INDEXES:
-            index_name = INDEXER.get_mapping_type_name()
-            chunk_size = INDEXER.chunk_size
-            alias = ES_INDEXES[index_name]
-
-            chunks, total = chunk_indexing(INDEXER, chunk_size)
-            if not total:
-                _print('No items to queue.', alias)
+            if resume:
+                self.resume(INDEXER)
             else:
-                total_chunks = int(ceil(total / float(chunk_size)))
-                _print('Indexing {total} items into {n} chunks of size {size}'
-                       .format(total=total, n=total_chunks, size=chunk_size),
-                       alias)
+                self.reindex(INDEXER, prefix)
+
+        _print('New index and indexing tasks all queued up.')
 
-            # Get the old index if it exists.
+    def catch_up(self, INDEXER):
+        """
+        Index the objects modified since the high-water mark of INDEXER and
+        unindex the ones that aren't indexable anymore, then move the mark to
+        the most recent `modified` date, unless some of them failed.
+        """
+        index_name = INDEXER.get_mapping_type_name()
+        alias = ES_INDEXES[index_name]
+
+        mark = IndexingHighWaterMark.get_mark(index_name)
+        if mark is None:
+            _print('No previous indexation, a full reindex is needed.', alias)
+            return
+
+        # Objects modified at the exact same date as the mark may not all
+        # have been indexed, so they get indexed again.
+        model = INDEXER.get_model()
+        qs = getattr(model, 'with_deleted', model.objects)
+        modified = dict(qs.filter(modified__gte=mark)
+                        .values_list('id', 'modified'))
+        indexable = set(INDEXER.get_indexable().filter(modified__gte=mark)
+                        .values_list('id', flat=True))
+        unindexable = sorted(set(modified) - indexable)
+
+        failed = False
+        _print('Indexing {n} items modified since {mark}.'.format(
+            n=len(indexable), mark=mark), alias)
+        for ids in chunked(sorted(indexable), INDEXER.chunk_size):
             try:
-                aliases = ES.indices.get_alias(name=alias).keys()
+                s_indexers.index(ids, INDEXER)
+            except s_indexers.IndexingError as e:
+                logger.error('Failed to index %s items: %s' % (index_name,
+                                                               e.ids))
+                failed = True
+
+        if unindexable:
+            _print('Unindexing {n} items not indexable anymore.'.format(
+                n=len(unindexable)), alias)
+            success, errors = INDEXER.unindexer(unindexable)
+            failed = failed or bool(errors)
+
+        if failed:
+            # The next run will try them again.
+            _print('Some items failed, the high-water mark was not moved.',
+                   alias)
+        elif modified:
+            IndexingHighWaterMark.set_mark(index_name, max(modified.values()))
+
+    def verify(self, INDEXER, sample_size):
+        """
+        Compare the indexed `modified` date of a random sample of objects
+        with the database, indexing the ones that are out of date.
+        """
+        index_name = INDEXER.get_mapping_type_name()
+        alias = ES_INDEXES[index_name]
+
+        properties = INDEXER.get_mapping()[index_name]['properties']
+        if not sample_size or 'modified' not in properties:
+            return
+
+        modified = dict(INDEXER.get_indexable()
+                        .filter(id__in=sample_ids(INDEXER, sample_size))
+                        .values_list('id', 'modified'))
+        if not modified:
+            return
+        docs = ES.mget(body={'ids': modified.keys()}, index=alias,
+                       doc_type=index_name, _source='modified')['docs']
+        indexed = dict((int(doc['_id']), doc['_source']['modified'])
+                       for doc in docs if doc.get('found'))
+
+        # Dates are indexed as ISO 8601 strings, compare up to the seconds.
+        stale = sorted(pk for pk, date in modified.items()
+                       if indexed.get(pk, '')[:19] != date.isoformat()[:19])
+        _print('{n} out of {total} sampled items were out of date.'.format(
+            n=len(stale), total=len(modified)), alias)
+        if stale:
+            logger.warning('Indexing %s out of date %s items: %s' % (
+                len(stale), index_name, stale))
+            for ids in chunked(stale, INDEXER.chunk_size):
+                s_indexers.index(ids, INDEXER)
+
+    def resume(self, INDEXER):
+        """Queue the unfinished chunks of an indexation, then post_index."""
+        index_name = INDEXER.get_mapping_type_name()
+        alias = ES_INDEXES[index_name]
+
+        try:
+            reindexing = Reindexing.objects.get(alias=alias)
+        except Reindexing.DoesNotExist:
+            _print('No indexation to resume.', alias)
+            return
+        new_index, old_index = reindexing.new_index, reindexing.old_index
+
+        chunks = ReindexingChunk.objects.filter(alias=alias,
+                                                new_index=new_index)
+        # Evaluated before chunking what's left, which creates chunks that
+        # aren't completed either.
+        pending = list(chunks.filter(completed__isnull=True))
+        # Items the interrupted run did not get to chunk.
+        last_id = max(chunks.values_list('last_id', flat=True) or [0])
+        new_chunks = list(create_chunks(INDEXER, alias, new_index,
+                                        start_id=last_id))
+        _print('Resuming: {n} chunks left to index.'.format(
+            n=len(pending) + len(new_chunks)), alias)
+
+        post_task = post_index.si(new_index, old_index, alias, index_name,
+                                  self.get_post_settings(old_index))
+        index_tasks = [run_indexing.si(new_index, index_name, chunk.pk)
+                       for chunk in pending + new_chunks]
+        self.ship(index_tasks, post_task=post_task)
+
+    def get_post_settings(self, old_index):
+        """The settings applied to the new index once it has been filled."""
+        s = self.get_index_settings(old_index)
+        return {'number_of_replicas': s.get('number_of_replicas',
+                                            settings.ES_DEFAULT_NUM_REPLICAS),
+                'refresh_interval': '5s'}
+
+    def get_index_settings(self, old_index):
+        """See how the index is currently configured."""
+        if old_index:
+            try:
+                return (ES.indices.get_settings(index=old_index).get(
+                    old_index, {}).get('settings', {}))
             except elasticsearch.NotFoundError:
-                aliases = []
-            old_index = aliases[0] if aliases else None
-
-            # Create a new index, using the index name with a timestamp.
-            new_index = timestamp_index(prefix + alias)
-
-            # See how the index is currently configured.
-            if old_index:
-                try:
-                    s = (ES.indices.get_settings(index=old_index).get(
-                        old_index, {}).get('settings', {}))
-                except elasticsearch.NotFoundError:
-                    s = {}
-            else:
-                s = {}
-            num_replicas = s.get('number_of_replicas',
-                                 settings.ES_DEFAULT_NUM_REPLICAS)
-            num_shards = s.get('number_of_shards',
-                               settings.ES_DEFAULT_NUM_SHARDS)
-
-            pre_task = pre_index.si(new_index, old_index, alias, index_name, {
-                'analysis': INDEXER.get_analysis(),
-                'number_of_replicas': 0,
-                'number_of_shards': num_shards,
-                'store.compress.tv': True,
-                'store.compress.stored': True,
-                'refresh_interval': '-1'})
-            post_task = post_index.si(new_index, old_index, alias, index_name,
-                                      {'number_of_replicas': num_replicas,
-                                       'refresh_interval': '5s'})
-
-            # Ship it.
-            if not total:
-                # If there's no data we still create the index and alias.
-                chain(pre_task, post_task).apply_async()
+                pass
+        return {}
+
+    def ship(self, index_tasks, post_task, pre_task=None):
+        """Queue the indexing tasks between `pre_task` and `post_task`."""
+        if not index_tasks:
+            # If there's no data we still create the index and alias.
+            tasks = filter(None, [pre_task, post_task])
+            chain(*tasks).apply_async()
+        elif settings.CELERY_ALWAYS_EAGER:
+            # Eager mode and chords don't get along. So we serialize
+            # the tasks as a workaround.
+            tasks = filter(None, [pre_task] + index_tasks + [post_task])
+            chain(*tasks).apply_async()
+        else:
+            body = chord(header=index_tasks, body=post_task)
+            if pre_task:
+                chain(pre_task, body).apply_async()
             else:
-                index_tasks = [run_indexing.si(new_index, index_name, chunk)
-                               for chunk in chunks]
-
-                if settings.CELERY_ALWAYS_EAGER:
-                    # Eager mode and chords don't get along. So we serialize
-                    # the tasks as a workaround.
-                    index_tasks.insert(0, pre_task)
-                    index_tasks.append(post_task)
-                    chain(*index_tasks).apply_async()
-                else:
-                    chain(pre_task, chord(header=index_tasks,
-                                          body=post_task)).apply_async()
+                body.apply_async()
 
-        _print('New index and indexing tasks all queued up.')
+    def reindex(self, INDEXER, prefix):
+        """Create a new index for INDEXER and queue its indexing."""
+        index_name = INDEXER.get_mapping_type_name()
+        chunk_size = INDEXER.chunk_size
+        alias = ES_INDEXES[index_name]
+
+        total = INDEXER.get_indexable().count()
+        if not total:
+            _print('No items to queue.', alias)
+        else:
+            total_chunks = int(ceil(total / float(chunk_size)))
+            _print('Indexing {total} items into {n} chunks of size {size}'
+                   .format(total=total, n=total_chunks, size=chunk_size),
+                   alias)
+
+        # Get the old index if it exists.
+        try:
+            aliases = ES.indices.get_alias(name=alias).keys()
+        except elasticsearch.NotFoundError:
+            aliases = []
+        old_index = aliases[0] if aliases else None
+
+        # Create a new index, using the index name with a timestamp.
+        new_index = timestamp_index(prefix + alias)
+
+        s = self.get_index_settings(old_index)
+        num_shards = s.get('number_of_shards', settings.ES_DEFAULT_NUM_SHARDS)
+
+        pre_task = pre_index.si(new_index, old_index, alias, index_name, {
+            'analysis': INDEXER.get_analysis(),
+            'number_of_replicas': 0,
+            'number_of_shards': num_shards,
+            'store.compress.tv': True,
+            'store.compress.stored': True,
+            'refresh_interval': '-1'})
+        post_task = post_index.si(new_index, old_index, alias, index_name,
+                                  self.get_post_settings(old_index))
+
+        # The chunks are recorded before anything is queued so that an
+        # interrupted indexation can be resumed with --resume.
+        index_tasks = [run_indexing.si(new_index, index_name, chunk.pk)
+                       for chunk in create_chunks(INDEXER, alias, new_index)]
+
+        # Ship it.
+        self.ship(index_tasks, post_task=post_task, pre_task=pre_task)
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('es', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndexingQueue',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('indexer', models.CharField(max_length=255)),
+                ('object_id', models.PositiveIntegerField()),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'db_table': 'zadmin_indexing_queue',
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='indexingqueue',
+            unique_together=set([('indexer', 'object_id')]),
+        ),
+    ]
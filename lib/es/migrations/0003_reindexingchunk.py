@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('es', '0002_indexingqueue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReindexingChunk',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('alias', models.CharField(max_length=255)),
+                ('new_index', models.CharField(max_length=255)),
+                ('first_id', models.PositiveIntegerField()),
+                ('last_id', models.PositiveIntegerField()),
+                ('count', models.PositiveIntegerField()),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('completed', models.DateTimeField(null=True)),
+            ],
+            options={
+                'db_table': 'zadmin_reindexing_chunk',
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterIndexTogether(
+            name='reindexingchunk',
+            index_together=set([('alias', 'new_index')]),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('es', '0003_reindexingchunk'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndexingHighWaterMark',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('indexer', models.CharField(unique=True, max_length=255)),
+                ('modified', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'zadmin_indexing_high_water_mark',
+            },
+            bases=(models.Model,),
+        ),
+    ]
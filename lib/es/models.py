@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.utils import timezone
 
 
@@ -30,9 +30,12 @@ class Reindexing(models.Model):
     def unflag_reindexing(cls, alias=None):
         """Mark down that we are done reindexing"""
         qs = cls.objects.all()
+        chunks = ReindexingChunk.objects.all()
         if alias:
             qs = qs.filter(alias=alias)
+            chunks = chunks.filter(alias=alias)
         qs.delete()
+        chunks.delete()
 
     @classmethod
     def get_indices(cls, alias):
@@ -47,3 +50,121 @@ class Reindexing(models.Model):
                     if idx is not None]
         except Reindexing.DoesNotExist:
             return [alias]
+
+
+class ReindexingChunk(models.Model):
+    """
+    A chunk of the objects indexed during a reindexing, covering the ids from
+    `first_id` to `last_id`. Used to track the progress of the reindexing and
+    to resume it if some chunks failed.
+    """
+    alias = models.CharField(max_length=255)
+    new_index = models.CharField(max_length=255)
+    first_id = models.PositiveIntegerField()
+    last_id = models.PositiveIntegerField()
+    count = models.PositiveIntegerField()
+    created = models.DateTimeField(default=timezone.now)
+    completed = models.DateTimeField(null=True)
+
+    class Meta:
+        db_table = 'zadmin_reindexing_chunk'
+        index_together = ('alias', 'new_index')
+
+    def mark_done(self):
+        self.completed = timezone.now()
+        self.save()
+
+    @classmethod
+    def get_progress(cls, alias, new_index):
+        """
+        Return a dict with the number of objects `done` out of `total`, the
+        indexing `rate` in objects per second and the estimated time left in
+        seconds (`eta`, None until something has been indexed).
+        """
+        chunks = list(cls.objects.filter(alias=alias, new_index=new_index)
+                         .values_list('count', 'created', 'completed'))
+        total = sum(count for count, _, _ in chunks)
+        done = sum(count for count, _, completed in chunks if completed)
+        rate, eta = 0.0, None
+        if done:
+            start = min(created for _, created, _ in chunks)
+            elapsed = (timezone.now() - start).total_seconds()
+            rate = done / max(elapsed, 1.0)
+            eta = (total - done) / rate
+        return {'done': done, 'total': total, 'rate': rate, 'eta': eta}
+
+
+class IndexingQueue(models.Model):
+    """
+    Objects waiting to be indexed, used to coalesce index updates.
+
+    `indexer` is the dotted path to the indexer class.
+    """
+    indexer = models.CharField(max_length=255)
+    object_id = models.PositiveIntegerField()
+    created = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'zadmin_indexing_queue'
+        unique_together = ('indexer', 'object_id')
+
+    @classmethod
+    def queue(cls, indexer, ids):
+        """Add `ids` to the queue of `indexer`, ignoring queued ones."""
+        ids = set(ids)
+        ids -= set(cls.objects.filter(indexer=indexer, object_id__in=ids)
+                      .values_list('object_id', flat=True))
+        if not ids:
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.bulk_create([cls(indexer=indexer, object_id=pk)
+                                         for pk in ids])
+        except IntegrityError:
+            # Someone else queued some of these in the meantime.
+            for pk in ids:
+                cls.objects.get_or_create(indexer=indexer, object_id=pk)
+
+    @classmethod
+    def pop(cls):
+        """
+        Empty the queue, returning a dict mapping each indexer to the list of
+        its queued ids.
+        """
+        pending = {}
+        pks = []
+        for pk, indexer, object_id in cls.objects.order_by('pk').values_list(
+                'pk', 'indexer', 'object_id'):
+            pending.setdefault(indexer, []).append(object_id)
+            pks.append(pk)
+        if pks:
+            # Only delete what we got, more ids might have been queued since.
+            cls.objects.filter(pk__in=pks).delete()
+        return pending
+
+
+class IndexingHighWaterMark(models.Model):
+    """
+    The most recent `modified` date of the objects indexed by an indexer,
+    used by incremental indexing to only index what changed since.
+
+    `indexer` is the mapping type name of the indexer.
+    """
+    indexer = models.CharField(max_length=255, unique=True)
+    modified = models.DateTimeField()
+
+    class Meta:
+        db_table = 'zadmin_indexing_high_water_mark'
+
+    @classmethod
+    def get_mark(cls, indexer):
+        """Return the high-water mark of `indexer`, or None if unset."""
+        try:
+            return cls.objects.get(indexer=indexer).modified
+        except cls.DoesNotExist:
+            return None
+
+    @classmethod
+    def set_mark(cls, indexer, modified):
+        cls.objects.update_or_create(indexer=indexer,
+                                     defaults={'modified': modified})
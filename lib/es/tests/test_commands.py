@@ -0,0 +1,112 @@
+from django.conf import settings
+from django.core.management import call_command
+
+import mock
+from nose.tools import eq_, ok_
+
+import mkt.site.tests
+from lib.es.management.commands import reindex
+from lib.es.models import (IndexingHighWaterMark, Reindexing,
+                           ReindexingChunk)
+from mkt.search.indexers import IndexingError
+from mkt.site.tests import app_factory
+from mkt.site.utils import days_ago
+from mkt.tags.models import Tag
+from mkt.webapps.indexers import WebappIndexer
+
+
+class TestReindexResume(mkt.site.tests.TestCase):
+
+    def setUp(self):
+        self.apps = sorted([app_factory() for i in range(3)],
+                           key=lambda app: app.pk)
+        self.alias = settings.ES_INDEXES['webapp']
+        Reindexing.objects.create(alias=self.alias, old_index='old',
+                                  new_index='new')
+        # The interrupted run chunked the first two apps and only indexed
+        # the first one.
+        self.done = self.create_chunk(self.apps[0])
+        self.done.mark_done()
+        self.pending = self.create_chunk(self.apps[1])
+
+    def create_chunk(self, app):
+        return ReindexingChunk.objects.create(
+            alias=self.alias, new_index='new', first_id=app.pk,
+            last_id=app.pk, count=1)
+
+    @mock.patch.object(WebappIndexer, 'chunk_size', 1)
+    @mock.patch.object(reindex.Command, 'get_post_settings', lambda *a: {})
+    @mock.patch.object(reindex.Command, 'ship')
+    def test_resume(self, ship):
+        call_command('reindex', index='apps', resume=True)
+
+        eq_(ship.call_count, 1)
+        index_tasks = ship.call_args[0][0]
+        new_chunk = ReindexingChunk.objects.get(first_id=self.apps[2].pk)
+        eq_([task.args for task in index_tasks],
+            [('new', 'webapp', self.pending.pk),
+             ('new', 'webapp', new_chunk.pk)])
+        eq_(ReindexingChunk.objects.count(), 3)
+
+
+class TestRunIndexing(mkt.site.tests.TestCase):
+
+    def setUp(self):
+        self.app = app_factory()
+        self.chunk = ReindexingChunk.objects.create(
+            alias=settings.ES_INDEXES['webapp'], new_index='new',
+            first_id=self.app.pk, last_id=self.app.pk, count=1)
+
+    @mock.patch.object(WebappIndexer, 'run_indexing')
+    def test_done(self, run_indexing):
+        run_indexing.return_value = (1, [])
+        reindex.run_indexing('new', 'webapp', self.chunk.pk)
+        eq_(run_indexing.call_args[0][0], [self.app.pk])
+        ok_(ReindexingChunk.objects.get(pk=self.chunk.pk).completed)
+
+    @mock.patch.object(WebappIndexer, 'run_indexing')
+    def test_errors(self, run_indexing):
+        run_indexing.return_value = (0, [{'index': {'_id': self.app.pk}}])
+        with self.assertRaises(reindex.ReindexingError):
+            reindex.run_indexing('new', 'webapp', self.chunk.pk)
+        eq_(ReindexingChunk.objects.get(pk=self.chunk.pk).completed, None)
+
+
+@mock.patch.object(WebappIndexer, 'unindexer')
+@mock.patch('mkt.search.indexers.index')
+class TestReindexCatchUp(mkt.site.tests.TestCase):
+
+    def setUp(self):
+        IndexingHighWaterMark.set_mark('webapp', days_ago(1))
+        self.mark = self.get_mark()
+        self.app = app_factory()
+        self.homescreen = app_factory()
+        # Not indexed by WebappIndexer anymore.
+        Tag(tag_text='homescreen').save_tag(self.homescreen)
+
+    def catch_up(self):
+        call_command('reindex', index='apps', incremental=True,
+                     verify_sample=0)
+
+    def get_mark(self):
+        return IndexingHighWaterMark.get_mark('webapp')
+
+    def test_catch_up(self, index_mock, unindexer_mock):
+        unindexer_mock.return_value = (1, [])
+        self.catch_up()
+        index_mock.assert_called_once_with([self.app.pk], WebappIndexer)
+        unindexer_mock.assert_called_once_with([self.homescreen.pk])
+        eq_(self.get_mark(), max(self.app.reload().modified,
+                                 self.homescreen.reload().modified))
+
+    def test_index_errors(self, index_mock, unindexer_mock):
+        index_mock.side_effect = IndexingError('Failed', [self.app.pk])
+        unindexer_mock.return_value = (1, [])
+        self.catch_up()
+        eq_(self.get_mark(), self.mark)
+
+    def test_unindex_errors(self, index_mock, unindexer_mock):
+        unindexer_mock.return_value = (
+            0, [{'delete': {'_id': str(self.homescreen.pk), 'status': 500}}])
+        self.catch_up()
+        eq_(self.get_mark(), self.mark)
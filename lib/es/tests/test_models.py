@@ -1,7 +1,10 @@
+from datetime import datetime
+
 from nose.tools import eq_
 
 import mkt.site.tests
-from lib.es.models import Reindexing
+from lib.es.models import (IndexingHighWaterMark, IndexingQueue, Reindexing,
+                           ReindexingChunk)
 
 
 class TestReindexing(mkt.site.tests.TestCase):
@@ -61,3 +64,70 @@ class TestReindexing(mkt.site.tests.TestCase):
 
         # Doesn't clash on other aliases.
         self.assertSetEqual(Reindexing.get_indices('other'), ['other'])
+
+
+class TestIndexingQueue(mkt.site.tests.TestCase):
+
+    def test_queue(self):
+        IndexingQueue.queue('foo.Indexer', [1, 2, 2])
+        IndexingQueue.queue('foo.Indexer', [2, 3])
+        IndexingQueue.queue('bar.Indexer', [1])
+        eq_(IndexingQueue.objects.count(), 4)
+
+    def test_pop(self):
+        IndexingQueue.queue('foo.Indexer', [1, 2])
+        IndexingQueue.queue('bar.Indexer', [1])
+        pending = IndexingQueue.pop()
+        eq_(sorted(pending['foo.Indexer']), [1, 2])
+        eq_(pending['bar.Indexer'], [1])
+        eq_(IndexingQueue.objects.count(), 0)
+        eq_(IndexingQueue.pop(), {})
+
+
+class TestReindexingChunk(mkt.site.tests.TestCase):
+
+    def create_chunk(self, **kw):
+        data = {'alias': 'foo', 'new_index': 'bar', 'first_id': 1,
+                'last_id': 10, 'count': 10}
+        data.update(kw)
+        return ReindexingChunk.objects.create(**data)
+
+    def test_mark_done(self):
+        chunk = self.create_chunk()
+        eq_(chunk.completed, None)
+        chunk.mark_done()
+        assert ReindexingChunk.objects.get(pk=chunk.pk).completed
+
+    def test_get_progress(self):
+        progress = ReindexingChunk.get_progress('foo', 'bar')
+        eq_(progress, {'done': 0, 'total': 0, 'rate': 0.0, 'eta': None})
+
+        self.create_chunk().mark_done()
+        self.create_chunk(first_id=11, last_id=15, count=5)
+        self.create_chunk(new_index='other', count=3)
+        progress = ReindexingChunk.get_progress('foo', 'bar')
+        eq_(progress['done'], 10)
+        eq_(progress['total'], 15)
+        assert progress['rate'] > 0
+        assert progress['eta'] is not None
+
+    def test_unflag_reindexing_deletes_chunks(self):
+        self.create_chunk()
+        self.create_chunk(alias='other')
+        Reindexing.unflag_reindexing(alias='foo')
+        eq_(list(ReindexingChunk.objects.values_list('alias', flat=True)),
+            ['other'])
+
+
+class TestIndexingHighWaterMark(mkt.site.tests.TestCase):
+
+    def test_get_mark_unset(self):
+        eq_(IndexingHighWaterMark.get_mark('webapp'), None)
+
+    def test_set_mark(self):
+        IndexingHighWaterMark.set_mark('webapp', datetime(2015, 1, 1))
+        IndexingHighWaterMark.set_mark('webapp', datetime(2015, 1, 2))
+        IndexingHighWaterMark.set_mark('homescreen', datetime(2015, 1, 3))
+        eq_(IndexingHighWaterMark.get_mark('webapp'), datetime(2015, 1, 2))
+        eq_(IndexingHighWaterMark.get_mark('homescreen'),
+            datetime(2015, 1, 3))
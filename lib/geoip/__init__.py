@@ -1,14 +1,132 @@
+import bisect
 import logging
+import mmap
+import os
+import socket
+import struct
+import time
 
 import requests
 from django_statsd.clients import statsd
 
+from lib.utils import LocalLRUCache
 from mkt import regions
 
 log = logging.getLogger('z.geoip')
 
 
+# Range tables start with this header: a magic string, then the number of IPv4
+# ranges and the number of IPv6 ranges. For each family follow the start
+# addresses of the ranges in order, their end addresses and their country
+# codes, as fixed width strings. Packed addresses compare like the addresses.
+RANGE_TABLE_HEADER = struct.Struct('>8sII')
+RANGE_TABLE_MAGIC = 'MKTGEOIP'
+RANGE_TABLE_FAMILIES = ((socket.AF_INET, 4), (socket.AF_INET6, 16))
+
+
+def _family(address):
+    return socket.AF_INET6 if ':' in address else socket.AF_INET
+
+
+def write_range_table(ranges, path):
+    """
+    Write the (start address, end address, country code) `ranges`, which must
+    not overlap, as a range table to `path`, replacing it atomically.
+    """
+    rows = dict((family, []) for family, _ in RANGE_TABLE_FAMILIES)
+    for start, end, country_code in ranges:
+        family = _family(start)
+        try:
+            row = (socket.inet_pton(family, start),
+                   socket.inet_pton(family, end), str(country_code).upper())
+        except socket.error:
+            raise ValueError('%s - %s' % (start, end))
+        if len(row[2]) != 2 or row[0] > row[1]:
+            raise ValueError('%s - %s: %s' % (start, end, country_code))
+        rows[family].append(row)
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(RANGE_TABLE_HEADER.pack(
+            RANGE_TABLE_MAGIC, len(rows[socket.AF_INET]),
+            len(rows[socket.AF_INET6])))
+        for family, _ in RANGE_TABLE_FAMILIES:
+            family_rows = sorted(rows[family])
+            for column in range(3):
+                f.write(''.join(row[column] for row in family_rows))
+    os.rename(tmp_path, path)
+
+
+class _Column(object):
+    """A read only sequence of fixed width strings stored in a buffer."""
+
+    def __init__(self, buf, offset, width, length):
+        self.buf = buf
+        self.offset = offset
+        self.width = width
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if not 0 <= index < self.length:
+            raise IndexError(index)
+        start = self.offset + index * self.width
+        return self.buf[start:start + self.width]
+
+
+class RangeTable(object):
+    """
+    The country codes of IP address ranges, read from a file written by
+    write_range_table(). The file is memory-mapped and the ranges are found
+    with a binary search, so nothing is loaded in memory.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.stat = os.fstat(f.fileno())
+            if self.stat.st_size < RANGE_TABLE_HEADER.size:
+                raise ValueError('Invalid GeoIP range table: %s' % path)
+            self.buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, ipv4_count, ipv6_count = RANGE_TABLE_HEADER.unpack(
+            self.buf[:RANGE_TABLE_HEADER.size])
+        if magic != RANGE_TABLE_MAGIC:
+            raise ValueError('Invalid GeoIP range table: %s' % path)
+
+        self.columns = {}
+        offset = RANGE_TABLE_HEADER.size
+        for (family, width), count in zip(RANGE_TABLE_FAMILIES,
+                                          (ipv4_count, ipv6_count)):
+            columns = []
+            for column_width in (width, width, 2):
+                columns.append(_Column(self.buf, offset, column_width, count))
+                offset += column_width * count
+            self.columns[family] = columns
+        if offset != self.stat.st_size:
+            raise ValueError('Invalid GeoIP range table: %s' % path)
+
+    def lookup(self, address):
+        """Return the lowercase country code of `address`, or None."""
+        family = _family(address)
+        try:
+            packed = socket.inet_pton(family, address)
+        except (socket.error, ValueError):
+            return None
+        starts, ends, country_codes = self.columns[family]
+        index = bisect.bisect_right(starts, packed) - 1
+        if index >= 0 and packed <= ends[index]:
+            return country_codes[index].lower()
+        return None
+
+
 def is_public(ip):
+    if ':' in ip:
+        ip = ip.lower()
+        # localhost, unique local and link local addresses.
+        return not (ip == '::1' or
+                    ip.startswith(('fc', 'fd', 'fe8', 'fe9', 'fea', 'feb')))
     parts = map(int, ip.split('.'))
     # localhost
     if ip == '127.0.0.1':
@@ -26,13 +144,59 @@ def is_public(ip):
 
 
 class GeoIP:
-    """Call to geodude server to resolve an IP to Geo Info block."""
+    """
+    Resolve an IP to a country code, with the range table at GEOIP_DATABASE
+    if there is one, falling back to the geodude server.
+    """
 
     def __init__(self, settings):
         self.timeout = float(getattr(settings, 'GEOIP_DEFAULT_TIMEOUT', .2))
         self.url = getattr(settings, 'GEOIP_URL', '')
         self.default_val = getattr(settings, 'GEOIP_DEFAULT_VAL',
                                    regions.RESTOFWORLD.slug).lower()
+        self.database = getattr(settings, 'GEOIP_DATABASE', '')
+        self.check_interval = getattr(settings,
+                                      'GEOIP_DATABASE_CHECK_INTERVAL', 60)
+        self.table = None
+        self.checked = 0
+        self.cache = LocalLRUCache(size=10000)
+
+    def get_table(self):
+        """
+        Return the range table, loading it again if the file changed since
+        it was last checked.
+        """
+        now = time.time()
+        if now - self.checked < self.check_interval:
+            return self.table
+        self.checked = now
+
+        try:
+            stat = os.stat(self.database)
+            if (self.table is None or
+                    (stat.st_ino, stat.st_mtime) !=
+                    (self.table.stat.st_ino, self.table.stat.st_mtime)):
+                self.table = RangeTable(self.database)
+                self.cache.clear()
+                statsd.incr('z.geoip.reload')
+                log.info('Loaded GeoIP range table {0}'.format(
+                    self.database))
+        except (EnvironmentError, ValueError) as e:
+            statsd.incr('z.geoip.reload_error')
+            log.error('Error loading GeoIP range table: {0}'.format(e))
+        return self.table
+
+    def lookup_local(self, address):
+        """Resolve an IP address with the range table, or return None."""
+        table = self.get_table()
+        if table is None:
+            return None
+        country_code = self.cache.get(address)
+        if country_code is None:
+            # Cache unknown addresses too, as an empty string.
+            country_code = table.lookup(address) or ''
+            self.cache.set(address, country_code, self.check_interval)
+        return country_code or None
 
     def lookup(self, address):
         """Resolve an IP address to a block of geo information.
@@ -42,6 +206,11 @@ class GeoIP:
 
         """
         public_ip = is_public(address)
+        if self.database and public_ip:
+            country_code = self.lookup_local(address)
+            if country_code:
+                statsd.incr('z.geoip.local')
+                return country_code
         if self.url and public_ip:
             with statsd.timer('z.geoip'):
                 res = None
@@ -1,3 +1,6 @@
+import os
+import shutil
+import tempfile
 from random import randint
 
 import mock
@@ -6,12 +9,22 @@ from nose.tools import eq_
 
 import mkt.site.tests
 
-from lib.geoip import GeoIP
+from lib.geoip import GeoIP, RangeTable, write_range_table
 
 
-def generate_settings(url='', default='restofworld', timeout=0.2):
+def generate_settings(url='', default='restofworld', timeout=0.2,
+                      database=''):
     return mock.Mock(GEOIP_URL=url, GEOIP_DEFAULT_VAL=default,
-                     GEOIP_DEFAULT_TIMEOUT=timeout)
+                     GEOIP_DEFAULT_TIMEOUT=timeout, GEOIP_DATABASE=database,
+                     GEOIP_DATABASE_CHECK_INTERVAL=0)
+
+
+RANGES = [
+    ('1.0.0.0', '1.0.0.255', 'au'),
+    ('1.1.1.0', '1.1.1.255', 'US'),
+    ('200.0.0.0', '200.255.255.255', 'br'),
+    ('2001:db8::', '2001:db8::ffff', 'de'),
+]
 
 
 class GeoIPTest(mkt.site.tests.TestCase):
@@ -86,3 +99,97 @@ class GeoIPTest(mkt.site.tests.TestCase):
             result = geoip.lookup(ip)
             assert not mock_post.called
             eq_(result, 'restofworld')
+
+
+class TestRangeTable(mkt.site.tests.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'geoip.table')
+        write_range_table(RANGES, self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_lookup(self):
+        table = RangeTable(self.path)
+        eq_(table.lookup('1.0.0.0'), 'au')
+        eq_(table.lookup('1.0.0.255'), 'au')
+        eq_(table.lookup('1.1.1.1'), 'us')
+        eq_(table.lookup('200.10.20.30'), 'br')
+        eq_(table.lookup('2001:db8::1'), 'de')
+
+    def test_lookup_unknown(self):
+        table = RangeTable(self.path)
+        eq_(table.lookup('0.255.255.255'), None)
+        eq_(table.lookup('1.0.1.0'), None)
+        eq_(table.lookup('255.255.255.255'), None)
+        eq_(table.lookup('2001:db8::1:0'), None)
+        eq_(table.lookup('not an ip'), None)
+
+    def test_invalid_file(self):
+        with open(self.path, 'wb') as f:
+            f.write('not a range table')
+        with self.assertRaises(ValueError):
+            RangeTable(self.path)
+
+    def test_invalid_range(self):
+        with self.assertRaises(ValueError):
+            write_range_table([('1.0.0.255', '1.0.0.0', 'au')], self.path)
+        with self.assertRaises(ValueError):
+            write_range_table([('1.0.0.0', '1.0.0.255', 'aus')], self.path)
+
+
+class TestGeoIPDatabase(mkt.site.tests.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'geoip.table')
+        write_range_table(RANGES, self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    @mock.patch('requests.post')
+    def test_lookup(self, mock_post):
+        geoip = GeoIP(generate_settings(url='localhost', database=self.path))
+        eq_(geoip.lookup('1.1.1.1'), 'us')
+        eq_(geoip.lookup('2001:db8::2'), 'de')
+        assert not mock_post.called
+
+    @mock.patch('requests.post')
+    def test_fallback(self, mock_post):
+        geoip = GeoIP(generate_settings(url='localhost', database=self.path))
+        mock_post.return_value = mock.Mock(status_code=200, json=lambda: {
+            'country_code': 'FR',
+        })
+        eq_(geoip.lookup('5.5.5.5'), 'fr')
+        mock_post.assert_called_with('localhost/country.json',
+                                     timeout=0.2, data={'ip': '5.5.5.5'})
+
+    @mock.patch('requests.post')
+    def test_missing_file(self, mock_post):
+        geoip = GeoIP(generate_settings(
+            database=os.path.join(self.dir, 'missing')))
+        eq_(geoip.lookup('1.1.1.1'), 'restofworld')
+        assert not mock_post.called
+
+    def test_private_ip(self):
+        geoip = GeoIP(generate_settings(database=self.path))
+        for ip in ('127.0.0.1', '10.0.0.1', '::1', 'fd00::1', 'fe80::1'):
+            eq_(geoip.lookup(ip), 'restofworld')
+
+    def test_reload(self):
+        geoip = GeoIP(generate_settings(database=self.path))
+        eq_(geoip.lookup('1.1.1.1'), 'us')
+        write_range_table([('1.1.1.0', '1.1.1.255', 'ca')], self.path)
+        eq_(geoip.lookup('1.1.1.1'), 'ca')
+        eq_(geoip.lookup('1.0.0.1'), 'restofworld')
+
+    def test_no_reload_within_interval(self):
+        settings = generate_settings(database=self.path)
+        settings.GEOIP_DATABASE_CHECK_INTERVAL = 60
+        geoip = GeoIP(settings)
+        eq_(geoip.lookup('1.1.1.1'), 'us')
+        write_range_table([('1.1.1.0', '1.1.1.255', 'ca')], self.path)
+        eq_(geoip.lookup('1.1.1.1'), 'us')
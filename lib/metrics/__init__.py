@@ -3,6 +3,8 @@ import threading
 from django.conf import settings
 
 import commonware.log
+from django_statsd.clients import statsd
+from requests.adapters import HTTPAdapter
 
 from mkt.monolith.models import record_stat
 
@@ -30,18 +32,57 @@ def record_action(action, request, data=None):
     record_stat(action, request, **data)
 
 
+class MonolithAdapter(HTTPAdapter):
+    """
+    The HTTP adapter of the Monolith client sessions: it applies
+    `MONOLITH_TIMEOUT` to the requests, which the client doesn't set, and
+    times them.
+    """
+
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = settings.MONOLITH_TIMEOUT
+        with statsd.timer('monolith.request'):
+            return super(MonolithAdapter, self).send(request, **kwargs)
+
+
+# The Monolith clients, one per thread since their session isn't thread-safe.
+_locals = threading.local()
+# Changed by reset_monolith_client() to drop the clients of every thread.
+_clients_generation = 0
+
+
 def get_monolith_client():
-    _locals = threading.local()
-    if not hasattr(_locals, 'monolith'):
+    """
+    Return the Monolith client of the current thread, creating it on the
+    first call. Its session keeps the connections to the server alive
+    across calls.
+    """
+    if getattr(_locals, 'generation', None) != _clients_generation:
         server = getattr(settings, 'MONOLITH_SERVER', None)
         index = getattr(settings, 'MONOLITH_INDEX', 'time_*')
         if server is None:
             raise ValueError('You need to configure MONOLITH_SERVER')
 
-        statsd = {'statsd.host': getattr(settings, 'STATSD_HOST', 'localhost'),
-                  'statsd.port': getattr(settings, 'STATSD_PORT', 8125)}
+        statsd_kw = {
+            'statsd.host': getattr(settings, 'STATSD_HOST', 'localhost'),
+            'statsd.port': getattr(settings, 'STATSD_PORT', 8125)}
 
         from monolith.client import Client as MonolithClient
-        _locals.monolith = MonolithClient(server, index, **statsd)
+        client = MonolithClient(server, index, **statsd_kw)
+        adapter = MonolithAdapter()
+        client.session.mount('http://', adapter)
+        client.session.mount('https://', adapter)
+        _locals.monolith = client
+        _locals.generation = _clients_generation
 
     return _locals.monolith
+
+
+def reset_monolith_client():
+    """
+    Drop the Monolith clients of every thread, they are created again on their
+    next call to `get_monolith_client()`.
+    """
+    global _clients_generation
+    _clients_generation += 1
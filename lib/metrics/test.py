@@ -1,8 +1,15 @@
 # -*- coding: utf8 -*-
+from multiprocessing.pool import ThreadPool
+
+from django.test.utils import override_settings
+
 import mock
+from nose.tools import eq_
+from requests.adapters import HTTPAdapter
 
 import mkt.site.tests
-from lib.metrics import record_action
+from lib.metrics import (get_monolith_client, MonolithAdapter, record_action,
+                         reset_monolith_client)
 
 
 class TestMetrics(mkt.site.tests.TestCase):
@@ -17,3 +24,43 @@ class TestMetrics(mkt.site.tests.TestCase):
         record_stat.assert_called_with(
             'install', request,
             **{'locale': 'en', 'src': 'foo', 'user-agent': 'py'})
+
+
+class TestMonolithClient(mkt.site.tests.TestCase):
+
+    def setUp(self):
+        reset_monolith_client()
+        self.addCleanup(reset_monolith_client)
+
+    @mock.patch('monolith.client.Client')
+    def test_reused(self, Client):
+        client = get_monolith_client()
+        eq_(get_monolith_client(), client)
+        eq_(Client.call_count, 1)
+        eq_(client.session.mount.call_count, 2)
+
+    @mock.patch('monolith.client.Client')
+    def test_reset(self, Client):
+        get_monolith_client()
+        reset_monolith_client()
+        get_monolith_client()
+        eq_(Client.call_count, 2)
+
+    @mock.patch('monolith.client.Client')
+    def test_reset_every_thread(self, Client):
+        pool = ThreadPool(1)
+        self.addCleanup(pool.close)
+        pool.apply(get_monolith_client)
+        pool.apply(get_monolith_client)
+        eq_(Client.call_count, 1)
+        reset_monolith_client()
+        pool.apply(get_monolith_client)
+        eq_(Client.call_count, 2)
+
+    @override_settings(MONOLITH_TIMEOUT=5)
+    @mock.patch.object(HTTPAdapter, 'send')
+    def test_adapter_timeout(self, send):
+        MonolithAdapter().send('request')
+        send.assert_called_with('request', timeout=5)
+        MonolithAdapter().send('request', timeout=1)
+        send.assert_called_with('request', timeout=1)
@@ -4,7 +4,8 @@ from django.test import TestCase
 
 from nose.tools import eq_
 
-from lib.utils import static_url, update_csp, validate_settings
+from lib.utils import (LocalLRUCache, static_url, update_csp,
+                       validate_settings)
 
 
 class TestValidate(TestCase):
@@ -81,3 +82,29 @@ class TestURL(TestCase):
         with self.settings(ADDON_ICON_URL='/v', DEBUG=True,
                            SERVE_TMP_PATH=True):
             eq_(static_url('ADDON_ICON_URL'), 'http://testserver/tmp/v')
+
+
+class TestLocalLRUCache(TestCase):
+
+    def setUp(self):
+        self.cache = LocalLRUCache(size=2)
+
+    def test_get_set(self):
+        eq_(self.cache.get('a'), None)
+        self.cache.set('a', 1, 10)
+        eq_(self.cache.get('a'), 1)
+        self.cache.delete('a')
+        eq_(self.cache.get('a'), None)
+
+    def test_timeout(self):
+        self.cache.set('a', 1, -1)
+        eq_(self.cache.get('a'), None)
+
+    def test_least_recently_used_evicted(self):
+        self.cache.set('a', 1, 10)
+        self.cache.set('b', 2, 10)
+        self.cache.get('a')
+        self.cache.set('c', 3, 10)
+        eq_(self.cache.get('a'), 1)
+        eq_(self.cache.get('b'), None)
+        eq_(self.cache.get('c'), 3)
@@ -1,6 +1,10 @@
-import jwt
+import threading
+import time
+from collections import OrderedDict
 from urlparse import urljoin
 
+import jwt
+
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
 
@@ -104,3 +108,39 @@ def update_csp():
                 new.add(value)
 
         setattr(settings, key, tuple(new))
+
+
+class LocalLRUCache(object):
+    """A thread safe, size bounded, in memory cache with a timeout."""
+
+    def __init__(self, size):
+        self.size = size
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            try:
+                expires, value = self.data.pop(key)
+            except KeyError:
+                return None
+            if expires < time.time():
+                return None
+            # Put it back at the end, as the most recently used.
+            self.data[key] = (expires, value)
+            return value
+
+    def set(self, key, value, timeout):
+        with self.lock:
+            self.data.pop(key, None)
+            self.data[key] = (time.time() + timeout, value)
+            while len(self.data) > self.size:
+                self.data.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
@@ -22,7 +22,9 @@ class ACLMiddleware(object):
         # figure out our list of groups...
         if request.user.is_authenticated():
             mkt.set_user(request.user)
-            request.groups = request.user.groups.all()
+            # The API authentication middlewares may have loaded them.
+            if not hasattr(request, 'groups'):
+                request.groups = request.user.groups.all()
 
     def process_response(self, request, response):
         mkt.set_user(None)
@@ -22,7 +22,8 @@ from multidb.middleware import PinningRouterMiddleware
 from oauthlib.common import Request
 from oauthlib.oauth1.rfc5849 import signature
 
-from mkt.api.models import Access, ACCESS_TOKEN, Token
+from mkt.api.models import (get_principal, PRINCIPAL_ACCESS,
+                            PRINCIPAL_SHARED_SECRET, PRINCIPAL_TOKEN)
 from mkt.api.oauth import server, validator
 from mkt.carriers import get_carrier
 from mkt.users.models import UserProfile
@@ -84,12 +85,8 @@ class RestOAuthMiddleware(object):
                 log.warning(u'Cannot find APIAccess token with that key: %s'
                             % oauth_req.attempted_key)
                 return
-            uid = Token.objects.filter(
-                token_type=ACCESS_TOKEN,
-                key=oauth_req.resource_owner_key).values_list(
-                    'user_id', flat=True)[0]
-            request.user = UserProfile.objects.select_related(
-                'user').get(pk=uid)
+            user, groups = get_principal(PRINCIPAL_TOKEN,
+                                         oauth_req.resource_owner_key)
         else:
             # This is 2-legged OAuth.
             log.info('Trying 2 legged OAuth')
@@ -104,22 +101,23 @@ class RestOAuthMiddleware(object):
             except ValueError:
                 log.warning('ValueError on verifying_request', exc_info=True)
                 return
-            uid = Access.objects.filter(
-                key=client_key).values_list(
-                    'user_id', flat=True)[0]
-            request.user = UserProfile.objects.select_related(
-                'user').get(pk=uid)
+            user, groups = get_principal(PRINCIPAL_ACCESS, client_key)
 
         # But you cannot have one of these roles.
         denied_groups = set(['Admins'])
-        roles = set(request.user.groups.values_list('name', flat=True))
+        roles = set(group.name for group in groups)
         if roles and roles.intersection(denied_groups):
             log.info(u'Attempt to use API with denied role, user: %s'
-                     % request.user.pk)
+                     % user.pk)
             # Set request user back to Anonymous.
             request.user = AnonymousUser()
+            request.groups = []
             return
 
+        request.user = user
+        # Saves ACLMiddleware a query.
+        request.groups = groups
+
         if request.user.is_authenticated():
             request.authed_from.append('RestOAuth')
 
@@ -188,7 +186,8 @@ class RestSharedSecretMiddleware(object):
                                consumer_id, hashlib.sha512).hexdigest() == hm
             if matches:
                 try:
-                    request.user = UserProfile.objects.get(email=email)
+                    request.user, request.groups = get_principal(
+                        PRINCIPAL_SHARED_SECRET, email)
                     request.authed_from.append('RestSharedSecret')
                 except UserProfile.DoesNotExist:
                     log.info('Auth token matches absent user (%s)' % email)
@@ -1,10 +1,17 @@
+import hashlib
 import time
 
+from django import dispatch
+from django.conf import settings
+from django.core.cache import cache
 from django.db import models
+from django.db.models import signals
 from django.utils.crypto import get_random_string
 
 from aesfield.field import AESField
+from django_statsd.clients import statsd
 
+from mkt.access.models import Group, GroupUser
 from mkt.site.models import ModelBase
 from mkt.users.models import UserProfile
 
@@ -13,6 +20,11 @@ REQUEST_TOKEN = 0
 ACCESS_TOKEN = 1
 TOKEN_TYPES = ((REQUEST_TOKEN, u'Request'), (ACCESS_TOKEN, u'Access'))
 
+# The credentials a principal can be looked up by, see get_principal().
+PRINCIPAL_ACCESS = 'access'
+PRINCIPAL_TOKEN = 'token'
+PRINCIPAL_SHARED_SECRET = 'shared-secret'
+
 
 class Access(ModelBase):
     key = models.CharField(max_length=255, unique=True)
@@ -72,3 +84,96 @@ class Nonce(ModelBase):
         db_table = 'oauth_nonce'
         unique_together = ('nonce', 'timestamp', 'client_key',
                            'request_token', 'access_token')
+
+
+def principal_cache_key(kind, key):
+    """Cache key of the id of the user owning the credentials `key`."""
+    return 'api:principal:%s:%s' % (
+        kind, hashlib.md5(unicode(key).encode('utf-8')).hexdigest())
+
+
+def principal_user_cache_key(user_id):
+    """Cache key of the profile and groups of the user `user_id`."""
+    return 'api:principal:user:%s' % user_id
+
+
+def get_principal(kind, key):
+    """
+    Return a `(user, groups)` tuple for the credentials `key` of `kind`: the
+    consumer key of an Access, the key of an access Token or the email
+    address of a shared-secret token. Credentials must have been verified
+    already.
+
+    Both the user id of the credentials and the user and their groups are
+    cached for API_PRINCIPAL_CACHE_TIMEOUT seconds. The former is
+    invalidated when the credentials are deleted, the latter when the user
+    or their groups change.
+    """
+    timeout = settings.API_PRINCIPAL_CACHE_TIMEOUT
+    cache_key = principal_cache_key(kind, key)
+    user_id = cache.get(cache_key)
+    principal = None
+    if user_id is not None:
+        principal = cache.get(principal_user_cache_key(user_id))
+    if principal is not None:
+        statsd.incr('api.principal.cache.hit')
+        return principal
+
+    statsd.incr('api.principal.cache.miss')
+    if kind == PRINCIPAL_ACCESS:
+        user = UserProfile.objects.get(
+            pk=Access.objects.filter(key=key).values_list(
+                'user_id', flat=True)[0])
+    elif kind == PRINCIPAL_TOKEN:
+        user = UserProfile.objects.get(
+            pk=Token.objects.filter(token_type=ACCESS_TOKEN, key=key)
+            .values_list('user_id', flat=True)[0])
+    else:
+        user = UserProfile.objects.get(email=key)
+    principal = (user, list(user.groups.all()))
+    cache.set_many({cache_key: user.pk,
+                    principal_user_cache_key(user.pk): principal}, timeout)
+    return principal
+
+
+def invalidate_principals(user_ids):
+    """Remove the cached profiles and groups of the users `user_ids`."""
+    cache.delete_many([principal_user_cache_key(pk) for pk in user_ids])
+
+
+@dispatch.receiver(signals.post_delete, sender=Access,
+                   dispatch_uid='access_principal.post_delete')
+def access_invalidate_principal(sender, instance, **kw):
+    cache.delete(principal_cache_key(PRINCIPAL_ACCESS, instance.key))
+
+
+@dispatch.receiver(signals.post_delete, sender=Token,
+                   dispatch_uid='token_principal.post_delete')
+def token_invalidate_principal(sender, instance, **kw):
+    cache.delete(principal_cache_key(PRINCIPAL_TOKEN, instance.key))
+
+
+@dispatch.receiver(signals.post_save, sender=UserProfile,
+                   dispatch_uid='userprofile_principals.post_save')
+@dispatch.receiver(signals.post_delete, sender=UserProfile,
+                   dispatch_uid='userprofile_principals.post_delete')
+def userprofile_invalidate_principals(sender, instance, **kw):
+    if not kw.get('raw'):
+        invalidate_principals([instance.pk])
+
+
+@dispatch.receiver(signals.post_save, sender=GroupUser,
+                   dispatch_uid='groupuser_principals.post_save')
+@dispatch.receiver(signals.post_delete, sender=GroupUser,
+                   dispatch_uid='groupuser_principals.post_delete')
+def groupuser_invalidate_principals(sender, instance, **kw):
+    if not kw.get('raw'):
+        invalidate_principals([instance.user_id])
+
+
+@dispatch.receiver(signals.post_save, sender=Group,
+                   dispatch_uid='group_principals.post_save')
+def group_invalidate_principals(sender, instance, **kw):
+    # The name and the rules of the group are cached with its members.
+    if not kw.get('raw'):
+        invalidate_principals(instance.users.values_list('pk', flat=True))
@@ -2,6 +2,7 @@ from datetime import datetime
 
 from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
 from django.test.client import RequestFactory
 
 from mock import Mock, patch
@@ -13,7 +14,7 @@ from mkt.access.models import Group, GroupUser
 from mkt.api import authentication
 from mkt.api.middleware import (APIBaseMiddleware, RestOAuthMiddleware,
                                 RestSharedSecretMiddleware)
-from mkt.api.models import Access
+from mkt.api.models import Access, principal_cache_key, PRINCIPAL_ACCESS
 from mkt.api.tests.test_oauth import OAuthClient
 from mkt.site.fixtures import fixture
 from mkt.site.helpers import absolutify
@@ -73,6 +74,31 @@ class TestRestOAuthAuthentication(TestCase):
         self.add_group_user(self.profile, 'App Reviewers')
         ok_(self.auth.authenticate(Request(self.call())))
 
+    @patch('mkt.api.models.statsd')
+    def test_principal_cached(self, statsd):
+        self.add_group_user(self.profile, 'App Reviewers')
+        req = self.call()
+        ok_(self.auth.authenticate(Request(req)))
+        statsd.incr.assert_called_with('api.principal.cache.miss')
+
+        req = self.call()
+        ok_(self.auth.authenticate(Request(req)))
+        statsd.incr.assert_called_with('api.principal.cache.hit')
+        eq_(req.user, self.profile)
+        eq_([group.name for group in req.groups], ['App Reviewers'])
+
+    def test_principal_group_change(self):
+        ok_(self.auth.authenticate(Request(self.call())))
+        self.add_group_user(self.profile, 'Admins')
+        ok_(not self.auth.authenticate(Request(self.call())))
+
+    def test_principal_access_deleted(self):
+        ok_(self.auth.authenticate(Request(self.call())))
+        key = principal_cache_key(PRINCIPAL_ACCESS, self.access.key)
+        eq_(cache.get(key), self.profile.pk)
+        self.access.delete()
+        eq_(cache.get(key), None)
+
 
 class TestRestAnonymousAuthentication(TestCase):
 
@@ -112,6 +138,18 @@ class TestSharedSecretAuthentication(TestCase):
         ok_(req.user.is_authenticated())
         eq_(self.profile.pk, req.user.pk)
 
+    @patch('mkt.api.models.statsd')
+    def test_session_auth_cached(self, statsd):
+        self.test_session_auth_query()
+        statsd.incr.assert_called_with('api.principal.cache.miss')
+        self.test_session_auth_query()
+        statsd.incr.assert_called_with('api.principal.cache.hit')
+
+        # Changing the user invalidates the cache.
+        self.profile.update(display_name='Cfinke')
+        self.test_session_auth_query()
+        statsd.incr.assert_called_with('api.principal.cache.miss')
+
     def test_failed_session_auth_query(self):
         req = RequestFactory().post('/api/?_user=bogus')
         req.user = AnonymousUser()
@@ -1,9 +1,9 @@
 from rest_framework import serializers
 
 from mkt.fireplace.serializers import FeedFireplaceESAppSerializer
-from mkt.webapps.serializers import (AppSerializer, ESAppFeedSerializer,
-                                     ESAppFeedCollectionSerializer,
-                                     ESAppSerializer)
+from mkt.webapps.serializers import (AppSerializer, ESAppDictSerializer,
+                                     ESAppFeedCollectionDictSerializer,
+                                     ESAppFeedDictSerializer)
 
 
 class FeedCollectionMembershipField(serializers.PrimaryKeyRelatedField):
@@ -19,7 +19,7 @@ class FeedCollectionMembershipField(serializers.PrimaryKeyRelatedField):
 
 class AppESField(serializers.Field):
     """
-    Deserialize an app id using ESAppSerializer.
+    Deserialize an app id using ESAppDictSerializer.
 
     For object-to-app relations in ES, we store app IDs as a property of the
     object. Since we want to limit ES queries, we batch-query for objects,
@@ -47,7 +47,8 @@ class AppESField(serializers.Field):
         if app_serializer is None and '/fireplace/' in request.path:
             app_serializer = 'fireplace'
 
-        return self.app_serializer_classes.get(app_serializer, ESAppSerializer)
+        return self.app_serializer_classes.get(app_serializer,
+                                               ESAppDictSerializer)
 
     def __init__(self, *args, **kwargs):
         self.many = kwargs.pop('many', False)
@@ -115,21 +116,21 @@ class AppESField(serializers.Field):
 
 class AppESHomeField(AppESField):
     """
-    Like AppESField, except using ESAppFeedSerializer instead of
-    ESAppSerializer. For a slimmer homepage since apps/brands only need
+    Like AppESField, except using ESAppFeedDictSerializer instead of
+    ESAppDictSerializer. For a slimmer homepage since apps/brands only need
     enough to render the market tile.
     """
     @property
     def serializer_class(self):
-        return ESAppFeedSerializer
+        return ESAppFeedDictSerializer
 
 
 class AppESHomePromoCollectionField(AppESField):
     """
-    Like AppESField, except using ESAppFeedCollectionSerializer instead of
-    ESAppSerializer. For a slimmer homepage since collection/shelves only
-    need icons.
+    Like AppESField, except using ESAppFeedCollectionDictSerializer instead
+    of ESAppDictSerializer. For a slimmer homepage since collection/shelves
+    only need icons.
     """
     @property
     def serializer_class(self):
-        return ESAppFeedCollectionSerializer
+        return ESAppFeedCollectionDictSerializer
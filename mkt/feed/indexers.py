@@ -2,14 +2,21 @@
 Indexers for FeedApp, FeedBrand, FeedCollection, FeedShelf, FeedItem for
 feed homepage and curation tool search.
 """
+from django.core.cache import cache
+
 import mkt.carriers
 import mkt.feed.constants as feed
 import mkt.regions
 from mkt.search.indexers import BaseIndexer
-from mkt.translations.models import attach_trans_dict
+from mkt.translations.models import attach_trans_dicts
 from mkt.webapps.models import Webapp
 
 
+# Cache key of the ids of the regions having feed items of their own, see
+# FeedItemIndexer.get_regions_with_feed().
+REGIONS_WITH_FEED_KEY = 'feed:regions-with-feed'
+
+
 def get_slug_multifield():
     # TODO: convert to new syntax on ES 1.0+.
     return {
@@ -65,8 +72,7 @@ class FeedAppIndexer(BaseIndexer):
             obj = cls.get_model().objects.get(pk=pk)
 
         # Attach translations for searching and indexing.
-        attach_trans_dict(cls.get_model(), [obj])
-        attach_trans_dict(Webapp, [obj.app])
+        attach_trans_dicts([(cls.get_model(), [obj]), (Webapp, [obj.app])])
 
         doc = {
             'id': obj.id,
@@ -176,7 +182,9 @@ class FeedCollectionIndexer(BaseIndexer):
         if obj is None:
             obj = cls.get_model().objects.get(pk=pk)
 
-        attach_trans_dict(cls.get_model(), [obj])
+        memberships = list(obj.feedcollectionmembership_set.all())
+        attach_trans_dicts([(cls.get_model(), [obj]),
+                            (FeedCollectionMembership, memberships)])
 
         doc = {
             'id': obj.id,
@@ -196,8 +204,6 @@ class FeedCollectionIndexer(BaseIndexer):
         }
 
         # Grouped apps. Key off of translation, pointed to app IDs.
-        memberships = obj.feedcollectionmembership_set.all()
-        attach_trans_dict(FeedCollectionMembership, memberships)
         for member in memberships:
             if member.group:
                 group_translation = cls.extract_field_translations(member,
@@ -255,7 +261,9 @@ class FeedShelfIndexer(BaseIndexer):
         if obj is None:
             obj = cls.get_model().get(pk=pk)
 
-        attach_trans_dict(cls.get_model(), [obj])
+        memberships = list(obj.feedshelfmembership_set.all())
+        attach_trans_dicts([(cls.get_model(), [obj]),
+                            (FeedShelfMembership, memberships)])
 
         doc = {
             'id': obj.id,
@@ -274,8 +282,6 @@ class FeedShelfIndexer(BaseIndexer):
         }
 
         # Grouped apps. Key off of translation, pointed to app IDs.
-        memberships = obj.feedshelfmembership_set.all()
-        attach_trans_dict(FeedShelfMembership, memberships)
         for member in memberships:
             if member.group:
                 group_translation = cls.extract_field_translations(member,
@@ -346,3 +352,31 @@ class FeedItemIndexer(BaseIndexer):
             'shelf': (obj.shelf_id if obj.item_type == feed.FEED_TYPE_SHELF
                       else None),
         }
+
+    @classmethod
+    def bump_generation(cls):
+        """
+        Change the generation of the index, and refresh the ids of the regions
+        having feed items of their own since they might have changed too.
+        """
+        super(FeedItemIndexer, cls).bump_generation()
+        cls.update_regions_with_feed()
+
+    @classmethod
+    def update_regions_with_feed(cls):
+        """
+        Store the ids of the regions having feed items other than shelves,
+        the feed of the other regions being the RESTOFWORLD one.
+        """
+        region_ids = (cls.get_model().objects
+                      .exclude(item_type=feed.FEED_TYPE_SHELF)
+                      .values_list('region', flat=True).distinct())
+        cache.set(REGIONS_WITH_FEED_KEY, frozenset(region_ids), None)
+
+    @classmethod
+    def get_regions_with_feed(cls):
+        """
+        Return the ids of the regions having feed items other than shelves,
+        or None if they are not known.
+        """
+        return cache.get(REGIONS_WITH_FEED_KEY)
@@ -1,3 +1,5 @@
+from django.core.cache import cache
+
 from nose.tools import eq_
 
 import mkt.site.tests
@@ -5,6 +7,7 @@ import mkt.site.tests
 import mkt.carriers
 import mkt.feed.constants as feed
 import mkt.regions
+from mkt.feed.indexers import FeedItemIndexer, REGIONS_WITH_FEED_KEY
 from mkt.feed.models import (FeedApp, FeedBrand, FeedCollection, FeedItem,
                              FeedShelf)
 from mkt.feed.tests.test_models import FeedTestMixin
@@ -173,3 +176,18 @@ class TestFeedItemIndexer(FeedTestMixin, BaseFeedIndexerTest,
         eq_(doc['brand'], None)
         eq_(doc['collection'], None)
         eq_(doc['shelf'], None)
+
+    def test_regions_with_feed(self):
+        self.feed_item_factory(item_type=feed.FEED_TYPE_SHELF,
+                               region=mkt.regions.BRA.id)
+        self.feed_item_factory(item_type=feed.FEED_TYPE_BRAND,
+                               region=mkt.regions.USA.id)
+        FeedItemIndexer.update_regions_with_feed()
+        eq_(FeedItemIndexer.get_regions_with_feed(),
+            set([self.obj.region, mkt.regions.USA.id]))
+
+    def test_regions_with_feed_bump_generation(self):
+        cache.delete(REGIONS_WITH_FEED_KEY)
+        eq_(FeedItemIndexer.get_regions_with_feed(), None)
+        FeedItemIndexer.bump_generation()
+        eq_(FeedItemIndexer.get_regions_with_feed(), set([self.obj.region]))
@@ -239,7 +239,7 @@ class TestFeedCollectionESSerializer(FeedTestMixin, mkt.site.tests.TestCase):
         assert data['background_image'].endswith('image.png?LOL')
 
     def test_home_serializer_listing_coll(self):
-        """Test the listing collection is using ESAppFeedSerializer."""
+        """Test the listing collection is using ESAppFeedDictSerializer."""
         self.collection.update(type=feed.COLLECTION_LISTING)
         self.data_es = self.collection.get_indexer().extract_document(
             None, obj=self.collection)
@@ -254,7 +254,7 @@ class TestFeedCollectionESSerializer(FeedTestMixin, mkt.site.tests.TestCase):
     def test_home_serializer_promo_coll(self):
         """
         Test the listing collection is using
-        ESAppFeedCollectionSerializer if no background image.
+        ESAppFeedCollectionDictSerializer if no background image.
         """
         self.collection.update(type=feed.COLLECTION_PROMO)
         self.data_es = self.collection.get_indexer().extract_document(
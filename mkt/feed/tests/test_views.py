@@ -2,6 +2,7 @@
 import json
 import os
 
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
 from django.utils.text import slugify
 
@@ -16,6 +17,7 @@ import mkt.feed.constants as feed
 import mkt.regions
 from mkt.api.tests.test_oauth import RestOAuth
 from mkt.constants import applications
+from mkt.feed.indexers import REGIONS_WITH_FEED_KEY
 from mkt.feed.models import (FeedApp, FeedBrand, FeedCollection, FeedItem,
                              FeedShelf)
 from mkt.feed.tests.test_models import FeedAppMixin, FeedTestMixin
@@ -1534,6 +1536,19 @@ class TestFeedView(BaseTestFeedESView, BaseTestFeedItemViewSet):
         res, data = self._get(region='us')
         eq_(len(data['objects']), len(feed_items))
 
+    def test_restofworld_fallback_single_pass(self):
+        feed_items = self.feed_factory()
+        with mock.patch.object(FeedView, '_handle_empty_feed') as handle_mock:
+            res, data = self._get(region='us')
+        ok_(not handle_mock.called)
+        eq_(len(data['objects']), len(feed_items))
+
+    def test_restofworld_fallback_regions_unknown(self):
+        feed_items = self.feed_factory()
+        cache.delete(REGIONS_WITH_FEED_KEY)
+        res, data = self._get(region='us')
+        eq_(len(data['objects']), len(feed_items))
+
     def test_restofworld_fallback_shelf_only(self):
         shelf = self.feed_shelf_factory()
         shelf.feeditem_set.create(region=mkt.regions.USA.id,
@@ -1655,24 +1670,70 @@ class TestFeedView(BaseTestFeedESView, BaseTestFeedItemViewSet):
         self.feed_factory()
         es = FeedItem.get_indexer().get_es()
         orig_search = es.search
+        orig_msearch = es.msearch
         es.counter = 0
 
         def monkey_search(*args, **kwargs):
             es.counter += 1
             return orig_search(*args, **kwargs)
 
+        def monkey_msearch(*args, **kwargs):
+            es.counter += 1
+            return orig_msearch(*args, **kwargs)
+
         es.search = monkey_search
+        es.msearch = monkey_msearch
 
         res, data = self._get()
         eq_(res.status_code, 200)
         eq_(res.json['meta']['total_count'], 4)
         eq_(len(res.json['objects']), 4)
 
-        # FeedView._get does four ES hits: feed items, feed elements, apps, and
-        # featured websites.
-        eq_(es.counter, 4)
+        # FeedView._get does three ES hits: feed items and featured websites
+        # together, feed elements and apps.
+        eq_(es.counter, 3)
+
+        # Then the feed is cached.
+        res, data = self._get()
+        eq_(len(res.json['objects']), 4)
+        eq_(es.counter, 3)
 
         es.search = orig_search
+        es.msearch = orig_msearch
+
+    def test_cache(self):
+        feed_items = self.feed_factory()
+        res, data = self._get()
+        eq_(len(data['objects']), len(feed_items))
+
+        with mock.patch('mkt.feed.views.FeedView._get') as _get:
+            res, cached = self._get()
+        ok_(not _get.called)
+        eq_(res.status_code, 200)
+        eq_(cached, data)
+
+    def test_cache_per_query(self):
+        feed_items = self.feed_factory()
+        self._get()
+        res, data = self._get(carrier=None)
+        eq_(len(data['objects']), len(feed_items) - 1)  # No shelf.
+
+    def test_cache_404(self):
+        res, data = self._get()
+        eq_(res.status_code, 404)
+        with mock.patch('mkt.feed.views.FeedView._get') as _get:
+            res, data = self._get()
+        ok_(not _get.called)
+        eq_(res.status_code, 404)
+
+    def test_cache_invalidated_on_index(self):
+        self.feed_item_factory()
+        res, data = self._get()
+        eq_(len(data['objects']), 1)
+
+        self.feed_item_factory()
+        res, data = self._get()
+        eq_(len(data['objects']), 2)
 
 
 class TestFeedViewDeviceFiltering(BaseTestFeedESView, BaseTestFeedItemViewSet):
@@ -7,15 +7,17 @@ import requests
 from PIL import Image
 from rest_framework import exceptions
 
-from django.utils.translation import ugettext as _
+from django.utils.translation import get_language, ugettext as _
 
 
 from django.conf import settings
+from django.core.cache import cache
 from django.core.files.base import File
 from django.db.models import Q
 from django.db.transaction import non_atomic_requests
 from django.utils.datastructures import MultiValueDictKeyError
 from django.http import Http404
+from django.utils.http import urlencode
 from django.views.decorators.cache import cache_control
 
 import commonware
@@ -42,10 +44,14 @@ from mkt.api.permissions import AllowReadOnly, AnyOf, GroupPermission
 from mkt.constants.carriers import CARRIER_MAP
 from mkt.constants.regions import REGIONS_DICT
 from mkt.developers.tasks import pngcrush_image
-from mkt.feed.indexers import FeedItemIndexer
+from mkt.feed.indexers import (FeedAppIndexer, FeedBrandIndexer,
+                               FeedCollectionIndexer, FeedItemIndexer,
+                               FeedShelfIndexer)
 from mkt.operators.models import OperatorPermission
 from mkt.search.filters import (DeviceTypeFilter, ProfileFilter,
                                 PublicContentFilter, RegionFilter)
+from mkt.search.indexers import get_generations
+from mkt.search.utils import BatchedSearch
 from mkt.site.storage_utils import public_storage
 from mkt.site.utils import get_file_response
 from mkt.webapps.indexers import WebappIndexer
@@ -884,7 +890,7 @@ class FeedView(MarketplaceView, BaseFeedESView, generics.GenericAPIView):
         """
         return int(datetime.now().strftime('%Y%m%d'))
 
-    def get_featured_websites(self):
+    def get_es_featured_websites_query(self, sq):
         """
         Get up to 11 featured MOWs for the request's region. If less than 11
         are available, make up the difference with globally-featured MOWs.
@@ -901,9 +907,7 @@ class FeedView(MarketplaceView, BaseFeedESView, generics.GenericAPIView):
                 es_function.BoostFactor(value=100.0, filter=region_filter)
             ],
         )
-        es = Search(using=WebsiteIndexer.get_es())[:11]
-        results = es.query(mow_query).execute().hits
-        return ESWebsiteSerializer(results, many=True).data
+        return sq.query(mow_query)[:11]
 
     def _check_empty_feed(self, items, rest_of_world):
         """
@@ -919,7 +923,7 @@ class FeedView(MarketplaceView, BaseFeedESView, generics.GenericAPIView):
         return 1
 
     def _handle_empty_feed(self, empty_feed_code, region, request, args,
-                           kwargs):
+                           kwargs, websites=None):
         """
         If feed is empty, this method handles appropriately what to return.
         If empty_feed_code == 0: try to fallback to RoW.
@@ -927,11 +931,12 @@ class FeedView(MarketplaceView, BaseFeedESView, generics.GenericAPIView):
         """
         if empty_feed_code == 0:
             return self._get(request, rest_of_world=True,
-                             original_region=region, *args, **kwargs)
+                             original_region=region, websites=websites,
+                             *args, **kwargs)
         return response.Response(status=status.HTTP_404_NOT_FOUND)
 
     def _get(self, request, rest_of_world=False, original_region=None,
-             *args, **kwargs):
+             websites=None, *args, **kwargs):
         es = FeedItemIndexer.get_es()
 
         # Parse region.
@@ -945,17 +950,23 @@ class FeedView(MarketplaceView, BaseFeedESView, generics.GenericAPIView):
         if q.get('carrier') and q['carrier'] in mkt.carriers.CARRIER_MAP:
             carrier = mkt.carriers.CARRIER_MAP[q['carrier']].id
 
-        # Fetch FeedItems.
-        sq = self.get_es_feed_query(FeedItemIndexer.search(using=es),
-                                    region=region, carrier=carrier,
-                                    original_region=original_region)
+        # Fetch FeedItems, along with the featured websites which don't
+        # depend on them, in a single request.
+        sq = self.get_es_feed_query(
+            BatchedSearch(using=es, index=FeedItemIndexer.get_index(),
+                          doc_type=FeedItemIndexer.get_mapping_type_name()),
+            region=region, carrier=carrier, original_region=original_region)
+        if websites is None:
+            websites = self.get_es_featured_websites_query(
+                BatchedSearch(using=es))
+            sq = sq.batch(websites)
         # The paginator triggers the ES request.
         with statsd.timer('mkt.feed.view.feed_query'):
             feed_items = self.paginate_queryset(sq)
         feed_ok = self._check_empty_feed(feed_items, rest_of_world)
         if feed_ok != 1:
             return self._handle_empty_feed(feed_ok, region, request, args,
-                                           kwargs)
+                                           kwargs, websites=websites)
 
         # Build the meta object.
         meta = (self.paginator.get_paginated_response(feed_items).data['meta'])
@@ -1003,10 +1014,12 @@ class FeedView(MarketplaceView, BaseFeedESView, generics.GenericAPIView):
                 log.warning('Feed empty for region {0}. Requerying feed with '
                             'region=RESTOFWORLD'.format(region))
             return self._handle_empty_feed(feed_ok, region, request, args,
-                                           kwargs)
+                                           kwargs, websites=websites)
 
+        # Already fetched with the feed items.
         with statsd.timer('mkt.feed.view.feed_website_query'):
-            websites = self.get_featured_websites()
+            websites = ESWebsiteSerializer(websites.execute().hits,
+                                           many=True).data
 
         return response.Response({
             'meta': meta,
@@ -1014,9 +1027,48 @@ class FeedView(MarketplaceView, BaseFeedESView, generics.GenericAPIView):
             'websites': websites
         }, status=status.HTTP_200_OK)
 
+    def get_cache_key(self, request):
+        """
+        Cache key of the serialized feed for `request`: its region, language
+        and query string (carrier, device, feature profile and page), the
+        seed of the featured websites and the generations of the indexes
+        the feed is built from.
+        """
+        generations = get_generations(
+            [FeedItemIndexer, FeedAppIndexer, FeedBrandIndexer,
+             FeedCollectionIndexer, FeedShelfIndexer, WebsiteIndexer])
+        query_string = urlencode(sorted(request.query_params.lists()),
+                                 doseq=True)
+        key = u':'.join(map(unicode, [
+            request.REGION.id, get_language(), query_string,
+            self._get_daily_seed()] + generations))
+        return 'feed:view:%s' % hashlib.md5(key.encode('utf-8')).hexdigest()
+
     def get(self, request, *args, **kwargs):
         with statsd.timer('mkt.feed.view'):
-            return self._get(request, *args, **kwargs)
+            key = self.get_cache_key(request)
+            cached = cache.get(key)
+            if cached is not None:
+                statsd.incr('mkt.feed.view.cache.hit')
+                data, status_code = cached
+                return response.Response(data, status=status_code)
+
+            statsd.incr('mkt.feed.view.cache.miss')
+            region = request.REGION.id
+            regions_with_feed = FeedItemIndexer.get_regions_with_feed()
+            if (region != mkt.regions.RESTOFWORLD.id and
+                    regions_with_feed is not None and
+                    region not in regions_with_feed):
+                # The region has no feed of its own, skip straight to the
+                # RESTOFWORLD one, keeping the shelves of the region.
+                statsd.incr('mkt.feed.view.restofworld')
+                kwargs.update(rest_of_world=True, original_region=region)
+            res = self._get(request, *args, **kwargs)
+            if res.status_code in (status.HTTP_200_OK,
+                                   status.HTTP_404_NOT_FOUND):
+                cache.set(key, (res.data, res.status_code),
+                          settings.FEED_CACHE_TIMEOUT)
+            return res
 
 
 class FeedElementGetView(BaseFeedESView):
@@ -11,9 +11,10 @@ from django.test import client
 
 from mkt.api.tests.test_oauth import RestOAuth
 from mkt.monolith.models import MonolithRecord, record_stat
-from mkt.monolith.views import daterange
+from mkt.monolith.views import _get_query_result, daterange
+from mkt.ratings.models import Review
 from mkt.site.fixtures import fixture
-from mkt.site.tests import TestCase
+from mkt.site.tests import app_factory, TestCase, user_factory
 
 
 class RequestFactory(client.RequestFactory):
@@ -225,3 +226,44 @@ class TestDateRange(TestCase):
         eq_(len(range), 7)
         eq_(range[0], self.week_ago)
         ok_(self.today not in range)
+
+
+class TestQueryResult(TestCase):
+
+    def setUp(self):
+        self.apps = [app_factory(), app_factory()]
+        self.start = datetime.date(2015, 1, 10)
+        self.end = datetime.date(2015, 1, 12)
+        self.review(self.apps[0], 5, datetime.date(2015, 1, 5))
+        self.review(self.apps[0], 1, datetime.date(2015, 1, 10))
+        self.review(self.apps[0], 5, datetime.date(2015, 1, 11))
+        self.review(self.apps[1], 4, datetime.date(2015, 1, 11))
+        self.review(self.apps[1], 2, datetime.date(2015, 1, 12))
+
+    def review(self, app, rating, day):
+        review = Review.objects.create(addon=app, user=user_factory(),
+                                       rating=rating)
+        Review.objects.filter(pk=review.pk).update(
+            created=datetime.datetime.combine(day, datetime.time(12)))
+
+    def values(self, data):
+        return [(d['recorded'], d['value']['app-id'], d['value']['count'])
+                for d in data]
+
+    def test_slice(self):
+        with self.assertNumQueries(1):
+            data = _get_query_result('apps_ratings', self.start, self.end)
+        eq_(self.values(data), [
+            (self.start, self.apps[0].pk, 1),
+            (self.start + datetime.timedelta(1), self.apps[0].pk, 1),
+            (self.start + datetime.timedelta(1), self.apps[1].pk, 1)])
+        eq_(data[0]['key'], 'apps_ratings')
+
+    def test_total(self):
+        with self.assertNumQueries(2):
+            data = _get_query_result('apps_average_rating', self.start,
+                                     self.end)
+        eq_(self.values(data), [
+            (self.start, self.apps[0].pk, 3.0),
+            (self.start + datetime.timedelta(1), self.apps[0].pk, 11 / 3.0),
+            (self.start + datetime.timedelta(1), self.apps[1].pk, 4.0)])
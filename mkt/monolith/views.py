@@ -1,7 +1,9 @@
+import collections
 import datetime
 import logging
 
-from django.db.models import Avg, Count
+from django.db import connection
+from django.db.models import Count, Sum
 from rest_framework import status
 from rest_framework.exceptions import ParseError
 from rest_framework.generics import ListAPIView
@@ -22,35 +24,28 @@ log = logging.getLogger('z.monolith')
 
 # TODO: Move the stats that can be calculated on the fly from
 # apps/stats/tasks.py here.
+#
+# The objects of 'qs' are grouped by the value of their 'group_by' field,
+# returned as the 'app-id', and by the day they were created. The 'count' is
+# the number of objects or, if 'average' is set, the average of that field.
+# For 'slice' stats, it is computed over the objects created on each day, for
+# 'total' stats over the objects created up to each day.
 STATS = {
     'apps_ratings': {
-        'qs': Review.objects
-        .filter(editorreview=0)
-        .values('addon')
-        .annotate(count=Count('addon')),
+        'qs': Review.objects.filter(editorreview=0),
+        'group_by': 'addon',
         'type': 'slice',
-        'field_map': {
-            'count': 'count',
-            'app-id': 'addon'},
     },
     'apps_average_rating': {
-        'qs': Review.objects
-        .filter(editorreview=0)
-        .values('addon')
-        .annotate(avg=Avg('rating')),
+        'qs': Review.objects.filter(editorreview=0),
+        'group_by': 'addon',
+        'average': 'rating',
         'type': 'total',
-        'field_map': {
-            'count': 'avg',
-            'app-id': 'addon'},
     },
     'apps_abuse_reports': {
-        'qs': AbuseReport.objects
-        .values('addon')
-        .annotate(count=Count('addon')),
+        'qs': AbuseReport.objects.all(),
+        'group_by': 'addon',
         'type': 'slice',
-        'field_map': {
-            'count': 'count',
-            'app-id': 'addon'},
     }
 }
 
@@ -60,12 +55,38 @@ def daterange(start, end):
         yield start + datetime.timedelta(n)
 
 
+def _aggregate(stat, by_day=True, **filters):
+    """
+    Aggregate the objects of `stat` matching `filters` in one query, grouped
+    by their `group_by` value and, if `by_day`, the day they were created.
+
+    Yields (group, day, count, total) tuples, `count` being the number of
+    objects (or of `average` values) and `total` the sum of the `average`
+    values if the stat has one. `day` is None if not `by_day`.
+    """
+    qs = stat['qs'].filter(**filters)
+    group_by = stat['group_by']
+    fields = [group_by]
+    if by_day:
+        qn = connection.ops.quote_name
+        qs = qs.extra(select={'day': 'DATE(%s.%s)' % (
+            qn(qs.model._meta.db_table), qn('created'))})
+        fields.append('day')
+
+    aggregates = {'count': Count(stat.get('average', group_by))}
+    if 'average' in stat:
+        aggregates['total'] = Sum(stat['average'])
+
+    # Clear the default ordering of the model, it would be grouped by too.
+    for row in qs.values(*fields).annotate(**aggregates).order_by():
+        yield (row[group_by], row.get('day'), row['count'], row.get('total'))
+
+
 def _get_query_result(key, start, end):
     # To do on-the-fly queries we have to produce results as if they
-    # were calculated daily, which means we need to iterate over each
-    # day in the range and perform an aggregation on this date.
-
-    data = []
+    # were calculated daily: the objects created in the range are aggregated
+    # by day in one query, and the totals are summed from day to day,
+    # starting from the objects created before the range.
     today = datetime.date.today()
     stat = STATS[key]
 
@@ -75,27 +96,43 @@ def _get_query_result(key, start, end):
     if not end:
         end = today
 
+    by_day = collections.defaultdict(list)
+    for group, day, count, total in _aggregate(stat, created__gte=start,
+                                               created__lt=end):
+        by_day[day].append((group, count, total))
+
+    counts = collections.defaultdict(int)
+    totals = collections.defaultdict(int)
+
+    def add(group, count, total):
+        counts[group] += count
+        totals[group] += total or 0
+
+    def value(group):
+        if 'average' not in stat:
+            return counts[group]
+        elif counts[group]:
+            return float(totals[group]) / counts[group]
+
+    if stat['type'] == 'total':
+        for group, _, count, total in _aggregate(stat, by_day=False,
+                                                 created__lt=start):
+            add(group, count, total)
+
+    data = []
     for day in daterange(start, end):
-        if stat['type'] == 'total':
-            # If it's a totalling queryset, we want to filter by the
-            # end date until the beginning of time to get the total
-            # objects up until this point in time.
-            date_filtered = stat['qs'].filter(
-                created__lt=(day + datetime.timedelta(days=1)))
-        else:
-            # Otherwise, we want to filter by both start/end to get
-            # counts on a specific day.
-            date_filtered = stat['qs'].filter(
-                created__gte=day,
-                created__lt=(day + datetime.timedelta(days=1)))
+        if stat['type'] != 'total':
+            counts.clear()
+            totals.clear()
+        for group, count, total in by_day.get(day, ()):
+            add(group, count, total)
 
         data.extend([{
             'key': key,
             'recorded': day,
             'user_hash': None,
-            'value': {'count': d.get(stat['field_map']['count']),
-                      'app-id': d.get(stat['field_map']['app-id'])}}
-                     for d in date_filtered])
+            'value': {'count': value(group), 'app-id': group}}
+            for group in sorted(counts)])
 
     return data
 
@@ -26,6 +26,8 @@ from mkt.site.decorators import use_master
 from mkt.site.models import ManagerBase, ModelBase
 from mkt.translations.utils import get_locale_from_lang
 from mkt.users.models import UserProfile
+from services.purchase_cache import (app_purchase_key, inapp_purchase_key,
+                                     invalidate_purchases)
 
 log = commonware.log.getLogger('z.market')
 
@@ -310,6 +312,28 @@ def add_uuid(sender, **kw):
             record.save()
 
 
+@receiver(models.signals.post_save, sender=AddonPurchase,
+          dispatch_uid='addon_purchase_invalidate_receipts')
+def invalidate_app_purchase(sender, instance, **kw):
+    """Make sure the receipt verifier sees the new purchase type."""
+    if not kw.get('raw') and instance.uuid:
+        invalidate_purchases([app_purchase_key(instance.addon_id,
+                                               instance.uuid)])
+
+
+@receiver(models.signals.post_save, sender=Contribution,
+          dispatch_uid='contribution_invalidate_receipts')
+def invalidate_inapp_purchase(sender, instance, **kw):
+    """
+    Make sure the receipt verifier sees the new type of an in-app purchase,
+    or of the purchase a refund or chargeback is related to.
+    """
+    if not kw.get('raw') and instance.inapp_product_id:
+        invalidate_purchases([inapp_purchase_key(pk) for pk in
+                              filter(None, [instance.pk,
+                                            instance.related_id])])
+
+
 @use_master
 @receiver(models.signals.post_save, sender=Contribution,
           dispatch_uid='create_addon_purchase')
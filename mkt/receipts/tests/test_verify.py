@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 import calendar
+import json
 import time
 import uuid
 from urllib import urlencode
@@ -273,6 +274,74 @@ class TestVerify(ReceiptTest):
             eq_(res['status'], 'refunded')
         eq_(log.call_count, 2)
 
+    def test_premium_app_purchase_cached(self):
+        self.app.update(premium_type=mkt.ADDON_PREMIUM)
+        purchase = self.make_purchase()
+        eq_(self.verify_receipt_data(self.sample_app_receipt())['status'],
+            'ok')
+
+        # Changes that don't go through the ORM aren't seen.
+        AddonPurchase.objects.filter(pk=purchase.pk).update(
+            type=mkt.CONTRIB_REFUND)
+        eq_(self.verify_receipt_data(self.sample_app_receipt())['status'],
+            'ok')
+
+        # Saving the purchase invalidates the cache.
+        purchase.update(type=mkt.CONTRIB_REFUND)
+        eq_(self.verify_receipt_data(self.sample_app_receipt())['status'],
+            'refunded')
+
+    def test_inapp_purchase_cached(self):
+        contribution = self.make_inapp_contribution()
+        receipt = self.sample_inapp_receipt(contribution)
+        eq_(self.verify_receipt_data(receipt)['status'], 'ok')
+
+        contribution.update(type=mkt.CONTRIB_CHARGEBACK)
+        eq_(self.verify_receipt_data(receipt)['status'], 'refunded')
+
+    @mock.patch('services.verify.parse_qsl')
+    def test_storedata_parsed_once(self, parse_qsl):
+        self.app.update(premium_type=mkt.ADDON_PREMIUM)
+        self.make_purchase()
+        parse_qsl.return_value = [('id', str(self.app.pk))]
+        res = self.verify_receipt_data(self.sample_app_receipt())
+        eq_(res['status'], 'ok', res)
+        eq_(parse_qsl.call_count, 1)
+
+    @mock.patch.object(verify, 'decode_receipt')
+    @mock.patch.object(verify, 'mypool')
+    def test_batch(self, mypool, decode_receipt):
+        self.app.update(premium_type=mkt.ADDON_PREMIUM)
+        contribution = self.make_inapp_contribution(type=mkt.CONTRIB_REFUND)
+        self.make_purchase()
+        not_purchased = self.sample_app_receipt()
+        not_purchased['user']['value'] = 'other-uuid'
+        receipts = {'app': self.sample_app_receipt(),
+                    'inapp': self.sample_inapp_receipt(contribution),
+                    'not-purchased': not_purchased,
+                    'wrong-type': dict(self.sample_app_receipt(),
+                                       typ='test-receipt')}
+        decode_receipt.side_effect = lambda receipt: receipts[receipt]
+
+        batch = verify.BatchVerify(
+            ['app', 'inapp', 'not-purchased', 'wrong-type'],
+            RequestFactory().get('/verifyme/').META)
+        batch.cursor = mock.Mock(wraps=connection.cursor())
+        res = batch.check_full()
+        eq_([r['status'] for r in res],
+            ['ok', 'refunded', 'invalid', 'invalid'])
+        eq_(res[2]['reason'], 'NO_PURCHASE')
+        eq_(res[3]['reason'], 'WRONG_TYPE')
+        # One query for the apps and one for the inapps.
+        eq_(batch.cursor.execute.call_count, 2)
+        assert not mypool.connect.called
+
+        # Everything that was found is now cached.
+        batch.cursor.reset_mock()
+        eq_([r['status'] for r in batch.check_full()],
+            ['ok', 'refunded', 'invalid', 'invalid'])
+        eq_(batch.cursor.execute.call_count, 1)
+
     def test_premium_no_charge(self):
         self.app.update(premium_type=mkt.ADDON_PREMIUM)
         purchase = self.make_purchase()
@@ -348,14 +417,64 @@ class TestVerify(ReceiptTest):
         eq_(result['typ'], u'purchase-receipt')
 
     @mock.patch('services.verify.settings')
-    @mock.patch('services.verify.receipts.certs.ReceiptVerifier')
+    @mock.patch('services.verify.ReceiptVerifier')
+    @mock.patch.dict('services.verify._verifiers', clear=True)
     def test_crack_receipt_new_called(self, trunion_verify, settings):
         # Check that we can decode our receipt and get a dictionary back.
         self.app.update(manifest_url='http://a.com')
         verify.decode_receipt(
             'jwt_public_key~' + create_receipt(
                 self.app, self.user, str(uuid.uuid4())))
-        assert trunion_verify.called
+        assert trunion_verify.return_value.verify.called
+
+    @mock.patch.object(utils.settings, 'SIGNING_VALID_ISSUERS', ['a.com'])
+    @mock.patch.object(utils.settings, 'RECEIPT_VERIFIER_REFRESH_INTERVAL',
+                       60)
+    @mock.patch.dict('services.verify._verifiers', clear=True)
+    @mock.patch('services.verify.time')
+    def test_verifier_cached(self, time):
+        time.return_value = 1000
+        verifier = verify.get_verifier()
+        eq_(verifier.valid_issuers, ['a.com'])
+        time.return_value = 1060
+        eq_(verify.get_verifier(), verifier)
+        time.return_value = 1061
+        ok_(verify.get_verifier() is not verifier)
+
+    @mock.patch.object(utils.settings, 'RECEIPT_VERIFIER_REFRESH_INTERVAL',
+                       60)
+    @mock.patch.dict('services.verify._keys', clear=True)
+    @mock.patch('services.verify.jwt.rsa_load')
+    @mock.patch('services.verify.time')
+    def test_receipt_key_cached(self, time, rsa_load):
+        time.return_value = 1000
+        eq_(verify.get_receipt_key(), rsa_load.return_value)
+        eq_(verify.get_receipt_key(), rsa_load.return_value)
+        eq_(rsa_load.call_count, 1)
+        time.return_value = 1061
+        verify.get_receipt_key()
+        eq_(rsa_load.call_count, 2)
+
+    @mock.patch('receipts.certs.ReceiptVerifier.verify_certificate_chain')
+    def test_certificate_chain_cached(self, verify_chain):
+        verifier = verify.ReceiptVerifier(valid_issuers=['a.com'])
+        chain = [mock.Mock(payload={'iss': 'https://a.com', 'exp': 2000},
+                           signed_data='data', signature='sig')]
+        eq_(verifier.verify_certificate_chain(chain, now=1000),
+            verify_chain.return_value)
+        eq_(verifier.verify_certificate_chain(chain, now=1000),
+            verify_chain.return_value)
+        eq_(verify_chain.call_count, 1)
+
+        # Another signature isn't trusted.
+        chain[0].signature = 'other'
+        verifier.verify_certificate_chain(chain, now=1000)
+        eq_(verify_chain.call_count, 2)
+
+        # Expired chains are verified again.
+        chain[0].signature = 'sig'
+        verifier.verify_certificate_chain(chain, now=3000)
+        eq_(verify_chain.call_count, 3)
 
     def test_crack_borked_receipt(self):
         self.app.update(manifest_url='http://a.com')
@@ -442,6 +561,15 @@ class TestServices(mkt.site.tests.TestCase):
         with self.settings(SIGNING_SERVER_ACTIVE=''):
             eq_(verify.status_check({})[0], 500)
 
+    def test_batch_invalid(self):
+        for data in ['{', '{}', '["a", 1]', json.dumps(['a'] * 51)]:
+            environ = RequestFactory().post(
+                '/verifyme/batch/', data,
+                content_type='application/json').META
+            start_response = mock.Mock()
+            eq_(verify.application(environ, start_response), [''])
+            eq_(start_response.call_args[0][0], '400 Bad Request')
+
     def test_options_request_for_cors(self):
         data = {}
         req = RequestFactory().options('/verify')
@@ -0,0 +1,38 @@
+import csv
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from lib.geoip import write_range_table
+
+
+class Command(BaseCommand):
+    help = ('Build the GeoIP range table used by GEOIP_DATABASE from a CSV '
+            'file of IP ranges. Syntax: \n'
+            '    ./manage.py build_geoip_table <csv_file> <table_file>\n'
+            'The first two columns of the CSV file are the first and last '
+            'address of each range.')
+    option_list = BaseCommand.option_list + (
+        make_option('--country-column', action='store', type='int',
+                    dest='country_column', default=2,
+                    help='Column of the country code in the CSV file.'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 2:
+            raise CommandError(self.help)
+        csv_path, table_path = args
+        column = options['country_column']
+
+        def ranges():
+            with open(csv_path, 'rb') as f:
+                for row in csv.reader(f):
+                    if len(row) <= column or not row[column].strip():
+                        continue
+                    yield row[0].strip(), row[1].strip(), row[column].strip()
+
+        try:
+            write_range_table(ranges(), table_path)
+        except ValueError as e:
+            raise CommandError('Invalid range: %s' % e)
+        self.stdout.write('GeoIP range table written to %s' % table_path)
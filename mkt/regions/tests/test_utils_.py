@@ -2,7 +2,8 @@
 from nose.tools import eq_
 
 from mkt.constants import regions
-from mkt.regions.utils import parse_region, remove_accents
+from mkt.regions.utils import (mask_to_region_ids, parse_region,
+                               region_ids_to_mask, remove_accents)
 
 
 def test_parse_region():
@@ -20,6 +21,15 @@ def test_parse_worldwide_region_as_restofworld():
     eq_(parse_region('worldwide'), regions.RESTOFWORLD)
 
 
+def test_region_ids_mask():
+    eq_(region_ids_to_mask([]), 0)
+    eq_(mask_to_region_ids(0), [])
+    eq_(region_ids_to_mask([1, 7]), 0b10000010)
+    eq_(mask_to_region_ids(0b10000010), [1, 7])
+    eq_(mask_to_region_ids(region_ids_to_mask(regions.ALL_REGION_IDS)),
+        regions.ALL_REGION_IDS)
+
+
 def test_remove_accents():
     eq_(remove_accents(u'café'), u'cafe')
     eq_(remove_accents(u'Équateur'), u'Equateur')
@@ -27,6 +27,29 @@ def parse_region(region):
                 return region
 
 
+def region_ids_to_mask(region_ids):
+    """
+    Return an integer with the bit of each of the `region_ids` set, a compact
+    representation of a set of regions.
+    """
+    mask = 0
+    for region_id in region_ids:
+        mask |= 1 << region_id
+    return mask
+
+
+def mask_to_region_ids(mask):
+    """Return the sorted ids of the regions whose bit is set in `mask`."""
+    region_ids = []
+    region_id = 0
+    while mask:
+        if mask & 1:
+            region_ids.append(region_id)
+        mask >>= 1
+        region_id += 1
+    return region_ids
+
+
 def remove_accents(input_str):
     """Remove accents from input."""
     nkfd_form = unicodedata.normalize('NFKD', unicode(input_str))
@@ -0,0 +1,23 @@
+import commonware.log
+import cronjobs
+import waffle
+
+from mkt.reviewers.utils import update_queue_stats
+
+
+log = commonware.log.getLogger('z.cron')
+
+
+@cronjobs.register
+def update_queue_stats_cron():
+    """
+    Recompute the reviewer queue stats. They are invalidated when the apps in
+    the queues change, this catches what the signals miss and moves apps from
+    one progress bucket to the next as they age.
+    """
+    log.info('Updating the reviewer queue stats.')
+    update_queue_stats()
+    if waffle.switch_is_active('reviewer-tools-elasticsearch'):
+        # Apps are indexed some time after they change, these stats can miss
+        # the changes of the apps indexed after they were invalidated.
+        update_queue_stats(use_es=True)
@@ -1,27 +1,39 @@
 import datetime
+import threading
 
 from django.core.cache import cache
+from django.core.signals import request_finished
 from django.db import models
 from django.db.models import Sum
 
 import commonware.log
+from celery.signals import task_postrun
 
 import mkt
 import mkt.constants.comm as comm
+from mkt.abuse.models import AbuseReport
 from mkt.comm.utils import create_comm_note
+from mkt.files.models import File
+from mkt.ratings.models import Review, ReviewFlag
 from mkt.site.models import ManagerBase, ModelBase
 from mkt.site.utils import cache_ns_key
 from mkt.tags.models import Tag
 from mkt.translations.fields import save_signal, TranslatedField
 from mkt.users.models import UserProfile
+from mkt.versions.models import Version
 from mkt.webapps.indexers import WebappIndexer
-from mkt.webapps.models import Webapp
+from mkt.webapps.models import Geodata, Webapp
 from mkt.websites.models import Website
 
 
 user_log = commonware.log.getLogger('z.users')
 QUEUE_TARAKO = 'tarako'
 SHOWCASE_TAG = 'nominated'
+# Cache keys of the reviewer queue stats, computed from the database or from
+# Elasticsearch, see `mkt.reviewers.utils.get_queue_stats()`.
+QUEUE_STATS_KEY = 'reviewers:queue-stats'
+QUEUE_STATS_ES_KEY = 'reviewers:queue-stats-es'
+_locals = threading.local()
 
 
 class CannedResponse(ModelBase):
@@ -516,3 +528,94 @@ for model in (RereviewQueue, EscalationQueue):
     models.signals.post_delete.connect(
         update_search_index, sender=model,
         dispatch_uid='%s-delete-update-index' % model._meta.model_name)
+
+
+def invalidate_queue_stats(*args, **kwargs):
+    """
+    Drop the cached reviewer queue stats, they are recomputed on read. They are
+    dropped again once the request or task is finished, i.e. once its
+    transaction is committed, since they can be recomputed from the data
+    committed before it in the meantime.
+    """
+    cache.delete_many([QUEUE_STATS_KEY, QUEUE_STATS_ES_KEY])
+    _locals.queue_stats_invalidated = True
+
+
+def _invalidate_queue_stats_after_commit(**kwargs):
+    if _locals.__dict__.pop('queue_stats_invalidated', False):
+        cache.delete_many([QUEUE_STATS_KEY, QUEUE_STATS_ES_KEY])
+
+
+request_finished.connect(_invalidate_queue_stats_after_commit,
+                         dispatch_uid='request_finished_queue_stats')
+task_postrun.connect(_invalidate_queue_stats_after_commit,
+                     dispatch_uid='task_postrun_queue_stats')
+
+
+# What the reviewer queues are made of, with the fields that move an app in
+# or out of a queue or between progress buckets (all of them if None), and
+# whether creating one does. Deleting one always does.
+QUEUE_STATS_FIELDS = (
+    (Webapp, ('status', 'disabled_by_user', 'is_packaged'), True),
+    (Version, ('nomination', 'deleted'), True),
+    (File, ('status',), True),
+    (EscalationQueue, None, True),
+    (RereviewQueue, None, True),
+    (AdditionalReview, ('passed',), True),
+    (AbuseReport, ('read',), True),
+    (Review, ('editorreview',), False),
+    (ReviewFlag, None, True),
+    (Website, ('status',), False),
+    (Geodata, ('region_cn_status', 'region_cn_nominated'), True),
+)
+
+
+def watch_queue_stats(model, fields, on_create):
+    """
+    Connect the signals invalidating the queue stats when an instance of
+    `model` is saved with a change to one of `fields`, or created if
+    `on_create`, or deleted.
+
+    The values of `fields` are kept on the instances when they are loaded,
+    and after every save, to tell whether they changed.
+    """
+    name = model._meta.model_name
+
+    def get_values(instance):
+        return tuple(getattr(instance, field) for field in fields or ())
+
+    def keep_values(sender, instance, **kwargs):
+        instance._queue_stats_values = get_values(instance)
+
+    def saved(sender, instance, created, **kwargs):
+        values = get_values(instance)
+        if ((created and on_create) or fields is None or
+                values != getattr(instance, '_queue_stats_values', None)):
+            invalidate_queue_stats()
+        instance._queue_stats_values = values
+
+    if fields is not None:
+        models.signals.post_init.connect(
+            keep_values, sender=model, weak=False,
+            dispatch_uid='%s-init-queue-stats' % name)
+    models.signals.post_save.connect(
+        saved, sender=model, weak=False,
+        dispatch_uid='%s-save-queue-stats' % name)
+    models.signals.post_delete.connect(
+        invalidate_queue_stats, sender=model,
+        dispatch_uid='%s-delete-queue-stats' % name)
+
+
+for model, fields, on_create in QUEUE_STATS_FIELDS:
+    watch_queue_stats(model, fields, on_create)
+
+
+def watch_queue_tags(sender, action, **kwargs):
+    # The homescreen queue is made of the apps with the homescreen tag.
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_queue_stats()
+
+
+models.signals.m2m_changed.connect(
+    watch_queue_tags, sender=Webapp.tags.through,
+    dispatch_uid='webapp-tags-queue-stats')
@@ -1,7 +1,23 @@
 # -*- coding: utf8 -*-
-import mkt.site.tests
+from django.core.cache import cache
+from django.core.signals import request_finished
+
+import mock
+from nose.tools import eq_, ok_
 
-from mkt.reviewers.utils import create_sort_link
+import mkt
+import mkt.site.tests
+from mkt.ratings.models import Review, ReviewFlag
+from mkt.reviewers.cron import update_queue_stats_cron
+from mkt.reviewers.models import (QUEUE_STATS_ES_KEY, QUEUE_STATS_KEY,
+                                  RereviewQueue)
+from mkt.reviewers.utils import (compute_queue_stats, compute_queue_stats_es,
+                                 create_sort_link, get_queue_stats)
+from mkt.site.tests import app_factory, user_factory
+from mkt.tags.models import Tag
+from mkt.versions.models import Version
+from mkt.webapps.indexers import WebappIndexer
+from mkt.webapps.models import Webapp
 
 
 class TestCreateSortLink(mkt.site.tests.TestCase):
@@ -43,3 +59,114 @@ class TestCreateSortLink(mkt.site.tests.TestCase):
         assert 'sort=name' in link
         assert 'order=asc' in link
         assert 'text_query=Feliz+A%C3%B1o' in link
+
+
+class TestQueueStats(mkt.site.tests.TestCase):
+
+    def setUp(self):
+        self.app = app_factory(status=mkt.STATUS_PENDING,
+                               file_kw={'status': mkt.STATUS_PENDING})
+        self.app.latest_version.update(nomination=self.days_ago(15))
+
+    def test_stats(self):
+        stats = get_queue_stats()
+        eq_(stats['counts']['pending'], 1)
+        eq_(stats['counts']['rereview'], 0)
+        eq_(stats['progress']['pending'],
+            {'new': 0, 'med': 0, 'old': 1, 'week': 0})
+        eq_(stats['percentage']['pending'], {'new': 0, 'med': 0, 'old': 100})
+
+    def test_cached(self):
+        stats = get_queue_stats()
+        with self.assertNumQueries(0):
+            eq_(get_queue_stats(), stats)
+
+    def test_invalidated_on_queue_change(self):
+        get_queue_stats()
+        RereviewQueue.objects.create(addon=self.app)
+        eq_(get_queue_stats()['counts']['rereview'], 1)
+
+    def test_invalidated_on_app_change(self):
+        get_queue_stats()
+        self.app.update(disabled_by_user=True)
+        eq_(get_queue_stats()['counts']['pending'], 0)
+
+    def test_not_invalidated_on_other_changes(self):
+        stats = get_queue_stats()
+        self.app.update(public_stats=True)
+        self.app.latest_version.update(approvalnotes='Fixed stuff.')
+        with self.assertNumQueries(0):
+            eq_(get_queue_stats(), stats)
+
+    def test_invalidated_on_review_flagged(self):
+        review = Review.objects.create(addon=self.app, user=user_factory(),
+                                       body='Spam', rating=5)
+        get_queue_stats()
+        ReviewFlag.objects.create(review=review, user=user_factory(),
+                                  flag=ReviewFlag.SPAM)
+        review.update(editorreview=True)
+        eq_(get_queue_stats()['counts']['moderated'], 1)
+
+    def test_invalidated_on_tag_change(self):
+        get_queue_stats()
+        Tag(tag_text='homescreen').save_tag(self.app)
+        stats = get_queue_stats()
+        eq_(stats['counts']['pending'], 0)
+        eq_(stats['counts']['homescreen'], 1)
+
+    def test_invalidated_after_request(self):
+        RereviewQueue.objects.create(addon=self.app)
+        # Recomputed before the transaction is committed.
+        get_queue_stats()
+        request_finished.send(sender=self.__class__)
+        eq_(cache.get(QUEUE_STATS_KEY), None)
+
+    def test_cron(self):
+        get_queue_stats()
+        # Updating a queryset doesn't send any signal.
+        Version.objects.filter(addon=self.app).update(
+            nomination=self.days_ago(1))
+        eq_(get_queue_stats()['progress']['pending']['old'], 1)
+        update_queue_stats_cron()
+        eq_(get_queue_stats()['progress']['pending'],
+            {'new': 1, 'med': 0, 'old': 0, 'week': 1})
+
+
+class TestQueueStatsES(mkt.site.tests.ESTestCase):
+
+    def setUp(self):
+        self.apps = [app_factory(status=mkt.STATUS_PENDING,
+                                 file_kw={'status': mkt.STATUS_PENDING})
+                     for i in range(3)]
+        for app, days in zip(self.apps, (1, 8, 15)):
+            app.latest_version.update(nomination=self.days_ago(days))
+        RereviewQueue.objects.create(addon=self.apps[0])
+        self.reindex(Webapp)
+
+    def test_stats(self):
+        es_stats = compute_queue_stats_es()
+        stats = compute_queue_stats()
+        eq_(es_stats['counts']['pending'], 3)
+        eq_(es_stats['counts']['rereview'], 1)
+        for queue, count in es_stats['counts'].items():
+            eq_(count, stats['counts'][queue])
+        eq_(es_stats['progress'], stats['progress'])
+        eq_(es_stats['percentage'], stats['percentage'])
+
+    def test_get_queue_stats(self):
+        stats = get_queue_stats(use_es=True)
+        eq_(stats['counts']['pending'], 3)
+        eq_(stats['progress']['pending'],
+            {'new': 1, 'med': 1, 'old': 1, 'week': 1})
+        # The queues Elasticsearch can't count come from the database.
+        eq_(stats['counts']['moderated'], 0)
+
+    def test_get_queue_stats_cached(self):
+        stats = get_queue_stats(use_es=True)
+        with mock.patch.object(WebappIndexer, 'get_es') as get_es:
+            with self.assertNumQueries(0):
+                eq_(get_queue_stats(use_es=True), stats)
+        ok_(not get_es.called)
+
+        RereviewQueue.objects.create(addon=self.apps[1])
+        eq_(cache.get(QUEUE_STATS_ES_KEY), None)
@@ -5,11 +5,13 @@ from datetime import datetime
 
 from django.conf import settings
 from django.core.cache import cache
+from django.db import connection
 from django.db.models import Q
 
 import commonware.log
 from elasticsearch_dsl import Search
 from elasticsearch_dsl import filter as es_filter
+from django_statsd.clients import statsd
 from django.utils.translation import ugettext_lazy as _lazy
 
 import mkt
@@ -19,10 +21,13 @@ from mkt.comm.utils import create_comm_note
 from mkt.constants import comm
 from mkt.files.models import File
 from mkt.ratings.models import Review
-from mkt.reviewers.models import EscalationQueue, RereviewQueue, ReviewerScore
+from mkt.reviewers.models import (QUEUE_STATS_ES_KEY, QUEUE_STATS_KEY,
+                                  QUEUE_TARAKO,
+                                  AdditionalReview, EscalationQueue,
+                                  RereviewQueue, ReviewerScore)
 from mkt.site.helpers import product_as_dict
 from mkt.site.models import manual_order
-from mkt.site.utils import cached_property, JSONEncoder
+from mkt.site.utils import cached_property, days_ago, JSONEncoder
 from mkt.translations.query import order_by_translation
 from mkt.versions.models import Version
 from mkt.webapps.models import Webapp
@@ -848,3 +853,210 @@ class ReviewersQueuesHelper(object):
         order_by = ('-' if order == 'desc' else '') + sort_type
 
         return qs.sort(order_by)
+
+
+def _queue_progress_buckets():
+    """
+    Return the ranges of dates of the progress buckets, as (gt, gte, lte, lt)
+    bounds, None for no bound.
+    """
+    five_days_ago, seven_days_ago, ten_days_ago = (
+        days_ago(5), days_ago(7), days_ago(10))
+    return {
+        'new': (five_days_ago, None, None, None),
+        'med': (None, ten_days_ago, five_days_ago, None),
+        'old': (None, None, None, ten_days_ago),
+        'week': (None, seven_days_ago, None, None),
+    }
+
+
+def _queue_percentage(progress):
+    def pct(p, t):
+        # Return the percent of (p)rogress out of (t)otal.
+        return (p / float(t)) * 100 if p > 0 else 0
+
+    percentage = {}
+    for queue in progress:
+        total = sum(progress[queue][duration]
+                    for duration in ('new', 'med', 'old'))
+        percentage[queue] = dict(
+            (duration, pct(progress[queue][duration], total))
+            for duration in ('new', 'med', 'old'))
+    return percentage
+
+
+def _count_queue(qs, field, buckets):
+    """
+    Return the number of items of `qs` and the number of them in each of
+    `buckets`, by their `field` date, counted in a single query.
+    """
+    qn = connection.ops.quote_name
+    column = '%s.%s' % (qn(qs.model._meta.db_table),
+                        qn(qs.model._meta.get_field(field).column))
+    select, params = OrderedDict([('total', 'COUNT(*)')]), []
+    for bucket, bounds in buckets.items():
+        conditions = []
+        for operator, bound in zip(('>', '>=', '<=', '<'), bounds):
+            if bound is not None:
+                conditions.append('%s %s %%s' % (column, operator))
+                params.append(bound)
+        select[bucket] = ('SUM(CASE WHEN %s THEN 1 ELSE 0 END)' %
+                          ' AND '.join(conditions))
+    row = (qs.order_by().extra(select=select, select_params=params)
+           .values_list(*select.keys()))[0]
+    return row[0], dict((bucket, int(count or 0))
+                        for bucket, count in zip(select.keys()[1:], row[1:]))
+
+
+def compute_queue_stats():
+    """
+    Compute the reviewer queue stats, see `get_queue_stats()`.
+
+    The queues with progress buckets are counted, in total and by bucket,
+    with one query per queue.
+    """
+    queues_helper = ReviewersQueuesHelper()
+    dated_queues = {
+        'pending': (queues_helper.get_pending_queue(), 'nomination'),
+        'homescreen': (queues_helper.get_homescreen_queue(), 'nomination'),
+        'rereview': (queues_helper.get_rereview_queue(), 'created'),
+        'escalated': (queues_helper.get_escalated_queue(), 'created'),
+        'updates': (queues_helper.get_updates_queue(), 'nomination'),
+    }
+    buckets = _queue_progress_buckets()
+
+    counts = {}
+    progress = {}
+    for queue, (qs, field) in dated_queues.items():
+        counts[queue], progress[queue] = _count_queue(qs, field, buckets)
+    counts.update(_count_undated_queues())
+
+    return {'counts': counts, 'progress': progress,
+            'percentage': _queue_percentage(progress)}
+
+
+def _count_undated_queues():
+    """
+    Count the queues without progress buckets, which Elasticsearch can't
+    count.
+    """
+    queues_helper = ReviewersQueuesHelper()
+    return {
+        'moderated': queues_helper.get_moderated_queue().count(),
+        'abuse': queues_helper.get_abuse_queue().count(),
+        'abusewebsites': queues_helper.get_abuse_queue_websites().count(),
+        'region_cn': Webapp.objects.pending_in_region(mkt.regions.CHN).count(),
+        'additional_tarako': (
+            AdditionalReview.objects
+                            .unreviewed(queue=QUEUE_TARAKO, and_approved=True)
+                            .count()),
+    }
+
+
+def compute_queue_stats_es():
+    """
+    Compute the stats of the queues Elasticsearch can count (pending,
+    homescreen, rereview, escalated and updates), in the format of
+    `compute_queue_stats()`.
+
+    Every count and progress bucket is a filter of one `filters` aggregation
+    over the webapp and homescreen indices, so this is a single request.
+    """
+    queues_helper = ReviewersQueuesHelper(use_es=True)
+    dated_queues = {
+        'pending': (queues_helper.get_pending_queue(),
+                    'latest_version.nomination_date'),
+        'homescreen': (queues_helper.get_homescreen_queue(),
+                       'latest_version.nomination_date'),
+        'rereview': (queues_helper.get_rereview_queue(), 'rereview_date'),
+        'escalated': (queues_helper.get_escalated_queue(), 'escalation_date'),
+        'updates': (queues_helper.get_updates_queue(),
+                    'latest_version.nomination_date'),
+    }
+    buckets = _queue_progress_buckets()
+
+    filters = {}
+    for queue, (search, field) in dated_queues.items():
+        # The queue searches are over different indices: each filter is
+        # limited to the doc types its search is over.
+        queue_filters = [
+            {'or': [{'type': {'value': doc_type}}
+                    for doc_type in search._doc_type]},
+            {'query': search.to_dict()['query']},
+        ]
+        filters[queue] = {'and': queue_filters}
+        for bucket, bounds in buckets.items():
+            date_range = dict((op, date) for op, date
+                              in zip(('gt', 'gte', 'lte', 'lt'), bounds)
+                              if date is not None)
+            filters['%s.%s' % (queue, bucket)] = {
+                'and': queue_filters + [{'range': {field: date_range}}]}
+
+    query = {
+        'aggregations': {
+            'queues': {
+                'filters': {
+                    'filters': filters
+                }
+            }
+        },
+        'size': 0
+    }
+    with statsd.timer('reviewers.queue_stats_es'):
+        res = WebappIndexer.get_es().search(
+            index=[settings.ES_INDEXES['homescreen'],
+                   settings.ES_INDEXES['webapp']],
+            doc_type=['homescreen', 'webapp'], body=query)
+
+    doc_counts = dict(
+        (key, bucket['doc_count']) for key, bucket
+        in res['aggregations']['queues']['buckets'].items())
+    counts = dict((queue, doc_counts[queue]) for queue in dated_queues)
+    progress = dict(
+        (queue, dict((bucket, doc_counts['%s.%s' % (queue, bucket)])
+                     for bucket in buckets))
+        for queue in dated_queues)
+    return {'counts': counts, 'progress': progress,
+            'percentage': _queue_percentage(progress)}
+
+
+def update_queue_stats(use_es=False):
+    """
+    Recompute the reviewer queue stats and cache them, see
+    `get_queue_stats()`.
+    """
+    if use_es:
+        stats = compute_queue_stats_es()
+        stats['counts'].update(_count_undated_queues())
+    else:
+        stats = compute_queue_stats()
+    if settings.REVIEWER_QUEUE_STATS_TIMEOUT:
+        cache.set(QUEUE_STATS_ES_KEY if use_es else QUEUE_STATS_KEY, stats,
+                  settings.REVIEWER_QUEUE_STATS_TIMEOUT)
+    return stats
+
+
+def get_queue_stats(use_es=False):
+    """
+    Return the reviewer queue stats, as a dict with:
+
+    - `counts`: the number of apps in each queue.
+    - `progress`: for the pending, homescreen, rereview, escalated and updates
+      queues, the number of apps that have been waiting for less than 5 days
+      (`new`), 5 to 10 days (`med`), more than 10 days (`old`) and less than
+      a week (`week`).
+    - `percentage`: the `new`, `med` and `old` progress of those queues as
+      percents of their total.
+
+    With `use_es`, the stats of the queues Elasticsearch can count come from
+    it, see `compute_queue_stats_es()`, and only the others from the
+    database. Both kinds of stats are cached, under their own key, until the
+    apps in the queues change, see
+    `mkt.reviewers.models.invalidate_queue_stats()`.
+    """
+    stats = None
+    if settings.REVIEWER_QUEUE_STATS_TIMEOUT:
+        stats = cache.get(QUEUE_STATS_ES_KEY if use_es else QUEUE_STATS_KEY)
+    if stats is None:
+        stats = update_queue_stats(use_es=use_es)
+    return stats
@@ -52,15 +52,16 @@ from mkt.regions.utils import parse_region
 from mkt.reviewers.forms import (ApiReviewersSearchForm, ApproveRegionForm,
                                  ModerateLogDetailForm, ModerateLogForm,
                                  MOTDForm, TestedOnFormSet)
-from mkt.reviewers.models import (QUEUE_TARAKO, SHOWCASE_TAG, AdditionalReview,
-                                  CannedResponse, ReviewerScore)
+from mkt.reviewers.models import (SHOWCASE_TAG, AdditionalReview,
+                                  CannedResponse, invalidate_queue_stats,
+                                  ReviewerScore)
 from mkt.reviewers.serializers import (AdditionalReviewSerializer,
                                        CannedResponseSerializer,
                                        ReviewerAdditionalReviewSerializer,
                                        ReviewerScoreSerializer,
                                        ReviewersESAppSerializer,
                                        ReviewingSerializer)
-from mkt.reviewers.utils import (AppsReviewing, ReviewApp,
+from mkt.reviewers.utils import (AppsReviewing, get_queue_stats, ReviewApp,
                                  ReviewersQueuesHelper, log_reviewer_action)
 from mkt.search.filters import (ReviewerSearchFormFilter, SearchQueryFilter,
                                 SortingFilter)
@@ -68,7 +69,7 @@ from mkt.search.views import SearchView
 from mkt.site.decorators import json_view, login_required, permission_required
 from mkt.site.helpers import absolutify, product_as_dict
 from mkt.site.mail import send_mail
-from mkt.site.utils import (JSONEncoder, days_ago, escape_all,
+from mkt.site.utils import (JSONEncoder, escape_all,
                             get_file_response, paginate, redirect_for_login,
                             smart_decode)
 from mkt.submit.forms import AppFeaturesForm
@@ -140,7 +141,7 @@ def home(request):
                  ('med', _('Passable (5 to 10 days)')),
                  ('old', _('Overdue (Over 10 days)')))
 
-    progress, percentage = _progress()
+    progress, percentage = _progress(request)
 
     data = context(
         request,
@@ -154,25 +155,22 @@ def home(request):
     return render(request, 'reviewers/home.html', data)
 
 
+def _queue_stats(request=None):
+    """
+    Return the reviewer queue stats, see `get_queue_stats()`. They are only
+    read once per request.
+    """
+    if request is not None and hasattr(request, '_queue_stats'):
+        return request._queue_stats
+    stats = get_queue_stats(
+        use_es=waffle.switch_is_active('reviewer-tools-elasticsearch'))
+    if request is not None:
+        request._queue_stats = stats
+    return stats
+
+
 def queue_counts(request):
-    use_es = waffle.switch_is_active('reviewer-tools-elasticsearch')
-    queues_helper = ReviewersQueuesHelper(use_es=use_es)
-
-    counts = {
-        'pending': queues_helper.get_pending_queue().count(),
-        'rereview': queues_helper.get_rereview_queue().count(),
-        'updates': queues_helper.get_updates_queue().count(),
-        'escalated': queues_helper.get_escalated_queue().count(),
-        'moderated': queues_helper.get_moderated_queue().count(),
-        'abuse': queues_helper.get_abuse_queue().count(),
-        'abusewebsites': queues_helper.get_abuse_queue_websites().count(),
-        'homescreen': queues_helper.get_homescreen_queue().count(),
-        'region_cn': Webapp.objects.pending_in_region(mkt.regions.CHN).count(),
-        'additional_tarako': (
-            AdditionalReview.objects
-                            .unreviewed(queue=QUEUE_TARAKO, and_approved=True)
-                            .count()),
-    }
+    counts = _queue_stats(request)['counts']
 
     rv = {}
     if isinstance(type, basestring):
@@ -183,60 +181,14 @@ def queue_counts(request):
     return rv
 
 
-def _progress():
+def _progress(request=None):
     """Returns unreviewed apps progress.
 
     Return the number of apps still unreviewed for a given period of time and
-    the percentage.
+    the percentage, see `get_queue_stats()`.
     """
-
-    queues_helper = ReviewersQueuesHelper()
-
-    base_filters = {
-        'pending': (queues_helper.get_pending_queue(),
-                    'nomination'),
-        'homescreen': (queues_helper.get_homescreen_queue(),
-                       'nomination'),
-        'rereview': (queues_helper.get_rereview_queue(),
-                     'created'),
-        'escalated': (queues_helper.get_escalated_queue(),
-                      'created'),
-        'updates': (queues_helper.get_updates_queue(),
-                    'nomination')
-    }
-
-    operators_and_values = {
-        'new': ('gt', days_ago(5)),
-        'med': ('range', (days_ago(10), days_ago(5))),
-        'old': ('lt', days_ago(10)),
-        'week': ('gte', days_ago(7))
-    }
-
-    types = base_filters.keys()
-    progress = {}
-
-    for t in types:
-        tmp = {}
-        base_query, field = base_filters[t]
-        for k in operators_and_values.keys():
-            operator, value = operators_and_values[k]
-            filter_ = {}
-            filter_['%s__%s' % (field, operator)] = value
-            tmp[k] = base_query.filter(**filter_).count()
-        progress[t] = tmp
-
-    def pct(p, t):
-        # Return the percent of (p)rogress out of (t)otal.
-        return (p / float(t)) * 100 if p > 0 else 0
-
-    percentage = {}
-    for t in types:
-        total = progress[t]['new'] + progress[t]['med'] + progress[t]['old']
-        percentage[t] = {}
-        for duration in ('new', 'med', 'old'):
-            percentage[t][duration] = pct(progress[t][duration], total)
-
-    return (progress, percentage)
+    stats = _queue_stats(request)
+    return (stats['progress'], stats['percentage'])
 
 
 def context(request, **kw):
@@ -451,6 +403,8 @@ def app_review(request, addon):
     if request.method == 'POST':
         post_save.send(sender=Webapp, instance=addon, created=False)
         post_save.send(sender=Version, instance=version, created=False)
+        # The status of the files changed too, without any signal.
+        invalidate_queue_stats()
         if getattr(addon, 'resend_version_changed_signal', False):
             version_changed.send(sender=addon)
             del addon.resend_version_changed_signal
@@ -0,0 +1,17 @@
+import commonware.log
+import cronjobs
+
+from mkt.search.indexers import flush_indexing_queue
+
+
+log = commonware.log.getLogger('z.cron')
+
+
+@cronjobs.register
+def flush_indexing_queue_cron():
+    """
+    Flush the indexing queue. Flushes are normally scheduled when ids are
+    queued, this catches anything left behind by a failed flush.
+    """
+    log.info('Flushing the indexing queue.')
+    flush_indexing_queue()
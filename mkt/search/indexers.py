@@ -1,7 +1,14 @@
+import collections
+import itertools
 import logging
 import sys
+import threading
+import uuid
+from multiprocessing.pool import ThreadPool
 
 from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
 
 import elasticsearch
 from celery import task
@@ -9,16 +16,49 @@ from elasticsearch import helpers
 from elasticsearch_dsl import Search
 
 import mkt
-from lib.es.models import Reindexing
+from lib.es.models import IndexingQueue, Reindexing
 from lib.post_request_task.task import task as post_request_task
 from mkt.constants.regions import MATURE_REGION_IDS
 from mkt.search.utils import get_boost
 from mkt.site.decorators import use_master
+from mkt.site.utils import chunked
 from mkt.translations.utils import to_language
 
 
 log = logging.getLogger('z.task')
 
+# 0 is a special region when considering popularity/trending, it's the one
+# holding the global value.
+ALL_REGIONS_ID = 0
+
+# Cache key flagging that a flush of the indexing queue has been scheduled.
+INDEXING_QUEUE_FLUSH_KEY = 'search:indexing-queue:flush-scheduled'
+
+
+# The threads sending the bulk requests, shared by every call to
+# `BaseIndexer.bulk()` in the process.
+_bulk_pool = None
+_bulk_pool_lock = threading.Lock()
+
+
+def _get_bulk_pool():
+    global _bulk_pool
+    with _bulk_pool_lock:
+        if _bulk_pool is None:
+            _bulk_pool = ThreadPool(settings.ES_BULK_MAX_IN_FLIGHT)
+    return _bulk_pool
+
+
+class IndexingError(Exception):
+    """
+    Raised by `index()` when Elasticsearch failed to index some of the
+    documents, the ids of their objects being in `ids`.
+    """
+
+    def __init__(self, message, ids):
+        super(IndexingError, self).__init__(message, ids)
+        self.ids = ids
+
 
 class BaseIndexer(object):
     """
@@ -28,6 +68,11 @@ class BaseIndexer(object):
     - get_mapping(cls)
     - extract_document(cls, pk=None, obj=None)
 
+    It can also override extract_documents(cls, objs) to build the documents
+    for a whole chunk of objects at once, and
+    extract_partial_documents(cls, objs) to have `update_partial()` only send
+    some of their fields.
+
     """
     _es = {}
 
@@ -36,9 +81,26 @@ class BaseIndexer(object):
     hidden_fields = ()
 
     # How many documents do we use when bulk indexing. The goal is to send
-    # about 2.5mb of data to Elasticsearch during bulk indexing.
+    # about 2.5mb of data to Elasticsearch during bulk indexing, which is
+    # enforced by settings.ES_BULK_MAX_BYTES.
     chunk_size = 500
 
+    # How many objects are fetched and extracted at once when streaming
+    # documents to Elasticsearch.
+    extract_chunk_size = 100
+
+    # Fields of the partial documents only sent by `update_partial()` for the
+    # documents that already have them: partial documents are merged into the
+    # indexed ones, and part of an object merged into a document that doesn't
+    # have it yet can make it invalid.
+    partial_existing_fields = ()
+
+    # Whether writing documents changes the generation of the index, see
+    # `bump_generation()`. Indexes written to all the time set it to False:
+    # the results cached from them are only invalidated when reindexing, and
+    # the cache timeouts bound how stale they get.
+    generation_per_write = True
+
     @classmethod
     def _key(cls, es_settings):
         """
@@ -84,16 +146,120 @@ class BaseIndexer(object):
 
     @classmethod
     def bulk_index(cls, documents, id_field='id', es=None, index=None):
-        """Index of a bunch of documents."""
+        """
+        Index of a bunch of documents.
+
+        `documents` can be any iterable, including a generator, see `bulk()`.
+        """
         es = es or cls.get_es()
         index = index or cls.get_index()
         type = cls.get_mapping_type_name()
 
-        actions = [
-            {'_index': index, '_type': type, '_id': d['id'], '_source': d}
-            for d in documents]
+        actions = (
+            {'_index': index, '_type': type, '_id': d[id_field], '_source': d}
+            for d in documents)
+
+        return cls.bulk(actions, es=es)
 
-        helpers.bulk(es, actions)
+    @classmethod
+    def bulk(cls, actions, es=None, ignore_not_found=False):
+        """
+        Send `actions` to Elasticsearch using the bulk API. Actions are dicts
+        in the format accepted by `elasticsearch.helpers.bulk()`.
+
+        `actions` can be any iterable, including a generator: actions are
+        serialized and sent as they are consumed, in requests of at most
+        `chunk_size` actions and settings.ES_BULK_MAX_BYTES bytes. At most
+        settings.ES_BULK_MAX_IN_FLIGHT requests are sent concurrently, from
+        threads shared by the whole process, and no more actions are consumed
+        until one of them has completed. A single request is sent directly.
+
+        Returns a `(success, errors)` tuple, `errors` being the list of the
+        items Elasticsearch failed to process, which are also logged. Errors
+        about documents not found when deleting or updating are ignored if
+        `ignore_not_found` is True.
+        """
+        es = es or cls.get_es()
+        max_in_flight = settings.ES_BULK_MAX_IN_FLIGHT
+        pending = collections.deque()
+        success, errors = 0, []
+
+        def process(response):
+            ok, failed = cls._process_bulk_response(
+                response, ignore_not_found=ignore_not_found)
+            errors.extend(failed)
+            return ok
+
+        bodies = cls._bulk_bodies(actions, es.transport.serializer)
+        first_bodies = list(itertools.islice(bodies, 2))
+        if len(first_bodies) < 2:
+            # A single request, like most indexing tasks send: no need for
+            # the threads.
+            for body in first_bodies:
+                success += process(es.bulk(body))
+            return success, errors
+
+        pool = _get_bulk_pool()
+        try:
+            for body in itertools.chain(first_bodies, bodies):
+                if len(pending) >= max_in_flight:
+                    success += process(pending.popleft().get())
+                pending.append(pool.apply_async(es.bulk, (body,)))
+            while pending:
+                success += process(pending.popleft().get())
+        finally:
+            # Don't leave requests in flight if something failed.
+            for result in pending:
+                result.wait()
+
+        return success, errors
+
+    @classmethod
+    def _bulk_bodies(cls, actions, serializer):
+        """
+        Serialize `actions` into bulk request bodies of at most `chunk_size`
+        actions and settings.ES_BULK_MAX_BYTES bytes (an action bigger than
+        that is sent on its own).
+        """
+        lines, size, count = [], 0, 0
+        for action in actions:
+            action, data = helpers.expand_action(action)
+            action_lines = [serializer.dumps(action)]
+            if data is not None:
+                action_lines.append(serializer.dumps(data))
+            action_size = sum(len(line) + 1 for line in action_lines)
+
+            if lines and (count >= cls.chunk_size or
+                          size + action_size > settings.ES_BULK_MAX_BYTES):
+                yield '\n'.join(lines) + '\n'
+                lines, size, count = [], 0, 0
+
+            lines.extend(action_lines)
+            size += action_size
+            count += 1
+
+        if lines:
+            yield '\n'.join(lines) + '\n'
+
+    @classmethod
+    def _process_bulk_response(cls, response, ignore_not_found=False):
+        """
+        Go through the items of a bulk response, returning a `(success,
+        errors)` tuple and logging every failed item.
+        """
+        success, errors = 0, []
+        for item in response['items']:
+            op_type, result = item.items()[0]
+            status = result.get('status', 500)
+            if 200 <= status < 300 or (ignore_not_found and status == 404 and
+                                       op_type in ('delete', 'update')):
+                success += 1
+                continue
+            errors.append(item)
+            log.error(u'[%s:%s] Failed to %s document in %s: %s' % (
+                result.get('_type'), result.get('_id'), op_type,
+                result.get('_index'), result.get('error')))
+        return success, errors
 
     @classmethod
     def index_ids(cls, ids, no_delay=False):
@@ -106,6 +272,22 @@ class BaseIndexer(object):
         else:
             index.delay(ids, cls)
 
+    @classmethod
+    def queue_index_ids(cls, ids):
+        """
+        Queue instances of indexer class matching the IDs for indexing.
+
+        Queued IDs are indexed in bulk, at most settings.ES_INDEX_QUEUE_DELAY
+        seconds later, coalescing the updates made to the same objects in the
+        meantime. If that setting is 0, the IDs are indexed right away.
+
+        IDs are queued once the request is finished, see `queue_index`.
+        """
+        if not settings.ES_INDEX_QUEUE_DELAY:
+            return cls.index_ids(ids)
+
+        queue_index.delay(ids, cls)
+
     @classmethod
     def unindex(cls, id_, es=None, index=None):
         """
@@ -114,6 +296,30 @@ class BaseIndexer(object):
         es = es or cls.get_es()
         index = index or cls.get_index()
         es.delete(index=index, doc_type=cls.get_mapping_type_name(), id=id_)
+        cls.documents_written()
+
+    @classmethod
+    def get_generation_key(cls):
+        return 'search:generation:%s' % cls.get_mapping_type_name()
+
+    @classmethod
+    def bump_generation(cls):
+        """
+        Change the generation of the index, so that cached search results
+        keyed on it are not used anymore. It changes when the index is
+        reindexed, and when documents are written to it if
+        `generation_per_write` is True.
+        """
+        cache.set(cls.get_generation_key(), uuid.uuid4().hex, None)
+
+    @classmethod
+    def documents_written(cls):
+        """
+        Called once documents were indexed, updated or unindexed outside of a
+        reindexation.
+        """
+        if cls.generation_per_write:
+            cls.bump_generation()
 
     @classmethod
     def refresh_index(cls, es=None, index=None):
@@ -263,6 +469,8 @@ class BaseIndexer(object):
 
         ids -- list of IDs to unindex.
         _all -- unindex all objects.
+
+        Returns the `(success, errors)` tuple of `bulk()`.
         """
         if _all:
             # Mostly used for test tearDowns.
@@ -273,7 +481,7 @@ class BaseIndexer(object):
                 qs = qs.objects
             ids = list(qs.order_by('id').values_list('id', flat=True))
         if not ids:
-            return
+            return 0, []
 
         log.info('Unindexing %s %s-%s. [%s]' %
                  (cls.get_model()._meta.model_name, ids[0], ids[-1],
@@ -283,38 +491,128 @@ class BaseIndexer(object):
         # Note: If reindexing is currently occurring, `get_indices` will return
         # more than one index.
         indices = Reindexing.get_indices(index)
+        doc_type = cls.get_mapping_type_name()
 
+        # Delete from every index in one go, ignoring objects that are not
+        # there.
         es = cls.get_es(urls=settings.ES_URLS)
-        for id_ in ids:
-            for idx in indices:
-                try:
-                    cls.unindex(id_=id_, es=es, index=idx)
-                except elasticsearch.exceptions.NotFoundError:
-                    # Ignore if it's not there.
-                    log.info(u'[%s:%s] object not found in index' %
-                             (cls.get_model()._meta.model_name, id_))
+        actions = ({'_op_type': 'delete', '_index': idx, '_type': doc_type,
+                    '_id': id_} for id_ in ids for idx in indices)
+        result = cls.bulk(actions, es=es, ignore_not_found=True)
+        cls.documents_written()
+        return result
 
     @classmethod
     def run_indexing(cls, ids, ES, index=None, **kw):
-        """Used in reindex."""
+        """
+        Used in reindex. Returns the `(success, errors)` tuple of `bulk()`.
+        """
         sys.stdout.write('Indexing {0} {1}\n'.format(
             len(ids), cls.get_model()._meta.model_name))
 
-        # Fetch QS given the IDs.
-        docs = []
-        qs = cls.get_model().objects.filter(id__in=ids)
+        # Stream the documents to Elasticsearch as they are extracted.
+        return cls.bulk_index(cls.iter_documents(ids), es=ES,
+                              index=index or cls.get_index())
+
+    @classmethod
+    def iter_documents(cls, ids, qs=None):
+        """
+        Generator yielding the documents of the objects matching `ids`.
+
+        Objects are fetched from `qs` (defaulting to the model's default
+        manager) and extracted `extract_chunk_size` at a time, so that memory
+        use does not depend on the number of ids.
+        """
+        if qs is None:
+            qs = cls.get_model().objects
+        for chunk in chunked(ids, cls.extract_chunk_size):
+            for doc in cls.extract_documents(list(qs.filter(id__in=chunk))):
+                yield doc
+
+    @classmethod
+    def extract_documents(cls, objs):
+        """
+        Extracts the documents for a list of objects.
 
-        # For each object, extract document.
-        for obj in qs:
+        Objects for which the extraction fails are logged and skipped. The
+        default implementation simply calls `extract_document()` for each
+        object, indexers can override it to fetch related data for all the
+        objects at once.
+        """
+        docs = []
+        for obj in objs:
             try:
                 docs.append(cls.extract_document(obj.id, obj=obj))
             except Exception as e:
-                sys.stdout.write('Failed to index {0} {1}: {2}\n'.format(
-                    cls.get_model()._meta.model_name, obj.id, e))
+                log.error('Failed to index {0} {1}: {2}'.format(
+                    cls.get_model()._meta.model_name, obj.id, repr(e)))
+        return docs
+
+    @classmethod
+    def extract_partial_documents(cls, objs):
+        """
+        Extracts partial documents for a list of objects, holding only the
+        fields that change without the objects themselves changing (like
+        popularity and trending), and the `id` of the object.
 
-        # Index.
-        if docs:
-            cls.bulk_index(docs, es=ES, index=index or cls.get_index())
+        Used by `update_partial()`. The default implementation returns the
+        full documents, indexers can override it to extract only those
+        fields.
+        """
+        return cls.extract_documents(objs)
+
+    @classmethod
+    def update_partial(cls, ids, es=None, qs=None):
+        """
+        Update the fields of the documents matching `ids` returned by
+        `extract_partial_documents()`, in every index in use, with bulk
+        `update` actions: the rest of the documents is left untouched, which
+        is a lot cheaper than extracting and indexing them in full.
+
+        Objects are fetched from `qs` (defaulting to the model's default
+        manager) `extract_chunk_size` at a time. Documents that are not in
+        the index are skipped, indexing them will include those fields. The
+        `partial_existing_fields` are only sent for the documents that
+        already have them in the index.
+        """
+        if qs is None:
+            qs = cls.get_model().objects
+        es = es or cls.get_es()
+        # If reindexing is currently occurring, update both old and new
+        # indexes.
+        indices = Reindexing.get_indices(cls.get_index())
+        doc_type = cls.get_mapping_type_name()
+
+        def get_existing_fields(idx, docs):
+            # Map the ids of `docs` to the `partial_existing_fields` their
+            # document in `idx` has.
+            if not any(field in doc for doc in docs
+                       for field in cls.partial_existing_fields):
+                return {}
+            res = es.mget(index=idx, doc_type=doc_type,
+                          body={'ids': [doc['id'] for doc in docs]},
+                          _source_include=list(cls.partial_existing_fields))
+            return dict((int(d['_id']), set(d.get('_source', {})))
+                        for d in res['docs'] if d.get('found'))
+
+        def actions():
+            for chunk in chunked(ids, cls.extract_chunk_size):
+                docs = cls.extract_partial_documents(
+                    list(qs.filter(id__in=chunk)))
+                for idx in indices:
+                    existing_fields = get_existing_fields(idx, docs)
+                    for doc in docs:
+                        doc = dict(
+                            (field, value) for field, value in doc.items()
+                            if field not in cls.partial_existing_fields or
+                            field in existing_fields.get(doc['id'], ()))
+                        yield {'_op_type': 'update', '_index': idx,
+                               '_type': doc_type, '_id': doc['id'],
+                               'doc': doc}
+
+        result = cls.bulk(actions(), es=es, ignore_not_found=True)
+        cls.documents_written()
+        return result
 
     @classmethod
     def attach_boost_mapping(cls, mapping):
@@ -415,23 +713,56 @@ class BaseIndexer(object):
         return mapping
 
     @classmethod
-    def extract_popularity_trending_boost(cls, obj):
-        # 0 is a special region when considering popularity/trending, it's the
-        # one holding the global value.
-        ALL_REGIONS_ID = 0
+    def get_popularity_trending_by_id(cls, objs):
+        """
+        Bulk version of the lookups made by
+        `extract_popularity_trending_boost()`.
+
+        Returns a `(trending, popularity)` tuple of dicts mapping the id of
+        each object in `objs` to a {region: value} dict, using one query for
+        each.
+        """
+        ids = [obj.id for obj in objs]
+        model = cls.get_model()
+        values = []
+        for prop in ('trending', 'popularity'):
+            related = getattr(model, prop).related
+            by_id = dict((pk, {}) for pk in ids)
+            if ids:
+                qs = (related.model.objects
+                      .filter(region__in=MATURE_REGION_IDS + [ALL_REGIONS_ID],
+                              **{'%s__in' % related.field.name: ids})
+                      .values_list(related.field.attname, 'region', 'value'))
+                for pk, region, value in qs:
+                    by_id[pk][region] = value
+            values.append(by_id)
+        return tuple(values)
+
+    @classmethod
+    def extract_popularity_trending_boost(cls, obj, trending=None,
+                                          popularity=None):
+        """
+        Returns a dict with the boost, popularity and trending values for the
+        given obj.
 
-        def get_dict(obj, prop):
+        `trending` and `popularity` can be passed as {region: value} dicts
+        (see `get_popularity_trending_by_id()`) to avoid querying for them.
+        """
+        def get_dict(obj, prop, prefetched):
             if obj.is_dummy_content_for_qa():
                 return {}
+            if prefetched is not None:
+                return prefetched
             qs = getattr(obj, prop).filter(
                 region__in=MATURE_REGION_IDS + [ALL_REGIONS_ID])
             return dict(qs.values_list('region', 'value'))
 
+        trending = get_dict(obj, 'trending', trending)
+        popularity = get_dict(obj, 'popularity', popularity)
         extend = {
-            'boost': get_boost(obj),
+            'boost': get_boost(
+                obj, popularity=popularity.get(ALL_REGIONS_ID, 0)),
         }
-        trending = get_dict(obj, 'trending')
-        popularity = get_dict(obj, 'popularity')
 
         # Global popularity.
         extend['trending'] = trending.get(ALL_REGIONS_ID, 0)
@@ -506,15 +837,99 @@ def index(ids, indexer, **kw):
     """
     Given a list of IDs and an indexer, index into ES.
     If an reindexation is currently occurring, index on both the old and new.
+
+    Raises `IndexingError` if Elasticsearch failed to index some documents.
     """
     log.info('Indexing {0} {1}-{2}. [{3}]'.format(
         indexer.get_model()._meta.model_name, ids[0], ids[-1], len(ids)))
 
     # If reindexing is currently occurring, index on both old and new indexes.
     indices = Reindexing.get_indices(indexer.get_index())
+    doc_type = indexer.get_mapping_type_name()
 
+    # Send all the documents to every index in one bulk request.
     es = indexer.get_es(urls=settings.ES_URLS)
-    for obj in indexer.get_indexable().filter(id__in=ids):
-        doc = indexer.extract_document(obj.id, obj)
-        for idx in indices:
-            indexer.index(doc, id_=obj.id, es=es, index=idx)
+    docs = indexer.extract_documents(
+        list(indexer.get_indexable().filter(id__in=ids)))
+    actions = ({'_index': idx, '_type': doc_type, '_id': doc['id'],
+                '_source': doc} for doc in docs for idx in indices)
+    success, errors = indexer.bulk(actions, es=es)
+    if errors:
+        failed_ids = sorted(set(int(item.values()[0]['_id'])
+                                for item in errors))
+        raise IndexingError('Failed to index %s %s.' % (doc_type, failed_ids),
+                            failed_ids)
+    indexer.documents_written()
+
+
+def get_generations(indexers):
+    """
+    Return the current generations of the indexes of `indexers`, in order,
+    to build the keys of cached search results. See
+    BaseIndexer.bump_generation().
+    """
+    keys = [indexer.get_generation_key() for indexer in indexers]
+    generations = cache.get_many(keys)
+    missing = dict((key, uuid.uuid4().hex) for key in keys
+                   if key not in generations)
+    if missing:
+        # Evicted or never bumped: start a new generation, results cached
+        # under any previous one may be stale.
+        cache.set_many(missing, None)
+        generations.update(missing)
+    return [generations[key] for key in keys]
+
+
+@post_request_task
+def queue_index(ids, indexer, **kw):
+    """
+    Add `ids` to the indexing queue of `indexer` and schedule a flush of the
+    queue.
+
+    This runs after the request, once its transaction is committed: IDs that
+    are already queued aren't queued again, a flush popping them before the
+    commit would index the data from before the transaction and nothing
+    would index the changes.
+    """
+    IndexingQueue.queue('%s.%s' % (indexer.__module__, indexer.__name__), ids)
+    _schedule_indexing_queue_flush()
+
+
+def _schedule_indexing_queue_flush():
+    """Schedule a flush of the indexing queue, unless one already is."""
+    delay = settings.ES_INDEX_QUEUE_DELAY
+    if cache.add(INDEXING_QUEUE_FLUSH_KEY, True, delay):
+        flush_indexing_queue.apply_async(countdown=delay)
+
+
+@task
+def flush_indexing_queue(**kw):
+    """
+    Index everything in the indexing queue, in chunks of `chunk_size` ids for
+    each indexer.
+
+    The ids that failed to be indexed are queued again, and another flush is
+    scheduled for them.
+    """
+    # Anything queued from now on needs another flush.
+    cache.delete(INDEXING_QUEUE_FLUSH_KEY)
+
+    failed = False
+    for indexer_path, ids in IndexingQueue.pop().items():
+        indexer = import_string(indexer_path)
+        for chunk in chunked(sorted(ids), indexer.chunk_size):
+            try:
+                index(chunk, indexer)
+            except IndexingError as e:
+                log.error('Failed to index queued %s ids %s, queuing them '
+                          'again.' % (indexer.__name__, e.ids))
+                IndexingQueue.queue(indexer_path, e.ids)
+                failed = True
+            except Exception:
+                log.exception('Failed to index queued %s ids, queuing them '
+                              'again.' % indexer.__name__)
+                IndexingQueue.queue(indexer_path, chunk)
+                failed = True
+
+    if failed:
+        _schedule_indexing_queue_flush()
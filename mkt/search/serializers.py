@@ -1,9 +1,13 @@
+from collections import OrderedDict
 from datetime import date, datetime
 
+from django.conf import settings
+
 from rest_framework import serializers
 
 from mkt.api.fields import (ESTranslationSerializerField,
                             TranslationSerializerField)
+from mkt.site.utils import cached_property
 
 
 def es_to_datetime(value):
@@ -100,6 +104,67 @@ class BaseESSerializer(serializers.ModelSerializer):
         return es_to_datetime(value)
 
 
+class BaseESDictSerializer(serializers.Serializer):
+    """
+    A base serializer that builds the representation of ElasticSearch data
+    directly from the ES document, without going through a fake instance of
+    the model.
+
+    Subclasses list the fields to serialize in `Meta.fields`, the value of
+    each field is returned by the `get_<field name>(data)` method.
+    """
+    class Meta:
+        fields = []
+
+    def to_representation(self, data):
+        data = (data._source if hasattr(data, '_source') else
+                data.get('_source', data))
+        return OrderedDict((field_name,
+                            getattr(self, 'get_%s' % field_name)(data))
+                           for field_name in self.Meta.fields)
+
+    @cached_property
+    def requested_language(self):
+        request = self.context.get('request', None)
+        if request and request.method == 'GET' and 'lang' in request.GET:
+            return request.GET['lang']
+
+    def get_translations(self, data, field_name, default_locale=None):
+        """
+        Return the translations of `field_name` stored in `data` like
+        ESTranslationSerializerField does: a dict with all translations, or
+        a single one if a language was requested.
+        """
+        translations = dict(
+            (v.get('lang', ''), v.get('string', ''))
+            for v in data.get(field_name + ESTranslationSerializerField.suffix,
+                              {}) or {})
+        if not translations:
+            return None
+        if self.requested_language:
+            return (translations.get(self.requested_language) or
+                    translations.get(default_locale) or
+                    translations.get(settings.LANGUAGE_CODE) or None)
+        return translations
+
+    def to_datetime(self, value):
+        return es_to_datetime(value)
+
+    def to_text(self, value):
+        """Like serializers.CharField."""
+        return None if value is None else unicode(value)
+
+    def to_boolean(self, value):
+        """Like serializers.BooleanField."""
+        if value is None:
+            return None
+        if value in serializers.BooleanField.TRUE_VALUES:
+            return True
+        if value in serializers.BooleanField.FALSE_VALUES:
+            return False
+        return bool(value)
+
+
 class DynamicSearchSerializer(serializers.Serializer):
     def __init__(self, *a, **kwargs):
         super(DynamicSearchSerializer, self).__init__(*a, **kwargs)
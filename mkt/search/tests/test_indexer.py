@@ -1,7 +1,15 @@
-from nose.tools import eq_
+import json
 
-from mkt.search.indexers import BaseIndexer
+import mock
+from elasticsearch.serializer import JSONSerializer
+from nose.tools import eq_, ok_
+
+from lib.es.models import IndexingQueue
+from lib.post_request_task import task as post_request_task
+from mkt.search.indexers import (BaseIndexer, flush_indexing_queue,
+                                 get_generations, index, IndexingError)
 from mkt.site.tests import TestCase
+from mkt.webapps.indexers import WebappIndexer
 
 
 class TestBaseIndexer(TestCase):
@@ -13,3 +21,280 @@ class TestBaseIndexer(TestCase):
         es1 = self.indexer().get_es()
         es2 = self.indexer().get_es()
         eq_(id(es1), id(es2))
+
+    @mock.patch.object(BaseIndexer, 'extract_documents')
+    def test_extract_partial_documents(self, extract_documents_mock):
+        extract_documents_mock.return_value = [{'id': 1, 'name': 'foo'}]
+        eq_(self.indexer.extract_partial_documents(['obj']),
+            [{'id': 1, 'name': 'foo'}])
+        extract_documents_mock.assert_called_with(['obj'])
+
+
+@mock.patch('mkt.search.indexers.Reindexing.get_indices',
+            mock.Mock(return_value=['old', 'new']))
+@mock.patch.object(WebappIndexer, 'bulk')
+class TestBulkWrites(TestCase):
+
+    def actions(self, bulk_mock):
+        return list(bulk_mock.call_args[0][0])
+
+    @mock.patch.object(WebappIndexer, 'extract_documents')
+    def test_index(self, extract_documents_mock, bulk_mock):
+        extract_documents_mock.return_value = [{'id': 1}, {'id': 2}]
+        bulk_mock.return_value = (4, [])
+        index([1, 2], WebappIndexer)
+        eq_(bulk_mock.call_count, 1)
+        eq_(self.actions(bulk_mock), [
+            {'_index': idx, '_type': 'webapp', '_id': pk,
+             '_source': {'id': pk}}
+            for pk in (1, 2) for idx in ('old', 'new')])
+
+    @mock.patch.object(WebappIndexer, 'extract_documents')
+    def test_index_errors(self, extract_documents_mock, bulk_mock):
+        extract_documents_mock.return_value = [{'id': 1}, {'id': 2}]
+        bulk_mock.return_value = (2, [
+            {'index': {'_index': idx, '_id': '2', 'status': 500}}
+            for idx in ('old', 'new')])
+        with self.assertRaises(IndexingError) as context:
+            index([1, 2], WebappIndexer)
+        eq_(context.exception.ids, [2])
+
+    def test_unindexer(self, bulk_mock):
+        WebappIndexer.unindexer([1, 2])
+        eq_(bulk_mock.call_count, 1)
+        eq_(self.actions(bulk_mock), [
+            {'_op_type': 'delete', '_index': idx, '_type': 'webapp',
+             '_id': pk}
+            for pk in (1, 2) for idx in ('old', 'new')])
+        eq_(bulk_mock.call_args[1]['ignore_not_found'], True)
+
+    @mock.patch.object(WebappIndexer, 'extract_partial_documents')
+    def test_update_partial(self, extract_partial_documents_mock, bulk_mock):
+        extract_partial_documents_mock.return_value = [
+            {'id': 1, 'boost': 1.0}, {'id': 2, 'boost': 2.0}]
+        WebappIndexer.update_partial([1, 2])
+        eq_(bulk_mock.call_count, 1)
+        eq_(self.actions(bulk_mock), [
+            {'_op_type': 'update', '_index': idx, '_type': 'webapp',
+             '_id': pk, 'doc': {'id': pk, 'boost': float(pk)}}
+            for pk in (1, 2) for idx in ('old', 'new')])
+        eq_(bulk_mock.call_args[1]['ignore_not_found'], True)
+
+    @mock.patch.object(WebappIndexer, 'extract_partial_documents')
+    def test_update_partial_existing_fields(self,
+                                            extract_partial_documents_mock,
+                                            bulk_mock):
+        extract_partial_documents_mock.return_value = [
+            {'id': pk, 'boost': 1.0, 'name_suggest': {'weight': 1}}
+            for pk in (1, 2, 3)]
+        es = mock.Mock()
+        # Only app 1 has a suggestion in the old index, and app 2 in the new
+        # one. App 3 isn't indexed.
+        es.mget.side_effect = lambda index, **kw: {'docs': [
+            {'_id': '1', 'found': True,
+             '_source': {'name_suggest': {'input': ['foo'], 'weight': 0}}
+             if index == 'old' else {}},
+            {'_id': '2', 'found': True,
+             '_source': {'name_suggest': {'input': ['bar'], 'weight': 0}}
+             if index == 'new' else {}},
+            {'_id': '3', 'found': False}]}
+        WebappIndexer.update_partial([1, 2, 3], es=es)
+        eq_(es.mget.call_args[1]['body'], {'ids': [1, 2, 3]})
+        eq_(es.mget.call_args[1]['_source_include'], ['name_suggest'])
+        eq_(dict(((action['_index'], action['_id']),
+                  'name_suggest' in action['doc'])
+                 for action in self.actions(bulk_mock)),
+            {('old', 1): True, ('old', 2): False, ('old', 3): False,
+             ('new', 1): False, ('new', 2): True, ('new', 3): False})
+
+
+@mock.patch.object(WebappIndexer, 'generation_per_write', True)
+class TestGenerations(TestCase):
+
+    @mock.patch.object(WebappIndexer, 'bulk',
+                       mock.Mock(return_value=(0, [])))
+    @mock.patch.object(WebappIndexer, 'extract_documents',
+                       mock.Mock(return_value=[]))
+    def test_index_bumps(self):
+        generation = get_generations([WebappIndexer])
+        eq_(get_generations([WebappIndexer]), generation)
+        index([1], WebappIndexer)
+        ok_(get_generations([WebappIndexer]) != generation)
+
+    @mock.patch.object(WebappIndexer, 'bulk', mock.Mock())
+    def test_unindexer_bumps(self):
+        generation = get_generations([WebappIndexer])
+        WebappIndexer.unindexer([1])
+        ok_(get_generations([WebappIndexer]) != generation)
+
+    @mock.patch.object(WebappIndexer, 'bulk', mock.Mock())
+    def test_update_partial_bumps(self):
+        generation = get_generations([WebappIndexer])
+        WebappIndexer.update_partial([1])
+        ok_(get_generations([WebappIndexer]) != generation)
+
+    @mock.patch.object(WebappIndexer, 'generation_per_write', False)
+    @mock.patch.object(WebappIndexer, 'bulk',
+                       mock.Mock(return_value=(0, [])))
+    @mock.patch.object(WebappIndexer, 'extract_documents',
+                       mock.Mock(return_value=[]))
+    def test_not_per_write(self):
+        generation = get_generations([WebappIndexer])
+        index([1], WebappIndexer)
+        WebappIndexer.unindexer([1])
+        WebappIndexer.update_partial([1])
+        eq_(get_generations([WebappIndexer]), generation)
+
+    def test_per_indexer(self):
+        from mkt.websites.indexers import WebsiteIndexer
+        webapp, website = get_generations([WebappIndexer, WebsiteIndexer])
+        WebsiteIndexer.bump_generation()
+        eq_(get_generations([WebappIndexer])[0], webapp)
+        ok_(get_generations([WebsiteIndexer])[0] != website)
+
+
+class TestIndexingQueue(TestCase):
+
+    def setUp(self):
+        self.indexer = BaseIndexer
+        self.path = 'mkt.search.indexers.BaseIndexer'
+
+    @mock.patch.object(BaseIndexer, 'index_ids')
+    def test_no_delay(self, index_ids_mock):
+        with self.settings(ES_INDEX_QUEUE_DELAY=0):
+            self.indexer.queue_index_ids([1, 2])
+        index_ids_mock.assert_called_with([1, 2])
+        eq_(IndexingQueue.objects.count(), 0)
+
+    @mock.patch('mkt.search.indexers.flush_indexing_queue.apply_async')
+    def test_queue(self, apply_async_mock):
+        with self.settings(ES_INDEX_QUEUE_DELAY=30):
+            self.indexer.queue_index_ids([1, 2])
+            self.indexer.queue_index_ids([2, 3])
+            # Nothing is queued until the request is finished.
+            eq_(IndexingQueue.objects.count(), 0)
+            post_request_task._send_tasks()
+        eq_(sorted(IndexingQueue.objects.filter(indexer=self.path)
+                   .values_list('object_id', flat=True)), [1, 2, 3])
+        # Only one flush is scheduled for both.
+        apply_async_mock.assert_called_once_with(countdown=30)
+
+    @mock.patch('mkt.search.indexers.index')
+    def test_flush(self, index_mock):
+        IndexingQueue.queue(self.path, [3, 1, 2])
+        with mock.patch.object(BaseIndexer, 'chunk_size', 2):
+            flush_indexing_queue()
+        eq_(index_mock.call_args_list,
+            [mock.call([1, 2], BaseIndexer), mock.call([3], BaseIndexer)])
+        eq_(IndexingQueue.objects.count(), 0)
+
+    @mock.patch('mkt.search.indexers.flush_indexing_queue.apply_async')
+    @mock.patch('mkt.search.indexers.index')
+    def test_flush_failure(self, index_mock, apply_async_mock):
+        index_mock.side_effect = Exception
+        IndexingQueue.queue(self.path, [1])
+        with self.settings(ES_INDEX_QUEUE_DELAY=30):
+            flush_indexing_queue()
+        eq_(list(IndexingQueue.objects.values_list('object_id', flat=True)),
+            [1])
+        apply_async_mock.assert_called_once_with(countdown=30)
+
+    @mock.patch('mkt.search.indexers.flush_indexing_queue.apply_async')
+    @mock.patch('mkt.search.indexers.index')
+    def test_flush_indexing_errors(self, index_mock, apply_async_mock):
+        index_mock.side_effect = IndexingError('Failed', [2])
+        IndexingQueue.queue(self.path, [1, 2])
+        with self.settings(ES_INDEX_QUEUE_DELAY=30):
+            flush_indexing_queue()
+        # Only the ids Elasticsearch failed to index are queued again.
+        eq_(list(IndexingQueue.objects.values_list('object_id', flat=True)),
+            [2])
+        apply_async_mock.assert_called_once_with(countdown=30)
+
+
+class TestBulk(TestCase):
+
+    def setUp(self):
+        self.es = mock.Mock()
+        self.es.transport.serializer = JSONSerializer()
+        self.es.bulk.side_effect = self._bulk_response
+        self.bodies = []
+
+    def _bulk_response(self, body):
+        self.bodies.append(body)
+        lines = [json.loads(line) for line in body.splitlines()]
+        items = []
+        for line in lines:
+            if '_source' in line or 'foo' in line:
+                continue
+            op_type, meta = line.items()[0]
+            meta['status'] = 404 if meta['_id'] == 404 else 200
+            items.append({op_type: meta})
+        return {'items': items}
+
+    def _actions(self, n, op_type='index'):
+        return [{'_op_type': op_type, '_index': 'idx', '_type': 'doc',
+                 '_id': i, '_source': {'foo': 'x' * 10}} for i in range(n)]
+
+    def test_chunk_size(self):
+        with mock.patch.object(BaseIndexer, 'chunk_size', 2):
+            eq_(BaseIndexer.bulk(self._actions(5), es=self.es), (5, []))
+        eq_(len(self.bodies), 3)
+
+    @mock.patch('mkt.search.indexers._get_bulk_pool')
+    def test_single_request(self, get_bulk_pool_mock):
+        eq_(BaseIndexer.bulk(self._actions(2), es=self.es), (2, []))
+        eq_(len(self.bodies), 1)
+        ok_(not get_bulk_pool_mock.called)
+
+    def test_pool_reused(self):
+        with mock.patch.object(BaseIndexer, 'chunk_size', 1):
+            BaseIndexer.bulk(self._actions(2), es=self.es)
+            with mock.patch('mkt.search.indexers.ThreadPool') as pool_mock:
+                eq_(BaseIndexer.bulk(self._actions(3), es=self.es), (3, []))
+        ok_(not pool_mock.called)
+        eq_(len(self.bodies), 5)
+
+    def test_max_bytes(self):
+        with self.settings(ES_BULK_MAX_BYTES=100):
+            eq_(BaseIndexer.bulk(self._actions(4), es=self.es), (4, []))
+        eq_(len(self.bodies), 4)
+        for body in self.bodies:
+            ok_(len(body) <= 100)
+
+    def test_generator(self):
+        actions = iter(self._actions(3))
+        eq_(BaseIndexer.bulk(actions, es=self.es), (3, []))
+
+    @mock.patch('mkt.search.indexers.log')
+    def test_errors(self, log_mock):
+        actions = self._actions(3) + [{'_op_type': 'delete', '_index': 'idx',
+                                       '_type': 'doc', '_id': 404}]
+        success, errors = BaseIndexer.bulk(actions, es=self.es)
+        eq_(success, 3)
+        eq_(len(errors), 1)
+        eq_(errors[0]['delete']['_id'], 404)
+        eq_(log_mock.error.call_count, 1)
+
+    def test_ignore_not_found(self):
+        actions = [{'_op_type': 'delete', '_index': 'idx', '_type': 'doc',
+                    '_id': 404}]
+        eq_(BaseIndexer.bulk(actions, es=self.es, ignore_not_found=True),
+            (1, []))
+
+    def test_ignore_not_found_update(self):
+        actions = [{'_op_type': 'update', '_index': 'idx', '_type': 'doc',
+                    '_id': 404, 'doc': {'foo': 'bar'}}]
+        eq_(BaseIndexer.bulk(actions, es=self.es, ignore_not_found=True),
+            (1, []))
+
+    def test_bulk_index(self):
+        docs = ({'id': i, 'foo': 'bar'} for i in range(3))
+        with mock.patch.object(BaseIndexer, 'get_mapping_type_name',
+                               return_value='doc'):
+            eq_(BaseIndexer.bulk_index(docs, es=self.es, index='idx'),
+                (3, []))
+        eq_(len(self.bodies), 1)
+        lines = [json.loads(line) for line in self.bodies[0].splitlines()]
+        eq_(lines[0], {'index': {'_index': 'idx', '_type': 'doc', '_id': 0}})
+        eq_(lines[1], {'id': 0, 'foo': 'bar'})
@@ -1,12 +1,14 @@
 from math import log10
 
+from elasticsearch import TransportError
 from mock import Mock
-from nose.tools import eq_
+from nose.tools import eq_, ok_
 
 from mkt.constants.base import STATUS_REJECTED
 from mkt.site.tests import TestCase
 from mkt.site.utils import app_factory
-from mkt.search.utils import get_boost, get_popularity, get_trending
+from mkt.search.utils import (BatchedSearch, get_boost, get_popularity,
+                              get_trending, multi_search)
 from mkt.websites.utils import website_factory
 
 
@@ -71,3 +73,43 @@ class TestSearchUtils(TestCase):
         website = website_factory()
         website.popularity.create(region=0, value=1000.0)
         eq_(get_boost(website), log10(1 + 1000) * 4)
+
+
+class TestMultiSearch(TestCase):
+
+    def setUp(self):
+        self.es = Mock()
+        self.es.msearch.return_value = {'responses': [
+            {'took': 1, 'hits': {'total': 1, 'hits': [
+                {'_id': '1', '_source': {'id': 1}}]}},
+            {'took': 2, 'hits': {'total': 0, 'hits': []}},
+        ]}
+
+    def test_multi_search(self):
+        first = BatchedSearch(using=self.es, index='first', doc_type='doc')
+        second = BatchedSearch(using=self.es).query('term', tags='foo')
+        responses = multi_search([first, second], self.es)
+        eq_(self.es.msearch.call_count, 1)
+        eq_(self.es.msearch.call_args[1]['body'], [
+            {'index': ['first'], 'type': ['doc']}, first.to_dict(),
+            {}, second.to_dict()])
+        eq_(responses[0].hits.total, 1)
+        eq_(responses[0].hits[0].id, 1)
+        eq_(responses[1].hits.total, 0)
+
+    def test_error(self):
+        self.es.msearch.return_value['responses'][1] = {'error': 'oops'}
+        with self.assertRaises(TransportError):
+            multi_search([BatchedSearch(using=self.es),
+                          BatchedSearch(using=self.es)], self.es)
+
+    def test_batch(self):
+        other = BatchedSearch(using=self.es)
+        search = BatchedSearch(using=self.es).batch(other)
+        eq_(search[:10].execute().hits.total, 1)
+        eq_(self.es.msearch.call_count, 1)
+
+        # The batched search got its response from the same request.
+        eq_(other.execute().hits.total, 0)
+        eq_(self.es.msearch.call_count, 1)
+        ok_(other.execute() is other.execute())
@@ -3,6 +3,7 @@ import json
 from urlparse import urlparse
 
 from django.conf import settings
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
 from django.db import transaction
 from django.http import QueryDict
@@ -10,6 +11,7 @@ from django.test.client import RequestFactory
 
 from mock import patch
 from nose.tools import eq_, ok_
+from rest_framework.response import Response
 
 import mkt
 import mkt.regions
@@ -306,9 +308,10 @@ class TestSearchView(RestOAuth, ESTestCase):
         ok_('latest_version' not in obj)
         ok_('reviewer_flags' not in obj)
 
-    @patch('mkt.webapps.models.Webapp.get_excluded_region_ids')
-    def test_upsell(self, get_excluded_region_ids):
-        get_excluded_region_ids.return_value = []
+    @patch('mkt.webapps.models.Webapp.get_excluded_region_ids_by_app')
+    def test_upsell(self, get_excluded_region_ids_by_app):
+        get_excluded_region_ids_by_app.side_effect = (
+            lambda apps: dict((app.id, []) for app in apps))
         upsell = app_factory()
         self.make_premium(upsell)
         AddonUpsell.objects.create(free=self.webapp, premium=upsell)
@@ -904,6 +907,74 @@ class TestSearchView(RestOAuth, ESTestCase):
         eq_(res.json['objects'][0]['id'], app2.id)
         eq_(res.json['objects'][1]['id'], app1.id)
 
+    def test_cache(self):
+        res = self.anon.get(self.url, {'q': 'Something', 'sort': 'rating'})
+        eq_(res.status_code, 200)
+        eq_(res.json['objects'][0]['id'], self.webapp.id)
+
+        with patch('mkt.search.views.ListAPIView.list') as list_:
+            # Same query, normalized.
+            cached = self.anon.get(self.url, [('sort', 'rating'),
+                                              ('q', 'SOMETHING')])
+        ok_(not list_.called)
+        eq_(cached.status_code, 200)
+        eq_(cached.json['objects'], res.json['objects'])
+
+    def test_cache_per_filter(self):
+        self.anon.get(self.url, {'q': 'something'})
+        with patch('mkt.search.views.ListAPIView.list') as list_:
+            list_.return_value = Response({'objects': []})
+            self.anon.get(self.url, {'q': 'something', 'region': 'br'})
+            self.anon.get(self.url, {'q': 'something', 'dev': 'android',
+                                     'device': 'mobile'})
+            self.anon.get(self.url, {'q': 'something', 'lang': 'fr'})
+        eq_(list_.call_count, 3)
+
+    def test_cache_not_authenticated_only(self):
+        self.client.get(self.url, {'q': 'something'})
+        with patch('mkt.search.views.ListAPIView.list') as list_:
+            list_.return_value = Response({'objects': []})
+            self.client.get(self.url, {'q': 'something'})
+        eq_(list_.call_count, 1)
+
+    def test_cache_new_generation(self):
+        res = self.anon.get(self.url, {'q': 'something'})
+        self.webapp.update(status=mkt.STATUS_APPROVED)
+        self.refresh('webapp')
+        # Indexing apps doesn't invalidate the cached results...
+        eq_(self.anon.get(self.url, {'q': 'something'}).json['objects'],
+            res.json['objects'])
+        # ...reindexing does.
+        WebappIndexer.bump_generation()
+        res = self.anon.get(self.url, {'q': 'something'})
+        eq_(res.json['objects'], [])
+
+    def test_cache_stale_while_revalidate(self):
+        res = self.anon.get(self.url, {'q': 'something'})
+        WebappIndexer.bump_generation()
+        key = SearchView().get_cache_key(res.wsgi_request)
+        cache.set('%s:lock' % key, 1)
+        with patch('mkt.search.views.ListAPIView.list') as list_:
+            # Another request is refreshing the results: serve stale ones.
+            stale = self.anon.get(self.url, {'q': 'something'})
+        ok_(not list_.called)
+        eq_(stale.json['objects'], res.json['objects'])
+
+        cache.delete('%s:lock' % key)
+        with patch('mkt.search.views.ListAPIView.list') as list_:
+            list_.return_value = Response({'objects': []})
+            self.anon.get(self.url, {'q': 'something'})
+        eq_(list_.call_count, 1)
+        ok_(not cache.get('%s:lock' % key))
+
+    @patch.object(settings, 'SEARCH_CACHE_TIMEOUT', 0)
+    def test_cache_disabled(self):
+        self.anon.get(self.url, {'q': 'something'})
+        with patch('mkt.search.views.ListAPIView.list') as list_:
+            list_.return_value = Response({'objects': []})
+            self.anon.get(self.url, {'q': 'something'})
+        eq_(list_.call_count, 1)
+
 
 class TestSearchViewFeatures(RestOAuth, ESTestCase):
     fixtures = fixture('user_2519', 'webapp_337141')
@@ -2,6 +2,9 @@ from math import log10
 
 from django.core.exceptions import ObjectDoesNotExist
 
+from elasticsearch import TransportError
+from elasticsearch_dsl.connections import connections
+from elasticsearch_dsl.result import Response
 from elasticsearch_dsl.search import Search as dslSearch
 from django_statsd.clients import statsd
 
@@ -20,6 +23,66 @@ class Search(dslSearch):
             return results
 
 
+class BatchedSearch(Search):
+    """
+    A Search that is sent to Elasticsearch in a single multi search request
+    with the searches added to it with batch(), when executed. Executing one
+    of these afterwards returns its response from that request.
+
+    The searches are independent, this only saves the round trips.
+    """
+
+    def __init__(self, **kwargs):
+        super(BatchedSearch, self).__init__(**kwargs)
+        self._batched = []
+        self._response = None
+
+    def _clone(self):
+        s = super(BatchedSearch, self)._clone()
+        s._batched = list(self._batched)
+        return s
+
+    def batch(self, *searches):
+        s = self._clone()
+        s._batched.extend(searches)
+        return s
+
+    def execute(self):
+        if self._response is None:
+            searches = [self] + self._batched
+            responses = multi_search(
+                searches, connections.get_connection(self._using))
+            for search, response in zip(searches, responses):
+                search._response = response
+        return self._response
+
+
+def multi_search(searches, es):
+    """
+    Execute `searches` in a single multi search request to `es`, returning
+    their responses in the same order.
+    """
+    body = []
+    for search in searches:
+        header = {}
+        if search._index:
+            header['index'] = search._index
+        if search._doc_type:
+            header['type'] = search._doc_type
+        body.extend([header, search.to_dict()])
+
+    with statsd.timer('search.multi_search'):
+        results = es.msearch(body=body)['responses']
+
+    responses = []
+    for search, result in zip(searches, results):
+        if 'error' in result:
+            raise TransportError(result.get('status', 500), result['error'])
+        statsd.timing('search.took', result['took'])
+        responses.append(Response(result, callbacks=search._doc_type_map))
+    return responses
+
+
 def _property_value_by_region(obj, region=None, property=None):
     if obj.is_dummy_content_for_qa():
         # Apps and Websites set up by QA for testing should never be considered
@@ -61,15 +124,20 @@ def get_trending(obj, region=None):
     return _property_value_by_region(obj, region=region, property='trending')
 
 
-def get_boost(obj):
+def get_boost(obj, popularity=None):
     """
     Returns the boost used in Elasticsearch for this app.
 
     The boost is based on a few factors, the most important is number of
     installs. We use log10 so the boost doesn't completely overshadow any
     other boosting we do at query time.
+
+    If the global popularity value of `obj` is already known, it can be
+    passed as `popularity` to avoid querying for it.
     """
-    boost = max(log10(1 + get_popularity(obj)), 1.0)
+    if popularity is None:
+        popularity = get_popularity(obj)
+    boost = max(log10(1 + popularity), 1.0)
 
     # We give a little extra boost to approved apps.
     if obj.status in VALID_STATUSES:
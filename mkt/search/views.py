@@ -1,11 +1,17 @@
 from __future__ import absolute_import
 
+import hashlib
 import json
+import time
 
+from django.conf import settings
+from django.core.cache import cache
 from django.db.transaction import non_atomic_requests
 from django.http import HttpResponse
 from django.utils.functional import lazy
+from django.utils.http import urlencode
 
+from django_statsd.clients import statsd
 from elasticsearch_dsl import filter as es_filter
 from rest_framework.generics import ListAPIView
 from rest_framework.permissions import AllowAny
@@ -16,11 +22,12 @@ from mkt.api.authentication import (RestOAuthAuthentication,
                                     RestSharedSecretAuthentication)
 from mkt.api.base import CORSMixin, MarketplaceView
 from mkt.api.permissions import AnyOf, GroupPermission
+from mkt.carriers import get_carrier
 from mkt.extensions import indexers as e_indexers
 from mkt.extensions.serializers import ESExtensionSerializer
 from mkt.operators.permissions import IsOperatorPermission
 from mkt.search.forms import ApiSearchForm, COLOMBIA_WEBSITE
-from mkt.search.indexers import BaseIndexer
+from mkt.search.indexers import BaseIndexer, get_generations
 from mkt.search.filters import (DeviceTypeFilter, HomescreenFilter,
                                 OpenMobileACLFilter, ProfileFilter,
                                 PublicContentFilter, PublicSearchFormFilter,
@@ -30,7 +37,8 @@ from mkt.search.serializers import DynamicSearchSerializer
 from mkt.search.utils import Search
 from mkt.translations.helpers import truncate
 from mkt.webapps import indexers
-from mkt.webapps.serializers import (ESAppSerializer, RocketbarESAppSerializer,
+from mkt.webapps.serializers import (ESAppDictSerializer,
+                                     RocketbarESAppSerializer,
                                      RocketbarESAppSerializerV2,
                                      SuggestionsESAppSerializer)
 from mkt.websites import indexers as ws_indexers
@@ -49,12 +57,72 @@ class SearchView(CORSMixin, MarketplaceView, ListAPIView):
                        PublicContentFilter, PublicSearchFormFilter,
                        RegionFilter, SearchQueryFilter, SortingFilter]
 
-    serializer_class = ESAppSerializer
+    serializer_class = ESAppDictSerializer
     form_class = ApiSearchForm
+    # The indexers whose generations invalidate the cached results.
+    cache_indexers = [indexers.WebappIndexer]
 
     def get_queryset(self):
         return indexers.WebappIndexer.search()
 
+    def get_cache_key(self, request):
+        """
+        Cache key of the results for `request`: the dimensions of the
+        API-Filter header (see APIFilterMiddleware) and the query string,
+        normalized so that equivalent queries share the same key.
+        """
+        devices = [device for device in ('GAIA', 'TV', 'MOBILE', 'TABLET')
+                   if getattr(request, device, False)]
+        params = [(k, [v.lower() for v in values] if k == 'q' else values)
+                  for k, values in sorted(request.GET.lists())]
+        key = u':'.join(map(unicode, [
+            request.path, get_carrier() or '', ','.join(devices),
+            request.LANG, request.GET.get('pro', ''), request.REGION.slug,
+            urlencode(params, doseq=True)]))
+        return 'search:view:%s' % hashlib.md5(key.encode('utf-8')).hexdigest()
+
+    def list(self, request, *args, **kwargs):
+        """
+        Return the search results, cached for anonymous users.
+
+        Results are fresh for SEARCH_CACHE_TIMEOUT seconds, as long as the
+        generations of `cache_indexers` don't change. Stale results are kept
+        SEARCH_CACHE_STALE_TIMEOUT more seconds and served while a single
+        request computes them again, to avoid stampedes on ES.
+        """
+        timeout = settings.SEARCH_CACHE_TIMEOUT
+        if not timeout or request.user.is_authenticated():
+            return super(SearchView, self).list(request, *args, **kwargs)
+
+        key = self.get_cache_key(request)
+        lock_key = '%s:lock' % key
+        generations = get_generations(self.cache_indexers)
+        cached = cache.get(key)
+        locked = False
+        if cached is not None:
+            data, cached_generations, fresh_until = cached
+            if cached_generations == generations and time.time() < fresh_until:
+                statsd.incr('mkt.search.view.cache.hit')
+                return Response(data)
+            # Only one request refreshes stale results, the others keep
+            # serving them in the meantime.
+            locked = cache.add(lock_key, 1, timeout)
+            if not locked:
+                statsd.incr('mkt.search.view.cache.stale')
+                return Response(data)
+
+        statsd.incr('mkt.search.view.cache.miss')
+        try:
+            response = super(SearchView, self).list(request, *args, **kwargs)
+            if response.status_code == 200:
+                cache.set(key,
+                          (response.data, generations, time.time() + timeout),
+                          timeout + settings.SEARCH_CACHE_STALE_TIMEOUT)
+        finally:
+            if locked:
+                cache.delete(lock_key)
+        return response
+
     @classmethod
     def as_view(cls, **kwargs):
         # Make all search views non_atomic: they should not need the db, or
@@ -72,6 +140,8 @@ class MultiSearchView(SearchView):
     """
     allow_colombia = False
     serializer_class = DynamicSearchSerializer
+    cache_indexers = [e_indexers.ExtensionIndexer, indexers.WebappIndexer,
+                      indexers.HomescreenIndexer, ws_indexers.WebsiteIndexer]
     # mapping_names_and_indices is lazy because our tests modify the indices
     # to use test indices. So we want it to be instantiated only when we start
     # using it in the code, not before.
@@ -96,8 +166,8 @@ class MultiSearchView(SearchView):
     }, dict)()
     serializer_classes = {
         'extension': ESExtensionSerializer,
-        'webapp': ESAppSerializer,
-        'homescreen': ESAppSerializer,
+        'webapp': ESAppDictSerializer,
+        'homescreen': ESAppDictSerializer,
         'website': ESWebsiteSerializer
     }
 
@@ -351,6 +351,11 @@ FEATURED_APP_BG_PATH = UPLOADS_PATH + '/featured_app_background'
 FEED_COLLECTION_BG_PATH = UPLOADS_PATH + '/feed_collection_background'
 FEED_SHELF_BG_PATH = UPLOADS_PATH + '/feed_shelf_background'
 
+# How long the serialized homepage feed is cached, in seconds. It's also
+# invalidated when feed items or elements are indexed, this only bounds how
+# stale the apps it contains can get.
+FEED_CACHE_TIMEOUT = 60 * 5
+
 # Like ADDONS_PATH but protected by the app. Used for storing files that should
 # not be publicly accessible (like disabled add-ons).
 GUARDED_ADDONS_PATH = NETAPP_STORAGE + '/guarded-addons'
@@ -366,6 +371,12 @@ PRODUCT_ICON_PATH = NETAPP_STORAGE + '/product-icons'
 
 REVIEWER_ATTACHMENTS_PATH = UPLOADS_PATH + '/reviewer_attachment'
 
+# How long the reviewer queue counts and progress buckets are cached, in
+# seconds. They are invalidated when the apps in the queues change and
+# recomputed by the update_queue_stats_cron, this only bounds how stale they
+# can get.
+REVIEWER_QUEUE_STATS_TIMEOUT = 60 * 15
+
 # When True, create a URL root /tmp that serves files in your temp path.
 # This is useful for development to view upload pics, etc.
 # NOTE: This only works when DEBUG is also True.
@@ -537,6 +548,11 @@ LANGUAGES = lazy(langs, dict)(AMO_LANGUAGES)
 # than this will include the `API-Status: Deprecated` header.
 API_CURRENT_VERSION = 1
 
+# How long in seconds the user and groups authenticated by OAuth or shared
+# secret credentials are cached. They are also invalidated when the
+# credentials are deleted or the user or their groups change.
+API_PRINCIPAL_CACHE_TIMEOUT = 60
+
 # When True, the API will return a full traceback when an exception occurs.
 API_SHOW_TRACEBACKS = False
 
@@ -708,6 +724,20 @@ ES_INDEXES = {
 ES_URLS = ['http://%s' % h for h in ES_HOSTS]
 ES_USE_PLUGINS = False
 ES_TIMEOUT = 30
+# Maximum size in bytes of the body of a bulk indexing request.
+ES_BULK_MAX_BYTES = int(2.5 * 1024 * 1024)
+# Maximum number of concurrent bulk indexing requests sent by one process.
+ES_BULK_MAX_IN_FLIGHT = 2
+# Maximum delay in seconds before an object queued for indexing (see
+# BaseIndexer.queue_index_ids) is indexed. Updates made to the same objects
+# during that time are coalesced. If 0, objects are indexed right away.
+ES_INDEX_QUEUE_DELAY = 30
+# How long in seconds anonymous search results are cached (see
+# SearchView.list). Set to 0 to disable the cache. Once expired or once the
+# index changed, a result can still be served for SEARCH_CACHE_STALE_TIMEOUT
+# more seconds while a single request refreshes it.
+SEARCH_CACHE_TIMEOUT = 60
+SEARCH_CACHE_STALE_TIMEOUT = 60 * 5
 
 # When True include full tracebacks in JSON. This is useful for QA on preview.
 EXPOSE_VALIDATOR_TRACEBACKS = True
@@ -776,6 +806,12 @@ os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1'
 GEOIP_URL = ''
 GEOIP_DEFAULT_VAL = 'restofworld'
 GEOIP_DEFAULT_TIMEOUT = .2
+# Path of a range table built by the build_geoip_table command. When set, IPs
+# are resolved in-process with it, falling back to GEOIP_URL for the IPs it
+# doesn't know. The file is checked for changes every
+# GEOIP_DATABASE_CHECK_INTERVAL seconds and loaded again when it's replaced.
+GEOIP_DATABASE = ''
+GEOIP_DATABASE_CHECK_INTERVAL = 60
 
 # Credentials for accessing Google Analytics stats.
 GOOGLE_ANALYTICS_CREDENTIALS = {}
@@ -891,6 +927,12 @@ KNOWN_PROXIES = []
 
 LANGUAGE_URL_MAP = dict([(i.lower(), i) for i in AMO_LANGUAGES])
 
+# How many translation rows each process keeps in memory, and for how long in
+# seconds. Saving a translation only invalidates the rows of the process doing
+# it, so keep the timeout short. See mkt.translations.loader.
+TRANSLATIONS_LOCAL_CACHE_SIZE = 20000
+TRANSLATIONS_LOCAL_CACHE_TIMEOUT = 60
+
 # These domains get `x-frame-options: allow-from` for Privacy Policy / TOS.
 UNVERIFIED_ISSUER = 'firefoxos.persona.org'
 LEGAL_XFRAME_ALLOW_FROM = [
@@ -938,6 +980,17 @@ MINIFY_MOZMARKET = True
 MONOLITH_SERVER = os.getenv('MONOLITH_URL', 'http://localhost:9200')
 MONOLITH_INDEX = 'time_*'
 MONOLITH_MAX_DATE_RANGE = 365
+# Timeout of the requests to the Monolith server, in seconds.
+MONOLITH_TIMEOUT = 10
+# How many requests to the Monolith server the stats API sends concurrently,
+# per process, for the lines of the multi-line stats.
+MONOLITH_MAX_IN_FLIGHT = 4
+
+# How long the stats API caches the data it gets from Monolith, in seconds.
+# The data of a day is recorded the day after, ranges that end before that
+# don't change anymore and are cached for STATS_CACHE_TIMEOUT.
+STATS_CACHE_TIMEOUT = 60 * 60 * 24
+STATS_RECENT_CACHE_TIMEOUT = 60 * 10
 
 # The issuer for unverified Persona email addresses.
 # We only trust one issuer to grant us unverified emails.
@@ -1181,6 +1234,19 @@ WEBAPPS_RECEIPT_EXPIRY_SECONDS = 60 * 60 * 24 * 182
 # The file contains a PEM-encoded RSA private key.
 WEBAPPS_RECEIPT_KEY = path('mkt/webapps/tests/sample.key')
 
+# How long in seconds the receipt verifier caches the purchase of a receipt,
+# in memcached and in the memory of each process. Refunds and chargebacks only
+# invalidate the memcached entry, so keep the local timeout short.
+RECEIPT_PURCHASE_CACHE_TIMEOUT = 60 * 5
+RECEIPT_PURCHASE_LOCAL_CACHE_TIMEOUT = 10
+
+# How often in seconds the receipt verifier reloads the receipt key and
+# rebuilds its certificate verifier, which caches the keys of the issuers.
+RECEIPT_VERIFIER_REFRESH_INTERVAL = 60 * 60
+
+# The maximum number of receipts checked by a batch receipt verification.
+RECEIPT_VERIFY_MAX_BATCH = 50
+
 WEBAPPS_UNIQUE_BY_DOMAIN = False
 
 # Filter IP addresses of the allowed clients that can post email
@@ -6,8 +6,10 @@ from nose.tools import eq_, ok_
 from rest_framework.reverse import reverse
 
 from django.conf import settings
+from django.core.cache import cache
 
 import mkt
+from lib.metrics import reset_monolith_client
 from mkt.api.tests.test_oauth import RestOAuth
 from mkt.purchase.models import Contribution
 from mkt.site.fixtures import fixture
@@ -19,6 +21,9 @@ class StatsAPITestMixin(object):
 
     def setUp(self):
         super(StatsAPITestMixin, self).setUp()
+        # The tests mock the client class, don't reuse a client.
+        reset_monolith_client()
+        self.addCleanup(reset_monolith_client)
         patches = [
             mock.patch('monolith.client.Client'),
             mock.patch.object(settings, 'MONOLITH_SERVER', 'http://0.0.0.0:0'),
@@ -92,7 +97,9 @@ class TestGlobalStatsResource(GlobalStatsAPITestMixin, RestOAuth):
         res = self.client.get(self.url('apps_added_by_package'), data=data)
         eq_(res.status_code, 200)
         ok_(client.called)
-        eq_(client.call_args[1], {'region': 'br', 'package_type': 'hosted'})
+        # The lines are fetched concurrently, in any order.
+        ok_({'region': 'br', 'package_type': 'hosted'} in
+            [call[1] for call in client.call_args_list])
 
     @mock.patch('monolith.client.Client')
     def test_dimensions_default(self, mocked):
@@ -103,7 +110,61 @@ class TestGlobalStatsResource(GlobalStatsAPITestMixin, RestOAuth):
                               data=self.data)
         eq_(res.status_code, 200)
         ok_(client.called)
-        eq_(client.call_args[1], {'region': 'us', 'package_type': 'hosted'})
+        ok_({'region': 'us', 'package_type': 'hosted'} in
+            [call[1] for call in client.call_args_list])
+
+    @mock.patch('monolith.client.Client')
+    def test_lines(self, mocked):
+        client = mock.MagicMock()
+        client.side_effect = lambda *args, **kw: [
+            {'count': 1, 'date': '2013-10-10', 'type': kw['package_type']}]
+        mocked.return_value = client
+
+        res = self.client.get(self.url('apps_added_by_package'),
+                              data=self.data)
+        eq_(res.status_code, 200)
+        data = json.loads(res.content)
+        eq_(sorted(data), sorted(mkt.ADDON_WEBAPP_TYPES.values()))
+        for line, objects in data.items():
+            eq_(objects, [{'count': 1, 'date': '2013-10-10', 'type': line}])
+
+    @mock.patch('monolith.client.Client')
+    def test_lines_clients_reused(self, mocked):
+        client = mock.MagicMock()
+        client.return_value = [{'count': 1, 'date': '2013-10-10'}]
+        mocked.return_value = client
+
+        for i in range(3):
+            cache.clear()
+            res = self.client.get(self.url('apps_added_by_package'),
+                                  data=self.data)
+            eq_(res.status_code, 200)
+        eq_(client.call_count, 9)
+        # At most one client per thread of the pool and one for the request.
+        ok_(mocked.call_count <= settings.MONOLITH_MAX_IN_FLIGHT + 1)
+
+    @mock.patch('monolith.client.Client')
+    def test_cached(self, mocked):
+        client = mock.MagicMock()
+        client.return_value = [{'count': 1, 'date': '2013-10-10'}]
+        mocked.return_value = client
+
+        for i in range(2):
+            res = self.client.get(self.url('apps_installed'), data=self.data)
+            eq_(res.status_code, 200)
+            eq_(json.loads(res.content)['objects'],
+                [{'count': 1, 'date': '2013-10-10'}])
+        eq_(client.call_count, 1)
+
+        data = dict(self.data, end='2013-10-11')
+        self.client.get(self.url('apps_installed'), data=data)
+        eq_(client.call_count, 2)
+
+    @mock.patch('monolith.client.Client')
+    def test_monolith_timeout(self, mocked):
+        mocked.return_value.side_effect = requests.Timeout
+        res = self.client.get(self.url('apps_installed'), data=self.data)
+        eq_(res.status_code, 503)
 
     @mock.patch('monolith.client.Client')
     def test_dimensions_default_is_none(self, mocked):
@@ -208,6 +269,38 @@ class TestGlobalStatsTotalResource(GlobalStatsAPITestMixin, RestOAuth):
         res = self.client.get(self.url())
         eq_(res.status_code, 200)
 
+    @mock.patch('monolith.client.Client')
+    def test_single_request(self, mocked):
+        client = mocked.return_value
+        client.raw.return_value = {
+            'facets': {'installs': {'count': 2, 'total': 5},
+                       'ratings': {'count': 0}}}
+        res = self.client.get(self.url())
+        eq_(res.status_code, 200)
+        eq_(client.raw.call_count, 1)
+        eq_(sorted(client.raw.call_args[0][0]['facets']),
+            ['abuse_reports', 'installs', 'ratings'])
+        eq_(json.loads(res.content),
+            {'installs': {'total': 5}, 'ratings': {}, 'abuse_reports': {}})
+
+    @mock.patch('monolith.client.Client')
+    def test_missing_metric(self, mocked):
+        def raw(query):
+            if 'ratings' in query['facets']:
+                raise ValueError('No ratings.')
+            metric = query['facets'].keys()[0]
+            return {'facets': {metric: {'count': 1, 'total': 1}}}
+
+        client = mocked.return_value
+        client.raw.side_effect = raw
+        res = self.client.get(self.url())
+        eq_(res.status_code, 200)
+        # The request of all the metrics, then one per metric.
+        eq_(client.raw.call_count, 4)
+        eq_(json.loads(res.content),
+            {'installs': {'total': 1}, 'ratings': {},
+             'abuse_reports': {'total': 1}})
+
 
 class TestAppStatsTotalResource(StatsAPITestMixin, RestOAuth):
     fixtures = fixture('user_2519')
@@ -1,4 +1,11 @@
+import hashlib
+import json
+import threading
+from multiprocessing.pool import ThreadPool
+
 from django import http
+from django.conf import settings
+from django.core.cache import cache
 
 import commonware
 import requests
@@ -16,6 +23,7 @@ from mkt.api.base import CORSMixin, SlugOrIdMixin
 from mkt.api.exceptions import ServiceUnavailable
 from mkt.api.permissions import AllowAppOwner, AnyOf, GroupPermission
 from mkt.purchase.models import Contribution
+from mkt.site.utils import days_ago
 from mkt.webapps.models import Webapp
 
 from .forms import StatsForm
@@ -148,12 +156,55 @@ APP_STATS_TOTAL = {
 }
 
 
+def _get_cache_timeout(end):
+    """
+    Return how long the Monolith data of a range ending on `end` can be
+    cached. The data of a day is recorded the day after, ranges ending
+    before that don't change anymore.
+    """
+    if str(end) < str(days_ago(1).date()):
+        return settings.STATS_CACHE_TIMEOUT
+    return settings.STATS_RECENT_CACHE_TIMEOUT
+
+
+# The threads fetching the lines of the multi-line stats, shared by the
+# requests so that they live as long as the process, and with them their
+# Monolith client and its connections, see get_monolith_client().
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPool(settings.MONOLITH_MAX_IN_FLIGHT)
+    return _pool
+
+
+def _fetch_monolith_data(metric, start, end, interval, dimensions):
+    """
+    Return the list of the data points of `metric` with `dimensions` from
+    Monolith, cached.
+    """
+    key = 'stats:monolith:%s' % hashlib.md5(json.dumps(
+        [metric, sorted(dimensions.items()), interval, str(start), str(end)])
+    ).hexdigest()
+    data = cache.get(key)
+    if data is None:
+        # The client is per thread, see get_monolith_client().
+        data = list(get_monolith_client()(metric, start, end, interval,
+                                          **dimensions))
+        cache.set(key, data, _get_cache_timeout(end))
+    return data
+
+
 def _get_monolith_data(stat, start, end, interval, dimensions):
     # If stat has a 'lines' attribute, it's a multi-line graph. Do a
-    # request for each item in 'lines' and compose them in a single
-    # response.
+    # request for each item in 'lines' from the threads of the pool, and
+    # compose them in a single response.
     try:
-        client = get_monolith_client()
+        get_monolith_client()
     except requests.ConnectionError as e:
         log.info('Monolith connection error: {0}'.format(e))
         raise ServiceUnavailable
@@ -165,19 +216,19 @@ def _get_monolith_data(stat, start, end, interval, dimensions):
 
         return data
 
+    def _fetch(line_dimension):
+        return map(_coerce, _fetch_monolith_data(
+            stat['metric'], start, end, interval,
+            dict(dimensions, **line_dimension)))
+
     try:
         data = {}
         if 'lines' in stat:
-            for line_name, line_dimension in stat['lines'].items():
-                dimensions.update(line_dimension)
-                data[line_name] = map(_coerce,
-                                      client(stat['metric'], start, end,
-                                             interval, **dimensions))
-
+            line_names, line_dimensions = zip(*stat['lines'].items())
+            data = dict(zip(line_names,
+                            _get_pool().map(_fetch, line_dimensions)))
         else:
-            data['objects'] = map(_coerce,
-                                  client(stat['metric'], start, end, interval,
-                                         **dimensions))
+            data['objects'] = _fetch({})
 
     except ValueError as e:
         # This occurs if monolith doesn't have our metric and we get an
@@ -186,6 +237,10 @@ def _get_monolith_data(stat, start, end, interval, dimensions):
             stat['metric'], e))
         raise ParseError('Invalid metric at this time. Try again later.')
 
+    except requests.RequestException as e:
+        log.info('Monolith connection error: {0}'.format(e))
+        raise ServiceUnavailable
+
     return data
 
 
@@ -315,6 +370,46 @@ class StatsTotalBase(object):
                     if value is not None:
                         data[metric][field] = value
 
+    def raw(self, client, query):
+        """
+        Send `query` to Monolith, returning None if Monolith fails it.
+        """
+        try:
+            return client.raw(query)
+        except ValueError as e:
+            log.info('Received value error from monolith client: %s' % e)
+        except requests.RequestException as e:
+            log.info('Monolith connection error: {0}'.format(e))
+            raise ServiceUnavailable
+
+    def get_data(self, stats, app_id=None):
+        """
+        Return the totals of `stats`, a dict like STATS_TOTAL, fetched in one
+        request with a facet per metric.
+
+        Monolith fails the whole request if one of the metrics is missing:
+        the metrics are then requested one by one, so that the others can
+        still be returned.
+        """
+        client = self.get_client()
+        data = dict((metric, {}) for metric in stats)
+        queries = [self.get_query(metric, stat['metric'], app_id)
+                   for metric, stat in stats.items()]
+
+        query = dict(queries[0], facets={})
+        for metric_query in queries:
+            query['facets'].update(metric_query['facets'])
+        resp = self.raw(client, query)
+        if resp is not None:
+            self.process_response(resp, data)
+            return data
+
+        for metric_query in queries:
+            resp = self.raw(client, metric_query)
+            if resp is not None:
+                self.process_response(resp, data)
+        return data
+
 
 class GlobalStatsTotal(CORSMixin, APIView, StatsTotalBase):
     authentication_classes = (RestOAuthAuthentication,
@@ -324,24 +419,7 @@ class GlobalStatsTotal(CORSMixin, APIView, StatsTotalBase):
     slug_field = 'app_slug'
 
     def get(self, request):
-        client = self.get_client()
-
-        # Note: We have to do this as separate requests so that if one fails
-        # the rest can still be returned.
-        data = {}
-        for metric, stat in STATS_TOTAL.items():
-            data[metric] = {}
-            query = self.get_query(metric, stat['metric'])
-
-            try:
-                resp = client.raw(query)
-            except ValueError as e:
-                log.info('Received value error from monolith client: %s' % e)
-                continue
-
-            self.process_response(resp, data)
-
-        return Response(data)
+        return Response(self.get_data(STATS_TOTAL))
 
 
 class AppStatsTotal(CORSMixin, SlugOrIdMixin, ListAPIView, StatsTotalBase):
@@ -355,24 +433,7 @@ class AppStatsTotal(CORSMixin, SlugOrIdMixin, ListAPIView, StatsTotalBase):
 
     def get(self, request, pk):
         app = self.get_object()
-        client = self.get_client()
-
-        # Note: We have to do this as separate requests so that if one fails
-        # the rest can still be returned.
-        data = {}
-        for metric, stat in APP_STATS_TOTAL.items():
-            data[metric] = {}
-            query = self.get_query(metric, stat['metric'], app.id)
-
-            try:
-                resp = client.raw(query)
-            except ValueError as e:
-                log.info('Received value error from monolith client: %s' % e)
-                continue
-
-            self.process_response(resp, data)
-
-        return Response(data)
+        return Response(self.get_data(APP_STATS_TOTAL, app.id))
 
 
 class TransactionAPI(CORSMixin, APIView):
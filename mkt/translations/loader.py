@@ -0,0 +1,186 @@
+"""
+Batched loading of translations, with a small LRU of translation rows in each
+process.
+
+The translations needed by any number of objects are fetched in one query,
+each translation id being looked up once. Rows are cached by (id, locale) and
+the rows of an id in every locale by (id, None).
+
+Each id has a version in the shared cache, which saving or deleting one of its
+translations changes, and the cached rows are only used while the version they
+were cached with is current. The version is changed again once the request or
+task doing it is finished, i.e. once its transaction is committed, so that
+rows cached by other processes in the meantime aren't used either.
+
+Cached rows are only ever used to build new Translation instances, so that
+changes made to the instances attached to objects don't leak into the cache.
+"""
+import collections
+import operator
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import request_finished
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from celery.signals import task_postrun
+
+from lib.utils import LocalLRUCache
+from mkt.translations.models import Translation
+
+
+local_cache = LocalLRUCache(size=settings.TRANSLATIONS_LOCAL_CACHE_SIZE)
+
+trans_fields = [f.attname for f in Translation._meta.fields]
+ID, LOCALE = trans_fields.index('id'), trans_fields.index('locale')
+
+# Cached for the (id, locale) pairs that have no translation, the cache
+# returning None for missing keys.
+MISSING = ()
+
+
+# The ids whose version is changed again when the request or task is finished.
+_locals = threading.local()
+
+
+def _key(trans_id, locale=None):
+    return (trans_id, locale.lower() if locale else None)
+
+
+def _version_key(trans_id):
+    return 'translations:version:%s' % trans_id
+
+
+def _get_versions(trans_ids):
+    """Return a dict mapping `trans_ids` to their version, if they have one."""
+    if not settings.TRANSLATIONS_LOCAL_CACHE_TIMEOUT:
+        return {}
+    versions = cache.get_many([_version_key(pk) for pk in trans_ids])
+    return dict((pk, versions.get(_version_key(pk))) for pk in trans_ids)
+
+
+def _bump_versions(trans_ids):
+    cache.set_many(dict((_version_key(pk), uuid.uuid4().hex)
+                        for pk in trans_ids), None)
+
+
+def _cache_set(key, version, value):
+    if settings.TRANSLATIONS_LOCAL_CACHE_TIMEOUT:
+        local_cache.set(key, (version, value),
+                        settings.TRANSLATIONS_LOCAL_CACHE_TIMEOUT)
+
+
+class TranslationLoader(object):
+    """
+    Loads translations in one go: collect what is needed with `add()` and
+    `add_all()`, for any number of objects of any number of models, then call
+    `load()` and read the translations with `get()` and `get_all()`.
+
+    Each id is looked up once, and rows that are not cached are fetched in one
+    query.
+    """
+
+    def __init__(self):
+        self.wanted = set()
+        self.rows = {}
+
+    def add(self, trans_id, locale):
+        """Ask for the translation `trans_id` in `locale`."""
+        if trans_id is not None and locale:
+            self.wanted.add(_key(trans_id, locale))
+
+    def add_all(self, trans_id):
+        """Ask for the translation `trans_id` in every locale."""
+        if trans_id is not None:
+            self.wanted.add(_key(trans_id))
+
+    def load(self):
+        """Load the translations asked for since the last call."""
+        wanted = self.wanted - set(self.rows)
+        if not wanted:
+            return
+        # Read before the query: rows changed after it was sent aren't cached
+        # with the version they were changed to.
+        versions = _get_versions(set(trans_id for trans_id, _ in wanted))
+        missing = []
+        for key in wanted:
+            cached = local_cache.get(key)
+            if cached is None or cached[0] != versions.get(key[0]):
+                missing.append(key)
+            else:
+                self.rows[key] = cached[1]
+        if not missing:
+            return
+
+        all_ids = set(trans_id for trans_id, locale in missing
+                      if locale is None)
+        pairs = [key for key in missing if key[1] is not None]
+        lookups = []
+        if all_ids:
+            lookups.append(Q(id__in=all_ids))
+        if pairs:
+            lookups.append(Q(id__in=set(trans_id for trans_id, _ in pairs),
+                             locale__in=set(locale for _, locale in pairs)))
+        fetched = collections.defaultdict(list)
+        qs = (Translation.objects.filter(reduce(operator.or_, lookups))
+              .order_by('autoid').values_list(*trans_fields))
+        for row in qs:
+            fetched[_key(row[ID], row[LOCALE])].append(row)
+            fetched[_key(row[ID])].append(row)
+
+        for key in missing:
+            if key[1] is None:
+                value = tuple(fetched[key])
+            else:
+                # There is only one row for an id in a locale.
+                value = fetched[key][0] if fetched[key] else MISSING
+            self.rows[key] = value
+            _cache_set(key, versions.get(key[0]), value)
+
+    def get(self, trans_id, locale):
+        """Return the loaded translation `trans_id` in `locale`, or None."""
+        row = self.rows.get(_key(trans_id, locale)) if locale else None
+        return Translation(*row) if row else None
+
+    def get_all(self, trans_id):
+        """
+        Return the list of the loaded translations `trans_id` in every locale,
+        in the order they were created.
+        """
+        return [Translation(*row) for row in self.rows.get(_key(trans_id), ())]
+
+
+def invalidate_translation(trans_id, locale):
+    """
+    Remove the translation `trans_id` in `locale` from the cache of every
+    process.
+    """
+    local_cache.delete(_key(trans_id, locale))
+    local_cache.delete(_key(trans_id))
+    _bump_versions([trans_id])
+    _locals.__dict__.setdefault('invalidated', set()).add(trans_id)
+
+
+def _invalidate_after_commit(**kwargs):
+    invalidated = _locals.__dict__.pop('invalidated', None)
+    if invalidated:
+        _bump_versions(invalidated)
+
+
+request_finished.connect(_invalidate_after_commit,
+                         dispatch_uid='translation_loader.request_finished')
+task_postrun.connect(_invalidate_after_commit,
+                     dispatch_uid='translation_loader.task_postrun')
+
+
+@receiver(post_save, dispatch_uid='translation_loader.post_save')
+@receiver(post_delete, dispatch_uid='translation_loader.post_delete')
+def invalidate_saved_translation(sender, instance, **kw):
+    # Translations are saved through their Purified/Linkified proxies too,
+    # which are the senders then.
+    if isinstance(instance, Translation):
+        invalidate_translation(instance.id, instance.locale)
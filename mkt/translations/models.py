@@ -1,5 +1,4 @@
 import collections
-from itertools import groupby
 
 from django.db import connections, models, router
 from django.db.models.deletion import Collector
@@ -20,10 +19,14 @@ class TranslationManager(ManagerBase):
 
     def remove_for(self, obj, locale):
         """Remove a locale for the given object."""
-        ids = [getattr(obj, f.attname) for f in obj._meta.translated_fields]
-        qs = Translation.objects.filter(id__in=filter(None, ids),
-                                        locale=locale)
+        from mkt.translations.loader import invalidate_translation
+
+        ids = filter(None, [getattr(obj, f.attname)
+                            for f in obj._meta.translated_fields])
+        qs = Translation.objects.filter(id__in=ids, locale=locale)
         qs.update(localized_string=None, localized_string_clean=None)
+        for trans_id in ids:
+            invalidate_translation(trans_id, locale)
 
 
 class Translation(ModelBase):
@@ -266,22 +269,25 @@ def delete_translation(obj, fieldname):
         Translation.objects.filter(id=trans_id).delete()
 
 
-def _sorted_groupby(seq, key):
-    return groupby(sorted(seq, key=key), key=key)
-
-
 def attach_trans_dict(model, objs):
     """Put all translations into a translations dict."""
-    # Get the ids of all the translations we need to fetch.
-    fields = model._meta.translated_fields
-    ids = [getattr(obj, f.attname) for f in fields
-           for obj in objs if getattr(obj, f.attname, None) is not None]
+    attach_trans_dicts([(model, objs)])
+
+
+def attach_trans_dicts(models_and_objs):
+    """
+    Like `attach_trans_dict()`, for a list of (model, objs) tuples, fetching
+    the translations of all the objects at once.
+    """
+    from mkt.translations.loader import TranslationLoader
 
-    # Get translations in a dict, ids will be the keys. It's important to
-    # consume the result of groupby, which is an iterator.
-    qs = Translation.objects.filter(id__in=ids, localized_string__isnull=False)
-    all_translations = dict((k, list(v)) for k, v in
-                            _sorted_groupby(qs, lambda trans: trans.id))
+    # Load all the translations we need at once.
+    loader = TranslationLoader()
+    for model, objs in models_and_objs:
+        for field in model._meta.translated_fields:
+            for obj in objs:
+                loader.add_all(getattr(obj, field.attname, None))
+    loader.load()
 
     def get_locale_and_string(translation, new_class):
         """Convert the translation to new_class (making PurifiedTranslations
@@ -292,13 +298,17 @@ def attach_trans_dict(model, objs):
                 unicode(converted_translation))
 
     # Build and attach translations for each field on each object.
-    for obj in objs:
-        obj.translations = collections.defaultdict(list)
-        for field in fields:
-            t_id = getattr(obj, field.attname, None)
-            field_translations = all_translations.get(t_id, None)
-            if not t_id or field_translations is None:
-                continue
-
-            obj.translations[t_id] = [get_locale_and_string(t, field.rel.to)
-                                      for t in field_translations]
+    for model, objs in models_and_objs:
+        fields = model._meta.translated_fields
+        for obj in objs:
+            obj.translations = collections.defaultdict(list)
+            for field in fields:
+                t_id = getattr(obj, field.attname, None)
+                field_translations = [t for t in loader.get_all(t_id)
+                                      if t.localized_string is not None]
+                if not t_id or not field_translations:
+                    continue
+
+                obj.translations[t_id] = [
+                    get_locale_and_string(t, field.rel.to)
+                    for t in field_translations]
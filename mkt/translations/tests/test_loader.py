@@ -0,0 +1,142 @@
+from django.apps import apps
+from django.core.signals import request_finished
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import translation
+
+from nose.tools import eq_
+
+from mkt.site.tests import TestCase
+from mkt.translations import loader
+from mkt.translations.models import attach_trans_dicts, Translation
+
+
+@override_settings(TRANSLATIONS_LOCAL_CACHE_TIMEOUT=60)
+class TestTranslationLoader(TestCase):
+    fixtures = ['testapp/test_models.json']
+
+    def setUp(self):
+        super(TestTranslationLoader, self).setUp()
+        testapp = apps.get_app_config('testapp')
+        self.TranslatedModel = testapp.get_model('TranslatedModel')
+        self.FancyModel = testapp.get_model('FancyModel')
+        translation.activate('en-US')
+        loader.local_cache.clear()
+
+    def tearDown(self):
+        loader.local_cache.clear()
+        super(TestTranslationLoader, self).tearDown()
+
+    def load(self, pairs=(), all_ids=()):
+        trans_loader = loader.TranslationLoader()
+        for trans_id, locale in pairs:
+            trans_loader.add(trans_id, locale)
+        for trans_id in all_ids:
+            trans_loader.add_all(trans_id)
+        with CaptureQueriesContext(connection) as context:
+            trans_loader.load()
+        return trans_loader, len(context.captured_queries)
+
+    def test_load(self):
+        trans_loader, num_queries = self.load(
+            pairs=[(1, 'en-US'), (1, 'de'), (2, 'de'), (1, 'en-us')],
+            all_ids=[3])
+        eq_(num_queries, 1)
+        eq_(unicode(trans_loader.get(1, 'en-us')), 'some name')
+        eq_(unicode(trans_loader.get(1, 'DE')), 'German!! (unst unst)')
+        eq_(trans_loader.get(2, 'de'), None)
+        eq_([unicode(t) for t in trans_loader.get_all(3)],
+            ['frenchie', 'speak American'])
+
+    def test_cached(self):
+        self.load(pairs=[(1, 'en-us'), (2, 'de')], all_ids=[3])
+        trans_loader, num_queries = self.load(
+            pairs=[(1, 'en-us'), (2, 'de')], all_ids=[3])
+        eq_(num_queries, 0)
+        eq_(unicode(trans_loader.get(1, 'en-us')), 'some name')
+        eq_(trans_loader.get(2, 'de'), None)
+        eq_(len(trans_loader.get_all(3)), 2)
+
+    @override_settings(TRANSLATIONS_LOCAL_CACHE_TIMEOUT=0)
+    def test_cache_disabled(self):
+        self.load(pairs=[(1, 'en-us')])
+        eq_(self.load(pairs=[(1, 'en-us')])[1], 1)
+
+    def test_not_shared(self):
+        trans_loader, _ = self.load(pairs=[(1, 'en-us')])
+        trans_loader.get(1, 'en-us').localized_string = 'changed'
+        eq_(unicode(self.load(pairs=[(1, 'en-us')])[0].get(1, 'en-us')),
+            'some name')
+
+    def test_invalidated_on_save(self):
+        self.load(pairs=[(1, 'en-us'), (1, 'fr')], all_ids=[1])
+        trans = Translation.objects.get(id=1, locale='en-us')
+        trans.localized_string = 'new name'
+        trans.save()
+        Translation.objects.create(id=1, locale='fr', localized_string='nom')
+
+        trans_loader, num_queries = self.load(
+            pairs=[(1, 'en-us'), (1, 'fr')], all_ids=[1])
+        eq_(num_queries, 1)
+        eq_(unicode(trans_loader.get(1, 'en-us')), 'new name')
+        eq_(unicode(trans_loader.get(1, 'fr')), 'nom')
+        eq_(len(trans_loader.get_all(1)), 3)
+
+    def test_invalidated_in_other_processes(self):
+        self.load(pairs=[(1, 'en-us')])
+        # Another process saved the translation: the version changed but this
+        # process' cache wasn't touched.
+        loader._bump_versions([1])
+        eq_(self.load(pairs=[(1, 'en-us')])[1], 1)
+        eq_(self.load(pairs=[(1, 'en-us')])[1], 0)
+
+    def test_invalidated_after_request(self):
+        trans = Translation.objects.get(id=1, locale='en-us')
+        trans.localized_string = 'new name'
+        trans.save()
+        # Rows loaded before the transaction is committed aren't used after.
+        self.load(pairs=[(1, 'en-us')])
+        request_finished.send(sender=self.__class__)
+        eq_(self.load(pairs=[(1, 'en-us')])[1], 1)
+        request_finished.send(sender=self.__class__)
+        eq_(self.load(pairs=[(1, 'en-us')])[1], 0)
+
+    def test_invalidated_on_delete(self):
+        self.load(pairs=[(1, 'de')])
+        Translation.objects.get(id=1, locale='de').delete()
+        eq_(self.load(pairs=[(1, 'de')])[0].get(1, 'de'), None)
+
+    def test_invalidated_on_remove_for(self):
+        obj = self.TranslatedModel.objects.get(id=1)
+        Translation.objects.remove_for(obj, 'en-us')
+        eq_(self.TranslatedModel.objects.get(id=1).description, None)
+
+    def test_get_trans(self):
+        def get_objs():
+            with CaptureQueriesContext(connection) as context:
+                objs = list(self.TranslatedModel.objects.order_by('id'))
+            return objs, len(context.captured_queries)
+
+        objs, num_queries = get_objs()
+        # One query for the objects and one for all their translations.
+        eq_(num_queries, 2)
+        eq_([unicode(obj.name) for obj in objs],
+            ['some name', 'speak American', 'hot dogs'])
+        eq_(unicode(objs[0].no_locale), 'blammo')
+
+        objs, num_queries = get_objs()
+        eq_(num_queries, 1)
+        eq_([unicode(obj.name) for obj in objs],
+            ['some name', 'speak American', 'hot dogs'])
+
+    def test_attach_trans_dicts(self):
+        obj = self.TranslatedModel.objects.get(id=1)
+        fancy = self.FancyModel.objects.get(id=1)
+        loader.local_cache.clear()
+        with self.assertNumQueries(1):
+            attach_trans_dicts([(self.TranslatedModel, [obj]),
+                                (self.FancyModel, [fancy])])
+        eq_(sorted(obj.translations[obj.name_id]),
+            [('de', 'German!! (unst unst)'), ('en-us', 'some name')])
+        eq_(fancy.translations[fancy.purified_id],
+            [('en-us', unicode(fancy.purified))])
@@ -1,22 +1,24 @@
 from django.conf import settings
-from django.db import connections, models, router
+from django.db import models
 from django.utils import translation
 
-from mkt.translations.models import Translation
+from mkt.translations.loader import TranslationLoader
 
-isnull = """IF(!ISNULL({t1}.localized_string), {t1}.{col}, {t2}.{col})
-            AS {name}_{col}"""
-join = """LEFT OUTER JOIN translations {t}
-          ON ({t}.id={model}.{name} AND {t}.locale={locale})"""
-no_locale_join = """LEFT OUTER JOIN translations {t}
-                    ON {t}.id={model}.{name}"""
-
-trans_fields = [f.name for f in Translation._meta.fields]
 
+def get_trans(items):
+    """
+    Attach the translations of `items` in the current locale, falling back to
+    the fallback locale of the model (see `get_fallback()`), or to any locale
+    for fields that don't require one.
+
+    The translations of all the items are loaded at once, see
+    `mkt.translations.loader.TranslationLoader`.
+    """
+    if not items:
+        return
 
-def build_query(model, connection):
-    qn = connection.ops.quote_name
-    selects, joins, params = [], [], []
+    model = items[0].__class__
+    fields = model._meta.translated_fields
 
     # The model can define a fallback locale (which may be a Field).
     if hasattr(model, 'get_fallback'):
@@ -24,59 +26,33 @@ def build_query(model, connection):
     else:
         fallback = settings.LANGUAGE_CODE
 
-    # Add the selects and joins for each translated field on the model.
-    for field in model._meta.translated_fields:
-        if isinstance(fallback, models.Field):
-            fallback_str = '%s.%s' % (qn(model._meta.db_table),
-                                      qn(fallback.column))
-        else:
-            fallback_str = '%s'
-
-        name = field.column
-        d = {'t1': 't1_' + name, 't2': 't2_' + name,
-             'model': qn(model._meta.db_table), 'name': name}
-
-        selects.extend(isnull.format(col=f, **d) for f in trans_fields)
-
-        joins.append(join.format(t=d['t1'], locale='%s', **d))
-        params.append(translation.get_language())
-
-        if field.require_locale:
-            joins.append(join.format(t=d['t2'], locale=fallback_str, **d))
-            if not isinstance(fallback, models.Field):
-                params.append(fallback)
-        else:
-            joins.append(no_locale_join.format(t=d['t2'], **d))
-
-    # ids will be added later on.
-    sql = """SELECT {model}.{pk}, {selects} FROM {model} {joins}
-             WHERE {model}.{pk} IN {{ids}}"""
-    s = sql.format(selects=','.join(selects), joins='\n'.join(joins),
-                   model=qn(model._meta.db_table), pk=model._meta.pk.column)
-    return s, params
-
-
-def get_trans(items):
-    if not items:
-        return
-
-    model = items[0].__class__
-    # FIXME: if we knew which db the queryset we are transforming used, we
-    # could make sure we are re-using the same one.
-    dbname = router.db_for_read(model)
-    connection = connections[dbname]
-    sql, params = build_query(model, connection)
-    item_dict = dict((item.pk, item) for item in items)
-    ids = ','.join(map(str, item_dict.keys()))
-
-    cursor = connection.cursor()
-    cursor.execute(sql.format(ids='(%s)' % ids), tuple(params))
-    step = len(trans_fields)
-    for row in cursor.fetchall():
-        # We put the item's pk as the first selected field.
-        item = item_dict[row[0]]
-        for index, field in enumerate(model._meta.translated_fields):
-            start = 1 + step * index
-            t = Translation(*row[start:start + step])
-            if t.id is not None and t.localized_string is not None:
+    lang = translation.get_language()
+    loader = TranslationLoader()
+    for item in items:
+        for field in fields:
+            trans_id = getattr(item, field.attname)
+            loader.add(trans_id, lang)
+            if not field.require_locale:
+                loader.add_all(trans_id)
+            elif isinstance(fallback, models.Field):
+                loader.add(trans_id, getattr(item, fallback.attname))
+            else:
+                loader.add(trans_id, fallback)
+    loader.load()
+
+    for item in items:
+        for field in fields:
+            trans_id = getattr(item, field.attname)
+            if trans_id is None:
+                continue
+            t = loader.get(trans_id, lang)
+            if t is None or t.localized_string is None:
+                if not field.require_locale:
+                    t = next((t for t in loader.get_all(trans_id)
+                              if t.localized_string is not None), None)
+                elif isinstance(fallback, models.Field):
+                    t = loader.get(trans_id, getattr(item, fallback.attname))
+                else:
+                    t = loader.get(trans_id, fallback)
+            if t is not None and t.localized_string is not None:
                 setattr(item, field.name, t)
@@ -4,10 +4,12 @@ import time
 from datetime import datetime
 
 from django.conf import settings
+from django.db import connection
 from django.db.models import Q
 
 import commonware.log
 import cronjobs
+import numpy
 from celery import chord
 
 import mkt
@@ -106,33 +108,51 @@ def clean_old_signed(seconds=60 * 60):
                 private_storage.delete(full)
 
 
-def _get_installs(app_id):
-    """
-    Calculate popularity of app for all regions and per region.
+# How many days back do we include when calculating popularity.
+POPULARITY_PERIOD = 90
+
+# How many days back do we include when calculating trending: the last week
+# and the 3 weeks before.
+TRENDING_PERIOD = 29
 
-    Returns value in the format of::
+# How many app installs are required in the prior week to be considered
+# "trending". Adjust this as total Marketplace app installs increases.
+#
+# Note: AMO uses 1000.0 for add-ons.
+PRIOR_WEEK_INSTALL_THRESHOLD = 100.0
 
-        {'all': <global installs>,
-         <region_slug>: <regional installs>,
-         ...}
 
+def _get_score_regions():
     """
-    # How many days back do we include when calculating popularity.
-    POPULARITY_PERIOD = 90
+    Return the (region id, region slug) tuples scores are computed for, in
+    the order of the region axis of the installs arrays. The global score
+    comes first and is stored with region=0.
+    """
+    return [(0, 'all')] + [(region.id, region.slug) for region in
+                           mkt.regions.REGIONS_DICT.values()]
 
-    client = get_monolith_client()
 
-    popular = {
-        'filter': {
-            'range': {
-                'date': {
-                    'gte': days_ago(POPULARITY_PERIOD).date().isoformat(),
-                    'lte': days_ago(1).date().isoformat()
-                }
-            }
+def _get_daily_installs(app_ids, days):
+    """
+    Return the daily installs of `app_ids` over the last `days` days (up to
+    yesterday), fetched with a single Monolith query.
+
+    The result is a float array of shape (apps, regions, days): apps in the
+    order of `app_ids`, regions in the order of `_get_score_regions()` and
+    days from the oldest to yesterday.
+    """
+    regions = dict((slug, index) for index, (_, slug)
+                   in enumerate(_get_score_regions()))
+    first_day = days_ago(days).date()
+    installs = numpy.zeros((len(app_ids), len(regions), days))
+
+    daily = {
+        'date_histogram': {
+            'field': 'date',
+            'interval': 'day'
         },
-        'aggs': {
-            'total_installs': {
+        'aggregations': {
+            'installs': {
                 'sum': {
                     'field': 'app_installs'
                 }
@@ -144,19 +164,35 @@ def _get_installs(app_id):
         'query': {
             'filtered': {
                 'query': {'match_all': {}},
-                'filter': {'term': {'app-id': app_id}}
+                'filter': {
+                    'and': [
+                        {'terms': {'app-id': list(app_ids)}},
+                        {'range': {'date': {
+                            'gte': first_day.isoformat(),
+                            'lte': days_ago(1).date().isoformat()}}}
+                    ]
+                }
             }
         },
         'aggregations': {
-            'popular': popular,
-            'region': {
+            'app': {
                 'terms': {
-                    'field': 'region',
-                    # Add size so we get all regions, not just the top 10.
-                    'size': len(mkt.regions.ALL_REGIONS)
+                    'field': 'app-id',
+                    'size': len(app_ids)
                 },
                 'aggregations': {
-                    'popular': popular
+                    'daily': daily,
+                    'region': {
+                        'terms': {
+                            'field': 'region',
+                            # Add size so we get all regions, not just the top
+                            # 10.
+                            'size': len(mkt.regions.ALL_REGIONS)
+                        },
+                        'aggregations': {
+                            'daily': daily
+                        }
+                    }
                 }
             }
         },
@@ -164,314 +200,148 @@ def _get_installs(app_id):
     }
 
     try:
-        res = client.raw(query)
+        res = get_monolith_client().raw(query)
     except ValueError as e:
         task_log.error('Error response from Monolith: {0}'.format(e))
-        return {}
+        return installs
 
     if 'aggregations' not in res:
-        task_log.error('No installs for app {}'.format(app_id))
-        return {}
-
-    results = {
-        'all': res['aggregations']['popular']['total_installs']['value']
-    }
-
-    if 'region' in res['aggregations']:
-        for regional_res in res['aggregations']['region']['buckets']:
-            region_slug = regional_res['key']
-            popular = regional_res['popular']['total_installs']['value']
-            results[region_slug] = popular
-
-    return results
-
-
-@cronjobs.register
-@use_master
-def update_app_installs():
+        task_log.error('No installs for apps {0}-{1}'.format(
+            app_ids[0], app_ids[-1]))
+        return installs
+
+    def _fill(app_index, region_index, buckets):
+        for bucket in buckets:
+            day = datetime.utcfromtimestamp(bucket['key'] / 1000).date()
+            day_index = (day - first_day).days
+            if 0 <= day_index < days:
+                installs[app_index, region_index, day_index] = (
+                    bucket['installs']['value'])
+
+    apps = dict((app_id, index) for index, app_id in enumerate(app_ids))
+    for app_res in res['aggregations']['app']['buckets']:
+        app_index = apps.get(int(app_res['key']))
+        if app_index is None:
+            continue
+        _fill(app_index, 0, app_res['daily']['buckets'])
+        for regional_res in app_res.get('region', {}).get('buckets', []):
+            region_index = regions.get(regional_res['key'])
+            if region_index:
+                _fill(app_index, region_index,
+                      regional_res['daily']['buckets'])
+
+    return installs
+
+
+def _get_popularity(installs):
     """
-    Update app install counts for all published apps.
-
-    We break these into chunks so we can bulk index them. Each chunk will
-    process the apps in it and reindex them in bulk. After all the chunks are
-    processed we find records that haven't been updated and purge/reindex those
-    so we nullify their values.
+    Calculate the popularity of apps for all regions and per region from an
+    (apps, regions, days) array of daily installs: the installs over the
+    last POPULARITY_PERIOD days.
 
+    Returns an (apps, regions) array.
     """
-    chunk_size = 100
-
-    ids = list(Webapp.objects.filter(status=mkt.STATUS_PUBLIC,
-                                     disabled_by_user=False)
-                     .values_list('id', flat=True))
-
-    for chunk in chunked(ids, chunk_size):
+    return installs[:, :, -POPULARITY_PERIOD:].sum(axis=2)
 
-        count = 0
-        times = []
-        reindex_ids = []
-
-        for app in Webapp.objects.filter(id__in=chunk).no_transforms():
-
-            reindex = False
-            count += 1
-            now = datetime.now()
-            t_start = time.time()
-
-            scores = _get_installs(app.id)
-
-            # Update global installs, then per-region installs below.
-            value = scores.get('all')
-            if value > 0:
-                reindex = True
-                installs, created = app.popularity.get_or_create(
-                    region=0, defaults={'value': value})
-                if not created:
-                    installs.update(value=value, modified=now)
-            else:
-                # The value is <= 0 so we can just ignore it.
-                app.popularity.filter(region=0).delete()
-
-            for region in mkt.regions.REGIONS_DICT.values():
-                value = scores.get(region.slug)
-                if value > 0:
-                    reindex = True
-                    installs, created = app.popularity.get_or_create(
-                        region=region.id, defaults={'value': value})
-                    if not created:
-                        installs.update(value=value, modified=now)
-                else:
-                    # The value is <= 0 so we can just ignore it.
-                    app.popularity.filter(region=region.id).delete()
-
-            if reindex:
-                reindex_ids.append(app.id)
-
-            times.append(time.time() - t_start)
-
-        # Now reindex the apps that actually have a popularity value.
-        if reindex_ids:
-            WebappIndexer.run_indexing(reindex_ids)
-
-        log.info('Installs calculated for %s apps. Avg time overall: '
-                 '%0.2fs' % (count, sum(times) / count))
-
-    # Purge any records that were not updated.
-    #
-    # Note: We force update `modified` even if no data changes so any records
-    # with older modified times can be purged.
-    now = datetime.now()
-    midnight = datetime(year=now.year, month=now.month, day=now.day)
 
-    qs = Installs.objects.filter(modified__lte=midnight)
-    # First get the IDs so we know what to reindex.
-    purged_ids = qs.values_list('addon', flat=True).distinct()
-    # Then delete them.
-    qs.delete()
-
-    for ids in chunked(purged_ids, chunk_size):
-        WebappIndexer.run_indexing(ids)
-
-
-def _get_trending(app_id):
+def _get_trending(installs):
     """
-    Calculate trending for app for all regions and per region.
+    Calculate trending of apps for all regions and per region from an
+    (apps, regions, days) array of daily installs.
 
     a = installs from 8 days ago to 1 day ago
     b = installs from 29 days ago to 9 days ago, averaged per week
     trending = (a - b) / b if a > 100 and b > 1 else 0
 
-    Returns value in the format of::
-
-        {'all': <global trending score>,
-         <region_slug>: <regional trending score>,
-         ...}
+    Apps whose global installs over the last week are under the threshold
+    aren't trending in any region.
 
+    Returns an (apps, regions) array.
     """
-    # How many app installs are required in the prior week to be considered
-    # "trending". Adjust this as total Marketplace app installs increases.
-    #
-    # Note: AMO uses 1000.0 for add-ons.
-    PRIOR_WEEK_INSTALL_THRESHOLD = 100.0
+    week1 = installs[:, :, -8:].sum(axis=2)
+    week3 = installs[:, :, -TRENDING_PERIOD:-8].sum(axis=2) / 3.0
 
-    client = get_monolith_client()
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        trending = numpy.where(week3 > 1.0, (week1 - week3) / week3, 0.0)
+    trending = numpy.maximum(trending, 0.0)
+    trending[week1 < PRIOR_WEEK_INSTALL_THRESHOLD] = 0.0
+    trending[week1[:, 0] < PRIOR_WEEK_INSTALL_THRESHOLD, :] = 0.0
+    return trending
 
-    week1 = {
-        'filter': {
-            'range': {
-                'date': {
-                    'gte': days_ago(8).date().isoformat(),
-                    'lte': days_ago(1).date().isoformat()
-                }
-            }
-        },
-        'aggs': {
-            'total_installs': {
-                'sum': {
-                    'field': 'app_installs'
-                }
-            }
-        }
-    }
-    week3 = {
-        'filter': {
-            'range': {
-                'date': {
-                    'gte': days_ago(29).date().isoformat(),
-                    'lte': days_ago(9).date().isoformat()
-                }
-            }
-        },
-        'aggs': {
-            'total_installs': {
-                'sum': {
-                    'field': 'app_installs'
-                }
-            }
-        }
-    }
 
-    query = {
-        'query': {
-            'filtered': {
-                'query': {'match_all': {}},
-                'filter': {'term': {'app-id': app_id}}
-            }
-        },
-        'aggregations': {
-            'week1': week1,
-            'week3': week3,
-            'region': {
-                'terms': {
-                    'field': 'region',
-                    # Add size so we get all regions, not just the top 10.
-                    'size': len(mkt.regions.ALL_REGIONS)
-                },
-                'aggregations': {
-                    'week1': week1,
-                    'week3': week3
-                }
-            }
-        },
-        'size': 0
-    }
-
-    try:
-        res = client.raw(query)
-    except ValueError as e:
-        task_log.error('Error response from Monolith: {0}'.format(e))
-        return {}
-
-    if 'aggregations' not in res:
-        task_log.error('No installs for app {}'.format(app_id))
-        return {}
-
-    def _score(week1, week3):
-        # If last week app installs are < 100, this app isn't trending.
-        if week1 < PRIOR_WEEK_INSTALL_THRESHOLD:
-            return 0.0
-
-        score = 0.0
-        if week3 > 1.0:
-            score = (week1 - week3) / week3
-        if score < 0.0:
-            score = 0.0
-        return score
-
-    # Global trending score.
-    week1 = res['aggregations']['week1']['total_installs']['value']
-    week3 = res['aggregations']['week3']['total_installs']['value'] / 3.0
-
-    if week1 < PRIOR_WEEK_INSTALL_THRESHOLD:
-        # If global installs over the last week aren't over 100, we
-        # short-circuit and return a zero-like value as this is not a trending
-        # app by definition. Since global installs aren't above 100, per-region
-        # installs won't be either.
-        return {}
-
-    results = {
-        'all': _score(week1, week3)
-    }
-
-    if 'region' in res['aggregations']:
-        for regional_res in res['aggregations']['region']['buckets']:
-            region_slug = regional_res['key']
-            week1 = regional_res['week1']['total_installs']['value']
-            week3 = regional_res['week3']['total_installs']['value'] / 3.0
-            results[region_slug] = _score(week1, week3)
-
-    return results
-
-
-@cronjobs.register
-@use_master
-def update_app_trending():
+def _upsert_scores(model, scores, now):
+    """
+    Insert or update the rows of `model` (Installs or Trending) for `scores`,
+    a list of (app id, region id, value) tuples, in as few queries as
+    possible.
+    """
+    for chunk in chunked(scores, 1000):
+        sql = ('INSERT INTO {table} (addon_id, region, value, created, '
+               'modified) VALUES {values} ON DUPLICATE KEY UPDATE '
+               'value=VALUES(value), modified=VALUES(modified)').format(
+            table=model._meta.db_table,
+            values=', '.join(['(%s, %s, %s, %s, %s)'] * len(chunk)))
+        params = []
+        for app_id, region_id, value in chunk:
+            params.extend([app_id, region_id, value, now, now])
+        connection.cursor().execute(sql, params)
+
+
+def _update_app_scores(model, get_scores, days):
     """
-    Update trending for all published apps.
+    Update the scores stored in `model` (Installs or Trending) for all
+    published apps. `get_scores` calculates them from the daily installs of
+    the apps over the last `days` days, see `_get_daily_installs()`.
 
-    We break these into chunks so we can bulk index them. Each chunk will
-    process the apps in it and reindex them in bulk. After all the chunks are
-    processed we find records that haven't been updated and purge/reindex those
-    so we nullify their values.
+    We break these into chunks so we can bulk index them. The daily installs
+    of each chunk are fetched with a single Monolith query, scored with
+    array operations and the positive scores are saved in bulk, then the
+    apps that have a score are reindexed in bulk. After all the chunks are
+    processed we find records that haven't been updated and purge/reindex
+    those so we nullify their values.
+
+    Only the popularity, trending and boost fields of the apps are updated
+    in the index, see `BaseIndexer.update_partial()`.
 
     """
-    chunk_size = 100
+    # Large chunks mean fewer Monolith queries. The installs array of a
+    # chunk is about chunk size * regions * days * 8 bytes.
+    chunk_size = 1000
 
     ids = list(Webapp.objects.filter(status=mkt.STATUS_PUBLIC,
                                      disabled_by_user=False)
                      .values_list('id', flat=True))
+    region_ids = numpy.array([region_id for region_id, _
+                              in _get_score_regions()])
 
     for chunk in chunked(ids, chunk_size):
-
-        count = 0
-        times = []
-        reindex_ids = []
-
-        for app in Webapp.objects.filter(id__in=chunk).no_transforms():
-
-            reindex = False
-            count += 1
-            now = datetime.now()
-            t_start = time.time()
-
-            scores = _get_trending(app.id)
-
-            # Update global trending, then per-region trending below.
-            value = scores.get('all')
-            if value > 0:
-                reindex = True
-                trending, created = app.trending.get_or_create(
-                    region=0, defaults={'value': value})
-                if not created:
-                    trending.update(value=value, modified=now)
-            else:
-                # The value is <= 0 so the app is not trending. Let's remove it
-                # from the trending table.
-                app.trending.filter(region=0).delete()
-
-            for region in mkt.regions.REGIONS_DICT.values():
-                value = scores.get(region.slug)
-                if value > 0:
-                    reindex = True
-                    trending, created = app.trending.get_or_create(
-                        region=region.id, defaults={'value': value})
-                    if not created:
-                        trending.update(value=value, modified=now)
-                else:
-                    # The value is <= 0 so the app is not trending.
-                    # Let's remove it from the trending table.
-                    app.trending.filter(region=region.id).delete()
-
-            times.append(time.time() - t_start)
-
-            if reindex:
-                reindex_ids.append(app.id)
-
-        # Now reindex the apps that actually have a trending score.
+        now = datetime.now()
+        t_start = time.time()
+
+        scores = get_scores(_get_daily_installs(chunk, days))
+
+        app_indexes, region_indexes = numpy.nonzero(scores > 0)
+        values = zip(numpy.array(chunk)[app_indexes].tolist(),
+                     region_ids[region_indexes].tolist(),
+                     scores[app_indexes, region_indexes].tolist())
+        _upsert_scores(model, values, now)
+
+        # The values of the rows we didn't just update are <= 0 so we can just
+        # remove them.
+        updated = set((app_id, region_id) for app_id, region_id, _ in values)
+        existing = model.objects.filter(addon__in=chunk).values_list(
+            'pk', 'addon', 'region')
+        model.objects.filter(pk__in=[
+            pk for pk, app_id, region_id in existing
+            if (app_id, region_id) not in updated]).delete()
+
+        # Now reindex the apps that actually have a value.
+        reindex_ids = sorted(set(app_id for app_id, _, _ in values))
         if reindex_ids:
-            WebappIndexer.run_indexing(reindex_ids)
+            WebappIndexer.update_partial(reindex_ids)
 
-        log.info('Trending calculated for %s apps. Avg time overall: '
-                 '%0.2fs' % (count, sum(times) / count))
+        log.info('%s calculated for %s apps in %0.2fs' % (
+            model.__name__, len(chunk), time.time() - t_start))
 
     # Purge any records that were not updated.
     #
@@ -480,14 +350,28 @@ def update_app_trending():
     now = datetime.now()
     midnight = datetime(year=now.year, month=now.month, day=now.day)
 
-    qs = Trending.objects.filter(modified__lte=midnight)
+    qs = model.objects.filter(modified__lte=midnight)
     # First get the IDs so we know what to reindex.
-    purged_ids = qs.values_list('addon', flat=True).distinct()
+    purged_ids = list(qs.values_list('addon', flat=True).distinct())
     # Then delete them.
     qs.delete()
 
     for ids in chunked(purged_ids, chunk_size):
-        WebappIndexer.run_indexing(ids)
+        WebappIndexer.update_partial(ids)
+
+
+@cronjobs.register
+@use_master
+def update_app_installs():
+    """Update app install counts for all published apps."""
+    _update_app_scores(Installs, _get_popularity, POPULARITY_PERIOD)
+
+
+@cronjobs.register
+@use_master
+def update_app_trending():
+    """Update trending for all published apps."""
+    _update_app_scores(Trending, _get_trending, TRENDING_PERIOD)
 
 
 @cronjobs.register
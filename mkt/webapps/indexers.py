@@ -1,7 +1,7 @@
-from operator import attrgetter
+import json
+from operator import attrgetter, itemgetter
 
 from django.core.urlresolvers import reverse
-from django.db.models import Min
 
 import commonware.log
 from elasticsearch_dsl import F
@@ -10,9 +10,11 @@ from elasticsearch_dsl.filter import Bool
 import mkt
 from mkt.constants import APP_FEATURES
 from mkt.constants.applications import DEVICE_GAIA
-from mkt.prices.models import AddonPremium
+from mkt.constants.regions import ALL_REGION_IDS
+from mkt.prices.models import AddonPremium, Price
 from mkt.search.indexers import BaseIndexer
 from mkt.search.utils import Search
+from mkt.site.utils import sorted_groupby
 from mkt.tags.models import attach_tags
 from mkt.translations.models import attach_trans_dict
 
@@ -40,6 +42,15 @@ class WebappIndexer(BaseIndexer):
         'description_l10n_*',
     )
 
+    # Only the weight of the name suggestion is in the partial documents, it
+    # can't be merged into documents without a suggestion.
+    partial_existing_fields = ('name_suggest',)
+
+    # Apps are indexed on every save and by the popularity crons, bumping the
+    # generation for each of these would invalidate the cached searches all
+    # the time.
+    generation_per_write = False
+
     """
     Bunch of ES stuff for Webapp include mappings, indexing, search.
     """
@@ -173,6 +184,9 @@ class WebappIndexer(BaseIndexer):
                         'type': 'object',
                         'dynamic': 'true',
                     },
+                    # Prices of the tier by region, only used to serialize
+                    # the app price without hitting the database.
+                    'price_data': {'type': 'object', 'enabled': False},
                     'price_tier': cls.string_not_indexed(),
                     'promo_img_hash': cls.string_not_indexed(),
                     'ratings': {
@@ -233,22 +247,147 @@ class WebappIndexer(BaseIndexer):
     @classmethod
     def extract_document(cls, pk=None, obj=None):
         """Extracts the ElasticSearch index document for this instance."""
-        from mkt.webapps.models import (AppFeatures, attach_devices,
+        if obj is None:
+            obj = cls.get_model().objects.get(pk=pk)
+
+        return cls._extract_document(obj, cls._prefetch_for_documents([obj]))
+
+    @classmethod
+    def extract_documents(cls, objs):
+        """
+        Extracts the ElasticSearch index documents for a list of apps.
+
+        Everything the documents need is fetched for all the apps at once, in
+        a fixed number of queries, and the documents are then built from
+        memory. Apps for which the extraction fails are logged and skipped.
+        """
+        prefetched = cls._prefetch_for_documents(objs)
+
+        docs = []
+        for obj in objs:
+            try:
+                docs.append(cls._extract_document(obj, prefetched))
+            except Exception as e:
+                log.error('Failed to index webapp {0}: {1}'
+                          .format(obj.id, repr(e)),
+                          # Trying to chase down a cache-machine problem.
+                          exc_info="marketplace:" in str(e))
+        return docs
+
+    @classmethod
+    def _prefetch_for_documents(cls, objs):
+        """
+        Fetches the related data needed to build the documents of `objs`.
+
+        Some of it is attached to the instances (devices, prices, tags,
+        translations and manifests), the rest is returned as a dict of
+        {app id: value} dicts consumed by `_extract_document()`.
+        """
+        from mkt.reviewers.models import EscalationQueue, RereviewQueue
+        from mkt.versions.models import Version
+        from mkt.webapps.models import (AddonUpsell, AddonUser, AppFeatures,
+                                        AppManifest, attach_devices,
                                         attach_prices, attach_translations,
+                                        ContentRating, Preview,
                                         RatingDescriptors, RatingInteractives)
 
-        if obj is None:
-            obj = cls.get_model().objects.get(pk=pk)
+        ids = [obj.id for obj in objs]
 
         # Attach everything we need to index apps.
         for transform in (attach_devices, attach_prices, attach_tags,
                           attach_translations):
-            transform([obj])
+            transform(objs)
+
+        current_versions = filter(None, (o.current_version for o in objs))
+        latest_versions = filter(None, (o.latest_version for o in objs))
+        if current_versions:
+            attach_trans_dict(Version, current_versions)
+
+        # Prime the `manifest` cached property of the versions we look at,
+        # it's used both for `installs_allowed_from` and `is_privileged`.
+        manifests = dict(AppManifest.objects.filter(
+            version__in=[v.id for v in current_versions + latest_versions])
+            .values_list('version', 'manifest'))
+        for version in current_versions + latest_versions:
+            if 'manifest' not in version.__dict__:
+                manifest = manifests.get(version.id)
+                version.__dict__['manifest'] = (json.loads(manifest)
+                                                if manifest else {})
+
+        def by_app(qs, key='addon_id'):
+            return dict((k, list(v)) for k, v in sorted_groupby(qs, key))
+
+        data = {}
+        data['features'] = dict(
+            (f.version_id, f.to_dict()) for f in
+            AppFeatures.objects.filter(
+                version__in=[v.id for v in current_versions]))
+        data['escalation_date'] = dict(
+            EscalationQueue.objects.filter(addon__in=ids)
+            .values_list('addon', 'created'))
+        data['rereview_date'] = dict(
+            RereviewQueue.objects.filter(addon__in=ids)
+            .values_list('addon', 'created'))
+        data['content_ratings'] = by_app(
+            ContentRating.objects.filter(addon__in=ids))
+        data['rating_descriptors'] = dict(
+            (r.addon_id, r) for r in
+            RatingDescriptors.objects.filter(addon__in=ids))
+        data['rating_interactives'] = dict(
+            (r.addon_id, r) for r in
+            RatingInteractives.objects.filter(addon__in=ids))
+        data['owners'] = by_app(
+            AddonUser.objects.filter(addon__in=ids,
+                                     role=mkt.AUTHOR_ROLE_OWNER)
+            .values_list('addon', 'user'), key=itemgetter(0))
+        data['previews'] = by_app(
+            Preview.objects.filter(addon__in=ids).no_transforms())
+        data['price_tier'] = dict(
+            (ap.addon_id, ap.price) for ap in
+            AddonPremium.objects.filter(addon__in=ids)
+            .select_related('price'))
+        if data['price_tier']:
+            # The price data of the tiers is stored in the documents, make
+            # sure it's fresh.
+            Price.transformer([])
+        data['versions'] = by_app(
+            Version.objects.filter(addon__in=ids).no_transforms())
+        data['tv_featured'] = set(
+            cls.get_model().tags.through.objects
+            .filter(webapp__in=ids, tag__tag_text='featured-tv')
+            .values_list('webapp', flat=True))
+
+        # Upsells point to other apps that are probably not in `objs`.
+        upsells = dict(AddonUpsell.objects.filter(free__in=ids)
+                       .values_list('free', 'premium'))
+        premiums = list(cls.get_model().with_deleted.filter(
+            id__in=upsells.values())) if upsells else []
+        premiums_by_id = dict((p.id, p) for p in premiums)
+        data['upsell'] = dict(
+            (free_id, premiums_by_id[premium_id])
+            for free_id, premium_id in upsells.items()
+            if premium_id in premiums_by_id)
+
+        data['region_exclusions'] = (
+            cls.get_model().get_excluded_region_ids_by_app(
+                list(objs) + premiums))
+        data['trending'], data['popularity'] = (
+            cls.get_popularity_trending_by_id(objs))
+
+        return data
+
+    @classmethod
+    def _extract_document(cls, obj, prefetched):
+        """
+        Builds the document for `obj` from the data returned by
+        `_prefetch_for_documents()`.
+        """
+        from mkt.webapps.models import AppFeatures
 
         latest_version = obj.latest_version
         version = obj.current_version
-        features = (version.features.to_dict()
-                    if version else AppFeatures().to_dict())
+        features = (prefetched['features'].get(version.id)
+                    if version else None) or AppFeatures().to_dict()
 
         try:
             status = latest_version.statuses[0][1] if latest_version else None
@@ -264,33 +403,28 @@ class WebappIndexer(BaseIndexer):
         d['app_type'] = obj.app_type_id
         d['author'] = obj.developer_name
         d['category'] = obj.categories if obj.categories else []
-        d['content_ratings'] = (obj.get_content_ratings_by_body(es=True) or
-                                None)
-        try:
-            d['content_descriptors'] = obj.rating_descriptors.to_keys()
-        except RatingDescriptors.DoesNotExist:
-            d['content_descriptors'] = []
+        d['content_ratings'] = (obj.get_content_ratings_by_body(
+            es=True,
+            content_ratings=prefetched['content_ratings'].get(obj.id, []))
+            or None)
+        descriptors = prefetched['rating_descriptors'].get(obj.id)
+        d['content_descriptors'] = descriptors.to_keys() if descriptors else []
         d['current_version'] = version.version if version else None
         d['device'] = getattr(obj, 'device_ids', [])
         d['features'] = features
         d['has_public_stats'] = obj.public_stats
-        try:
-            d['interactive_elements'] = obj.rating_interactives.to_keys()
-        except RatingInteractives.DoesNotExist:
-            d['interactive_elements'] = []
+        interactives = prefetched['rating_interactives'].get(obj.id)
+        d['interactive_elements'] = (interactives.to_keys()
+                                     if interactives else [])
         d['installs_allowed_from'] = (
             version.manifest.get('installs_allowed_from', ['*'])
             if version else ['*'])
         d['is_priority'] = obj.priority_review
 
-        is_escalated = obj.escalationqueue_set.exists()
-        d['is_escalated'] = is_escalated
-        d['escalation_date'] = (obj.escalationqueue_set.get().created
-                                if is_escalated else None)
-        is_rereviewed = obj.rereviewqueue_set.exists()
-        d['is_rereviewed'] = is_rereviewed
-        d['rereview_date'] = (obj.rereviewqueue_set.get().created
-                              if is_rereviewed else None)
+        d['escalation_date'] = prefetched['escalation_date'].get(obj.id)
+        d['is_escalated'] = obj.id in prefetched['escalation_date']
+        d['rereview_date'] = prefetched['rereview_date'].get(obj.id)
+        d['is_rereviewed'] = obj.id in prefetched['rereview_date']
 
         if latest_version:
             d['latest_version'] = {
@@ -313,25 +447,25 @@ class WebappIndexer(BaseIndexer):
         d['manifest_url'] = obj.get_manifest_url()
         d['package_path'] = obj.get_package_path()
         d['name_sort'] = unicode(obj.name).lower()
-        d['owners'] = [au.user.id for au in
-                       obj.addonuser_set.filter(role=mkt.AUTHOR_ROLE_OWNER)]
+        d['owners'] = [user_id for _, user_id in
+                       prefetched['owners'].get(obj.id, [])]
 
         d['previews'] = [{'filetype': p.filetype, 'modified': p.modified,
                           'id': p.id, 'sizes': p.sizes}
-                         for p in obj.previews.all()]
-        try:
-            p = obj.addonpremium.price
-            d['price_tier'] = p.name
-        except AddonPremium.DoesNotExist:
-            d['price_tier'] = None
+                         for p in prefetched['previews'].get(obj.id, [])]
+        price = prefetched['price_tier'].get(obj.id)
+        d['price_tier'] = price.name if price else None
+        d['price_data'] = (cls.extract_price_data(price)
+                           if price and obj.is_premium() else None)
 
         d['ratings'] = {
             'average': obj.average_rating,
             'count': obj.total_reviews,
         }
-        d['region_exclusions'] = obj.get_excluded_region_ids()
-        d['reviewed'] = obj.versions.filter(
-            deleted=False).aggregate(Min('reviewed')).get('reviewed__min')
+        d['region_exclusions'] = prefetched['region_exclusions'][obj.id]
+        versions = prefetched['versions'].get(obj.id, [])
+        reviewed = filter(None, (v.reviewed for v in versions))
+        d['reviewed'] = min(reviewed) if reviewed else None
 
         # The default locale of the app is considered "supported" by default.
         supported_locales = [obj.default_locale]
@@ -342,23 +476,23 @@ class WebappIndexer(BaseIndexer):
         d['supported_locales'] = list(set(supported_locales))
 
         d['tags'] = getattr(obj, 'tags_list', [])
-        d['tv_featured'] = obj.tags.filter(
-            tag_text='featured-tv').exists()
+        d['tv_featured'] = obj.id in prefetched['tv_featured']
 
-        if obj.upsell and obj.upsell.premium.is_published():
-            upsell_obj = obj.upsell.premium
+        upsell_obj = prefetched['upsell'].get(obj.id)
+        if upsell_obj and upsell_obj.is_published():
             d['upsell'] = {
                 'id': upsell_obj.id,
                 'app_slug': upsell_obj.app_slug,
                 'icon_url': upsell_obj.get_icon_url(128),
                 # TODO: Store all localizations of upsell.name.
                 'name': unicode(upsell_obj.name),
-                'region_exclusions': upsell_obj.get_excluded_region_ids()
+                'region_exclusions': (
+                    prefetched['region_exclusions'][upsell_obj.id])
             }
 
         d['versions'] = [dict(version=v.version,
                               resource_uri=reverse_version(v))
-                         for v in obj.versions.all()]
+                         for v in versions]
 
         # Handle localized fields.
         # This adds both the field used for search and the one with
@@ -372,14 +506,15 @@ class WebappIndexer(BaseIndexer):
             d.update(cls.extract_field_translations(obj, field))
 
         if version:
-            attach_trans_dict(version._meta.model, [version])
             d.update(cls.extract_field_translations(
                 version, 'release_notes', db_field='releasenotes_id'))
         else:
             d['release_notes_translations'] = None
 
         # Add boost, popularity, trending values.
-        d.update(cls.extract_popularity_trending_boost(obj))
+        d.update(cls.extract_popularity_trending_boost(
+            obj, trending=prefetched['trending'][obj.id],
+            popularity=prefetched['popularity'][obj.id]))
 
         # If the app is compatible with Firefox OS, push suggestion data in the
         # index - This will be used by RocketbarView API, which is specific to
@@ -405,6 +540,48 @@ class WebappIndexer(BaseIndexer):
 
         return d
 
+    @classmethod
+    def extract_partial_documents(cls, objs):
+        """
+        Extracts the boost, popularity and trending values of a list of apps,
+        along with the weight of their name suggestion, which is the boost.
+        """
+        from mkt.webapps.models import attach_devices
+
+        attach_devices(objs)
+        trending, popularity = cls.get_popularity_trending_by_id(objs)
+
+        docs = []
+        for obj in objs:
+            d = {'id': obj.id}
+            d.update(cls.extract_popularity_trending_boost(
+                obj, trending=trending[obj.id],
+                popularity=popularity[obj.id]))
+            # Partial documents are merged into the indexed ones, so this only
+            # changes the weight of the suggestion built by
+            # `_extract_document()`, see `partial_existing_fields`.
+            if (DEVICE_GAIA.id in getattr(obj, 'device_ids', []) and
+                    obj.is_published()):
+                d['name_suggest'] = {'weight': int(d['boost'])}
+            docs.append(d)
+        return docs
+
+    @classmethod
+    def extract_price_data(cls, tier):
+        """
+        Returns the price of the tier `tier` and its price and currency in
+        every region that has one, for the default payment provider. This is
+        what the API needs to serialize the price of a premium app.
+        """
+        prices = []
+        for region_id in ALL_REGION_IDS:
+            price_currency = tier.get_price_currency(region=region_id)
+            if price_currency:
+                prices.append({'region': region_id,
+                               'price': unicode(price_currency.price),
+                               'currency': price_currency.currency})
+        return {'price': unicode(tier.price), 'prices': prices}
+
     @classmethod
     def get_indexable(cls):
         """Returns the queryset of ids of all things to be indexed."""
@@ -418,20 +595,11 @@ class WebappIndexer(BaseIndexer):
 
         log.info('Indexing %s webapps' % len(ids))
 
-        qs = Webapp.with_deleted.filter(id__in=ids)
         ES = ES or cls.get_es()
 
-        docs = []
-        for obj in list(qs):
-            try:
-                docs.append(cls.extract_document(obj.id, obj=obj))
-            except Exception as e:
-                log.error('Failed to index webapp {0}: {1}'
-                          .format(obj.id, repr(e)),
-                          # Trying to chase down a cache-machine problem.
-                          exc_info="marketplace:" in str(e))
+        docs = cls.iter_documents(ids, qs=Webapp.with_deleted)
 
-        cls.bulk_index(docs, es=ES, index=index or cls.get_index())
+        return cls.bulk_index(docs, es=ES, index=index or cls.get_index())
 
     @classmethod
     def filter_by_apps(cls, app_ids, queryset=None):
@@ -44,9 +44,10 @@ from mkt.constants.payments import PROVIDER_CHOICES
 from mkt.constants.regions import RESTOFWORLD
 from mkt.files.models import File, nfd_str
 from mkt.files.utils import parse_addon, WebAppParser
-from mkt.prices.models import AddonPremium
+from mkt.prices.models import AddonPremium, default_providers, PriceCurrency
 from mkt.ratings.models import Review
-from mkt.regions.utils import parse_region
+from mkt.regions.utils import (mask_to_region_ids, parse_region,
+                               region_ids_to_mask)
 from mkt.site.decorators import use_master
 from mkt.site.helpers import absolutify
 from mkt.site.mail import send_mail
@@ -217,6 +218,58 @@ class AddonUser(models.Model):
                           ('addon', 'listed'))
 
 
+def get_preview_file_extension(filetype):
+    # Assume that blank is an image.
+    if not filetype:
+        return 'png'
+    return filetype.split('/')[1]
+
+
+def get_preview_image_path(preview_id, filetype, is_thumbnail=False):
+    """
+    Returns the storage path of the image of the preview `preview_id`.
+
+    Module-level so that the ES serializers can build preview paths and URLs
+    from the indexed data without instantiating Preview.
+    """
+    if is_thumbnail:
+        path_template = settings.PREVIEW_THUMBNAIL_PATH
+    else:
+        path_template = settings.PREVIEW_FULL_PATH
+    args = [preview_id / 1000, preview_id]
+    if '.png' not in path_template:
+        args.append(get_preview_file_extension(filetype))
+    return path_template % tuple(args)
+
+
+def get_preview_image_url(preview_id, filetype, modified, is_thumbnail=False):
+    """
+    Returns the URL of the image of the preview `preview_id`. `modified` is
+    the modification date of the preview, either as a datetime or as the
+    string stored in ES.
+    """
+    if modified is not None:
+        if isinstance(modified, unicode):
+            modified = datetime.datetime.strptime(modified,
+                                                  '%Y-%m-%dT%H:%M:%S')
+        modified = int(time.mktime(modified.timetuple()))
+    else:
+        modified = 0
+    if storage_is_remote():
+        path = get_preview_image_path(preview_id, filetype,
+                                      is_thumbnail=is_thumbnail)
+        return '%s?modified=%s' % (public_storage.url(path), modified)
+    else:
+        if is_thumbnail:
+            url_template = static_url('PREVIEW_THUMBNAIL_URL')
+        else:
+            url_template = static_url('PREVIEW_FULL_URL')
+        args = [preview_id / 1000, preview_id, modified]
+        if '.png' not in url_template:
+            args.insert(2, get_preview_file_extension(filetype))
+        return url_template % tuple(args)
+
+
 class Preview(ModelBase):
     addon = models.ForeignKey('Webapp', related_name='previews')
     filetype = models.CharField(max_length=25)
@@ -232,35 +285,12 @@ class Preview(ModelBase):
         index_together = ('addon', 'position', 'created')
 
     def _image_url(self, is_thumbnail=False):
-        if self.modified is not None:
-            if isinstance(self.modified, unicode):
-                self.modified = datetime.datetime.strptime(self.modified,
-                                                           '%Y-%m-%dT%H:%M:%S')
-            modified = int(time.mktime(self.modified.timetuple()))
-        else:
-            modified = 0
-        if storage_is_remote():
-            path = self._image_path(is_thumbnail=is_thumbnail)
-            return '%s?modified=%s' % (public_storage.url(path), modified)
-        else:
-            if is_thumbnail:
-                url_template = static_url('PREVIEW_THUMBNAIL_URL')
-            else:
-                url_template = static_url('PREVIEW_FULL_URL')
-            args = [self.id / 1000, self.id, modified]
-            if '.png' not in url_template:
-                args.insert(2, self.file_extension)
-            return url_template % tuple(args)
+        return get_preview_image_url(self.id, self.filetype, self.modified,
+                                     is_thumbnail=is_thumbnail)
 
     def _image_path(self, is_thumbnail=False):
-        if is_thumbnail:
-            path_template = settings.PREVIEW_THUMBNAIL_PATH
-        else:
-            path_template = settings.PREVIEW_FULL_PATH
-        args = [self.id / 1000, self.id]
-        if '.png' not in path_template:
-            args.append(self.file_extension)
-        return path_template % tuple(args)
+        return get_preview_image_path(self.id, self.filetype,
+                                      is_thumbnail=is_thumbnail)
 
     def as_dict(self, src=None):
         d = {'full': urlparams(self.image_url, src=src),
@@ -277,10 +307,7 @@ class Preview(ModelBase):
 
     @property
     def file_extension(self):
-        # Assume that blank is an image.
-        if not self.filetype:
-            return 'png'
-        return self.filetype.split('/')[1]
+        return get_preview_file_extension(self.filetype)
 
     @property
     def thumbnail_url(self):
@@ -1661,23 +1688,122 @@ class Webapp(UUIDModelMixin, OnChangeMixin, ModelBase):
 
         Note: free and in-app are not included in this.
         """
-        excluded = set(self.addonexcludedregion
-                           .values_list('region', flat=True))
+        return mask_to_region_ids(self.get_excluded_region_mask())
+
+    def get_excluded_region_mask(self):
+        """
+        Return the excluded regions of the app as a mask of region ids (see
+        `region_ids_to_mask()`), cached until the exclusions, geodata or
+        price tier of the app change.
+        """
+        key = excluded_regions_cache_key(self.id)
+        mask = cache.get(key)
+        if mask is None:
+            excluded = self.addonexcludedregion.values_list('region',
+                                                            flat=True)
+            # All the regions that are currently paid for an app.
+            price_ids = (self.get_price_region_ids() if self.is_premium()
+                         else None)
+            mask = region_ids_to_mask(
+                self._excluded_region_ids(excluded, price_ids, self.geodata))
+            cache.set(key, mask)
+        return mask
+
+    @classmethod
+    def get_excluded_region_ids_by_app(cls, apps):
+        """
+        Bulk version of `get_excluded_region_ids()`: returns a dict mapping
+        the id of each app in `apps` to its excluded region ids.
+        """
+        return dict((pk, mask_to_region_ids(mask)) for pk, mask
+                    in cls.get_excluded_region_masks_by_app(apps).items())
 
-        if self.is_premium():
+    @classmethod
+    def get_excluded_region_masks_by_app(cls, apps):
+        """
+        Bulk version of `get_excluded_region_mask()`: returns a dict mapping
+        the id of each app in `apps` to its excluded region mask, using a
+        fixed number of queries for the apps that are not cached.
+        """
+        if not apps:
+            return {}
+        keys = dict((excluded_regions_cache_key(app.id), app.id)
+                    for app in apps)
+        result = dict((keys[key], mask) for key, mask
+                      in cache.get_many(keys.keys()).items())
+        missing = [app for app in apps if app.id not in result]
+        if missing:
+            computed = dict(
+                (pk, region_ids_to_mask(excluded)) for pk, excluded
+                in cls._get_excluded_region_ids_by_app(missing).items())
+            cache.set_many(dict((excluded_regions_cache_key(pk), mask)
+                                for pk, mask in computed.items()))
+            result.update(computed)
+        return result
+
+    @classmethod
+    def _get_excluded_region_ids_by_app(cls, apps):
+        """
+        Compute the excluded region ids of each app in `apps`, using a fixed
+        number of queries regardless of the number of apps.
+        """
+        ids = [app.id for app in apps]
+
+        excluded = dict((pk, []) for pk in ids)
+        for addon_id, region in (AddonExcludedRegion.objects
+                                 .filter(addon__in=ids)
+                                 .values_list('addon', 'region')):
+            excluded[addon_id].append(region)
+
+        geodata = dict((geo.addon_id, geo) for geo in
+                       Geodata.objects.filter(addon__in=ids))
+
+        # Make sure the AddonPremium (and its price tier) are available
+        # without an extra query per app.
+        Webapp.attach_premiums([app for app in apps
+                                if not hasattr(app, '_premium')])
+        tiers = dict((app.id, app.get_tier()) for app in apps
+                     if app.is_premium())
+        tier_ids = set(tier.id for tier in tiers.values() if tier)
+        price_ids = dict((tier_id, []) for tier_id in tier_ids)
+        if tier_ids:
+            for tier_id, region in (PriceCurrency.objects
+                                    .filter(tier__in=tier_ids, paid=True,
+                                            provider__in=default_providers())
+                                    .values_list('tier', 'region')):
+                price_ids[tier_id].append(region)
+
+        result = {}
+        for app in apps:
+            if app.is_premium():
+                tier = tiers.get(app.id)
+                app_price_ids = price_ids[tier.id] if tier else []
+            else:
+                app_price_ids = None
+            result[app.id] = cls._excluded_region_ids(
+                excluded[app.id], app_price_ids,
+                geodata.get(app.id) or app.geodata)
+        return result
+
+    @staticmethod
+    def _excluded_region_ids(excluded, price_ids, geo):
+        """
+        Compute the excluded region ids of an app from its explicit
+        exclusions, the ids of the regions its price tier is paid in (`None`
+        for apps that are not premium) and its `Geodata`.
+        """
+        excluded = set(excluded)
+
+        if price_ids is not None:
             all_regions = set(mkt.regions.ALL_REGION_IDS)
             # Find every region that does not have payments supported
             # and add that into the exclusions.
-            #
-            # All the regions that are currently paid for an app.
-            price_ids = self.get_price_region_ids()
             if RESTOFWORLD.id in excluded or RESTOFWORLD.id not in price_ids:
                 # If the "rest of the world" is excluded or its not in the
                 # list of valid price ids then we need to exclude all
                 # countries that don't have payments.
                 excluded = excluded.union(all_regions.difference(price_ids))
 
-        geo = self.geodata
         if geo.region_de_iarc_exclude or geo.region_de_usk_exclude:
             excluded.add(mkt.regions.DEU.id)
         if geo.region_br_iarc_exclude:
@@ -1973,15 +2099,20 @@ class Webapp(UUIDModelMixin, OnChangeMixin, ModelBase):
         """
         return hashlib.sha512(settings.SECRET_KEY + str(self.id)).hexdigest()
 
-    def get_content_ratings_by_body(self, es=False):
+    def get_content_ratings_by_body(self, es=False, content_ratings=None):
         """
         Gets content ratings on this app keyed by bodies.
 
         es -- denotes whether to return ES-friendly results (just the IDs of
               rating classes) to fetch and translate later.
+        content_ratings -- the ContentRating instances of this app, if they
+                           have already been fetched.
         """
-        content_ratings = {}
-        for cr in self.content_ratings.all():
+        if content_ratings is None:
+            content_ratings = self.content_ratings.all()
+
+        ratings_by_body = {}
+        for cr in content_ratings:
             body = cr.get_body()
             rating_serialized = {
                 'body': body.id,
@@ -1989,9 +2120,9 @@ class Webapp(UUIDModelMixin, OnChangeMixin, ModelBase):
             }
             if not es:
                 rating_serialized = dehydrate_content_rating(rating_serialized)
-            content_ratings[body.label] = rating_serialized
+            ratings_by_body[body.label] = rating_serialized
 
-        return content_ratings
+        return ratings_by_body
 
     def set_iarc_info(self, submission_id, security_code):
         """
@@ -2245,8 +2376,8 @@ def update_search_index(sender, instance, **kw):
     from . import tasks
     if not kw.get('raw'):
         if instance.upsold and instance.upsold.free_id:
-            tasks.index_webapps.delay([instance.upsold.free_id])
-        tasks.index_webapps.delay([instance.id])
+            tasks.queue_index_webapps([instance.upsold.free_id])
+        tasks.queue_index_webapps([instance.id])
 
 
 @receiver(dbsignals.post_save, sender=AddonUpsell,
@@ -2256,9 +2387,9 @@ def update_search_index_upsell(sender, instance, **kw):
     # upsell/upsold properties in ES.
     from . import tasks
     if instance.free:
-        tasks.index_webapps.delay([instance.free.id])
+        tasks.queue_index_webapps([instance.free.id])
     if instance.premium:
-        tasks.index_webapps.delay([instance.premium.id])
+        tasks.queue_index_webapps([instance.premium.id])
 
 
 models.signals.pre_save.connect(save_signal, sender=Webapp,
@@ -2419,10 +2550,51 @@ def get_excluded_in(region_id):
 
 @receiver(models.signals.post_save, sender=AddonExcludedRegion,
           dispatch_uid='clean_memoized_exclusions')
-def clean_memoized_exclusions(sender, **kw):
+@receiver(models.signals.post_delete, sender=AddonExcludedRegion,
+          dispatch_uid='clean_memoized_exclusions.post_delete')
+def clean_memoized_exclusions(sender, instance, **kw):
     if not kw.get('raw'):
-        cache.delete_many([memoize_key('get_excluded_in', k)
-                           for k in mkt.regions.ALL_REGION_IDS])
+        cache.delete(memoize_key('get_excluded_in', instance.region))
+        invalidate_excluded_regions([instance.addon_id])
+
+
+def excluded_regions_cache_key(app_id):
+    """Cache key of the excluded region mask of the app `app_id`."""
+    return 'webapps:excluded_regions:%s' % app_id
+
+
+def invalidate_excluded_regions(app_ids):
+    """Remove the cached excluded region masks of the apps `app_ids`."""
+    cache.delete_many([excluded_regions_cache_key(pk) for pk in app_ids])
+
+
+@Webapp.on_change
+def watch_premium_type(old_attr=None, new_attr=None, instance=None,
+                       sender=None, **kw):
+    """Premium apps are excluded from regions their tier isn't paid in."""
+    if (old_attr or {}).get('premium_type') != (new_attr or {}).get(
+            'premium_type'):
+        invalidate_excluded_regions([instance.id])
+
+
+@receiver(models.signals.post_save, sender=AddonPremium,
+          dispatch_uid='addonpremium_excluded_regions.post_save')
+@receiver(models.signals.post_delete, sender=AddonPremium,
+          dispatch_uid='addonpremium_excluded_regions.post_delete')
+def addonpremium_excluded_regions(sender, instance, **kw):
+    if not kw.get('raw'):
+        invalidate_excluded_regions([instance.addon_id])
+
+
+@receiver(models.signals.post_save, sender=PriceCurrency,
+          dispatch_uid='pricecurrency_excluded_regions.post_save')
+@receiver(models.signals.post_delete, sender=PriceCurrency,
+          dispatch_uid='pricecurrency_excluded_regions.post_delete')
+def pricecurrency_excluded_regions(sender, instance, **kw):
+    if not kw.get('raw'):
+        invalidate_excluded_regions(
+            AddonPremium.objects.filter(price=instance.tier_id)
+                                .values_list('addon_id', flat=True))
 
 
 class IARCInfo(ModelBase):
@@ -2782,3 +2954,13 @@ for region in (mkt.regions.BRA, mkt.regions.DEU):
 # Save geodata translations when a Geodata instance is saved.
 models.signals.pre_save.connect(save_signal, sender=Geodata,
                                 dispatch_uid='geodata_translations')
+
+
+@receiver(models.signals.post_save, sender=Geodata,
+          dispatch_uid='geodata_excluded_regions')
+def geodata_excluded_regions(sender, instance, **kw):
+    """The exclusion flags of Geodata exclude apps from Brazil and Germany."""
+    if not kw.get('raw'):
+        cache.delete_many([memoize_key('get_excluded_in', region.id)
+                           for region in (mkt.regions.BRA, mkt.regions.DEU)])
+        invalidate_excluded_regions([instance.addon_id])
@@ -1,14 +1,18 @@
 import json
+import os
+from collections import OrderedDict
 from decimal import Decimal
+from operator import attrgetter
 
 from django.conf import settings
 from django.core.urlresolvers import reverse
 
 import commonware.log
-from rest_framework import response, serializers
+from rest_framework import relations, response, serializers
 from django.utils.translation import ungettext as ngettext
 
 import mkt
+from lib.utils import static_url
 from mkt.api.fields import (ESTranslationSerializerField, LargeTextField,
                             ReverseChoiceField, SemiSerializerMethodField,
                             TranslationSerializerField)
@@ -16,16 +20,20 @@ from mkt.constants.applications import DEVICE_TYPES
 from mkt.constants.categories import CATEGORY_CHOICES
 from mkt.constants.iarc_mappings import HUMAN_READABLE_DESCS_AND_INTERACTIVES
 from mkt.constants.payments import PROVIDER_BANGO
+from mkt.developers.models import AddonPaymentAccount
 from mkt.features.utils import load_feature_profile
-from mkt.prices.models import AddonPremium, Price
-from mkt.search.serializers import BaseESSerializer, es_to_datetime
+from mkt.prices.models import AddonPremium, Price, price_locale
+from mkt.search.serializers import BaseESDictSerializer, BaseESSerializer
 from mkt.site.helpers import absolutify
+from mkt.site.utils import cached_property, get_icon_url, get_promo_img_url
 from mkt.submit.forms import mark_for_rereview
 from mkt.submit.serializers import PreviewSerializer, SimplePreviewSerializer
 from mkt.tags.models import attach_tags
 from mkt.translations.utils import no_translation
 from mkt.versions.models import Version
-from mkt.webapps.models import (AddonUpsell, AppFeatures, Geodata, Preview,
+from mkt.webapps.indexers import WebappIndexer
+from mkt.webapps.models import (AddonUpsell, AddonUser, AppFeatures, Geodata,
+                                get_preview_image_url, Installed, Preview,
                                 Webapp)
 from mkt.webapps.utils import dehydrate_content_rating
 
@@ -42,6 +50,57 @@ def http_error(errorclass, reason, extra_data=None):
     return response.Response(r)
 
 
+def get_es_content_ratings(data, region_slug):
+    """
+    Return the content ratings of an app for the region `region_slug` from
+    its ES data.
+    """
+    body = mkt.regions.REGION_TO_RATINGS_BODY().get(region_slug, 'generic')
+    prefix = 'has_%s' % body
+
+    # Backwards incompat with old index.
+    for i, desc in enumerate(data.get('content_descriptors', [])):
+        if desc.isupper():
+            data['content_descriptors'][i] = 'has_' + desc.lower()
+    for i, inter in enumerate(data.get('interactive_elements', [])):
+        if inter.isupper():
+            data['interactive_elements'][i] = 'has_' + inter.lower()
+
+    return {
+        'body': body,
+        'rating': dehydrate_content_rating(
+            (data.get('content_ratings') or {})
+            .get(body)) or None,
+        'descriptors': [key for key in
+                        data.get('content_descriptors', [])
+                        if prefix in key],
+        'descriptors_text': [HUMAN_READABLE_DESCS_AND_INTERACTIVES[key]
+                             for key
+                             in data.get('content_descriptors')
+                             if prefix in key],
+        'interactives': data.get('interactive_elements', []),
+        'interactives_text': [HUMAN_READABLE_DESCS_AND_INTERACTIVES[key]
+                              for key
+                              in data.get('interactive_elements')]
+    }
+
+
+def get_es_upsell(data, region_id):
+    """
+    Return the upsell of an app from its ES data, or False if there isn't
+    one available in the region `region_id`.
+    """
+    upsell = data.get('upsell', False)
+    if upsell:
+        exclusions = upsell.get('region_exclusions')
+        if exclusions is not None and region_id not in exclusions:
+            upsell['resource_uri'] = reverse('app-detail',
+                                             kwargs={'pk': upsell['id']})
+        else:
+            upsell = False
+    return upsell
+
+
 class AppFeaturesSerializer(serializers.ModelSerializer):
     class Meta:
         model = AppFeatures
@@ -499,35 +558,7 @@ class ESAppSerializer(BaseESSerializer, AppSerializer):
         return self.fake_object(data)
 
     def get_content_ratings(self, obj):
-        body = (mkt.regions.REGION_TO_RATINGS_BODY().get(
-            self._get_region_slug(), 'generic'))
-        prefix = 'has_%s' % body
-
-        # Backwards incompat with old index.
-        for i, desc in enumerate(obj.es_data.get('content_descriptors', [])):
-            if desc.isupper():
-                obj.es_data['content_descriptors'][i] = 'has_' + desc.lower()
-        for i, inter in enumerate(obj.es_data.get('interactive_elements', [])):
-            if inter.isupper():
-                obj.es_data['interactive_elements'][i] = 'has_' + inter.lower()
-
-        return {
-            'body': body,
-            'rating': dehydrate_content_rating(
-                (obj.es_data.get('content_ratings') or {})
-                .get(body)) or None,
-            'descriptors': [key for key in
-                            obj.es_data.get('content_descriptors', [])
-                            if prefix in key],
-            'descriptors_text': [HUMAN_READABLE_DESCS_AND_INTERACTIVES[key]
-                                 for key
-                                 in obj.es_data.get('content_descriptors')
-                                 if prefix in key],
-            'interactives': obj.es_data.get('interactive_elements', []),
-            'interactives_text': [HUMAN_READABLE_DESCS_AND_INTERACTIVES[key]
-                                  for key
-                                  in obj.es_data.get('interactive_elements')]
-        }
+        return get_es_content_ratings(obj.es_data, self._get_region_slug())
 
     def get_feature_compatibility(self, app):
         # We're supposed to be filtering out incompatible apps anyway, so don't
@@ -544,16 +575,8 @@ class ESAppSerializer(BaseESSerializer, AppSerializer):
         return obj.es_data.get('ratings', {})
 
     def get_upsell(self, obj):
-        upsell = obj.es_data.get('upsell', False)
-        if upsell:
-            region_id = self.context['request'].REGION.id
-            exclusions = upsell.get('region_exclusions')
-            if exclusions is not None and region_id not in exclusions:
-                upsell['resource_uri'] = reverse('app-detail',
-                                                 kwargs={'pk': upsell['id']})
-            else:
-                upsell = False
-        return upsell
+        return get_es_upsell(obj.es_data,
+                             self.context['request'].REGION.id)
 
     def get_absolute_url(self, obj):
         return absolutify(obj.get_absolute_url())
@@ -605,6 +628,353 @@ class ESAppFeedCollectionSerializer(BaseESAppFeedSerializer):
         ]
 
 
+class ESAppImages(object):
+    """
+    The attributes of Webapp needed to build the URLs of its icons and promo
+    images, set from the ES data of the app.
+    """
+    icon_type = 'image/png'
+
+    def __init__(self, data):
+        self.id = self.pk = data['id']
+        self.icon_hash = data.get('icon_hash')
+        self.promo_img_hash = data.get('promo_img_hash')
+
+    def get_icon_dir(self):
+        return os.path.join(settings.ADDON_ICONS_PATH, str(self.id / 1000))
+
+    def get_icon_url(self, size):
+        return get_icon_url(static_url('ADDON_ICON_URL'), self, size)
+
+    def get_promo_img_url(self, size):
+        if not self.promo_img_hash:
+            return ''
+        return get_promo_img_url(static_url('WEBAPP_PROMO_IMG_URL'), self,
+                                 size,
+                                 default_format='webapp-promo-img-{size}.png')
+
+
+class ESAppDictSerializer(BaseESDictSerializer):
+    """
+    Serializes apps straight from their ES data. The output is the same as
+    ESAppSerializer's, without building fake Webapp, Version and Preview
+    instances for every app.
+    """
+    class Meta:
+        fields = [field for field in ESAppSerializer.Meta.fields
+                  if field != 'upsold']
+
+    @cached_property
+    def region(self):
+        return getattr(self.context.get('request'), 'REGION', None)
+
+    @cached_property
+    def region_id(self):
+        return self.region.id if self.region else None
+
+    @cached_property
+    def serialized_regions(self):
+        """(region id, serialized region) for all regions, sorted by slug."""
+        return [
+            (region.id, OrderedDict([
+                ('name', self.to_text(region.name)),
+                ('slug', self.to_text(region.slug)),
+                ('mcc', self.to_text(region.mcc)),
+                ('adolescent', self.to_boolean(region.adolescent)),
+            ]))
+            for region in sorted(mkt.regions.REGIONS_CHOICES_ID_DICT.values(),
+                                 key=attrgetter('slug'))]
+
+    def _is_deleted(self, data):
+        # Webapp.current_version and latest_version are None for deleted
+        # apps, so are the fields coming from them.
+        return data['status'] == mkt.STATUS_DELETED
+
+    @cached_property
+    def _prices(self):
+        # `_get_prices()` results by app id, several fields need them.
+        return {}
+
+    def _get_prices(self, data):
+        """
+        Return a (tier price, price, currency) tuple for the app in the
+        current region, or None if the app has no price tier.
+        """
+        if data['id'] not in self._prices:
+            self._prices[data['id']] = self._find_prices(data)
+        return self._prices[data['id']]
+
+    def _find_prices(self, data):
+        if data.get('premium_type') not in mkt.ADDON_PREMIUMS:
+            return None
+        if 'price_data' in data:
+            price_data = data['price_data']
+        else:
+            # The app was indexed before we stored its price data.
+            premium = (AddonPremium.objects.select_related('price')
+                       .filter(addon=data['id']).first())
+            price_data = (WebappIndexer.extract_price_data(premium.price)
+                          if premium and premium.price else None)
+        if not price_data:
+            return None
+
+        # Look in the current region, then fall back to the rest of the
+        # world, like Webapp.get_price().
+        prices = dict((p['region'], p) for p in price_data['prices'])
+        excluded = data['region_exclusions']
+        for region_id in (self.region_id, mkt.regions.RESTOFWORLD.id):
+            if region_id not in excluded and region_id in prices:
+                price = prices[region_id]
+                return price_data['price'], price['price'], price['currency']
+        return price_data['price'], None, None
+
+    def _hyperlink(self, view_name, pk):
+        # Reverse like the hyperlinked fields do, rest framework's reverse is
+        # monkeypatched by mkt.api.patch.
+        return relations.reverse(view_name, kwargs={'pk': pk},
+                                 request=self.context.get('request'),
+                                 format=self.context.get('format'))
+
+    def get_absolute_url(self, data):
+        return absolutify(reverse('detail', args=[data['app_slug']]))
+
+    def get_app_type(self, data):
+        app_type = data['app_type']
+        if (app_type == mkt.ADDON_WEBAPP_PRIVILEGED and
+                self._is_deleted(data)):
+            # Webapp.app_type can't tell a deleted app is privileged.
+            app_type = mkt.ADDON_WEBAPP_PACKAGED
+        return mkt.ADDON_WEBAPP_TYPES[app_type]
+
+    def get_author(self, data):
+        if self._is_deleted(data):
+            return None
+        return self.to_text(data['author'])
+
+    def get_categories(self, data):
+        categories = data['category']
+        return list(categories) if categories is not None else None
+
+    def get_content_ratings(self, data):
+        return get_es_content_ratings(
+            data, self.region.slug if self.region else None)
+
+    def get_created(self, data):
+        return self.to_datetime(data.get('created'))
+
+    def get_current_version(self, data):
+        if self._is_deleted(data):
+            return None
+        return self.to_text(data['current_version'])
+
+    def get_default_locale(self, data):
+        return self.to_text(data.get('default_locale'))
+
+    def get_description(self, data):
+        return self.get_translations(data, 'description',
+                                     data.get('default_locale'))
+
+    def get_device_types(self, data):
+        return [DEVICE_TYPES[d].api_name for d in data['device']]
+
+    def get_feature_compatibility(self, data):
+        # See ESAppSerializer.get_feature_compatibility().
+        return None
+
+    def get_file_size(self, data):
+        return data.get('file_size')
+
+    def get_group(self, data):
+        # Feed collection.
+        return self.get_translations(data, 'group',
+                                     data.get('default_locale'))
+
+    def get_homepage(self, data):
+        return self.get_translations(data, 'homepage',
+                                     data.get('default_locale'))
+
+    def get_hosted_url(self, data):
+        return self.to_text(data.get('hosted_url'))
+
+    def get_icons(self, data):
+        images = ESAppImages(data)
+        return dict([(icon_size, images.get_icon_url(icon_size))
+                     for icon_size in mkt.CONTENT_ICON_SIZES])
+
+    def get_id(self, data):
+        return int(data['id'])
+
+    def get_is_disabled(self, data):
+        return self.to_boolean(data['is_disabled'])
+
+    def get_is_homescreen(self, data):
+        return data.get('is_homescreen')
+
+    def get_is_offline(self, data):
+        return self.to_boolean(data.get('is_offline'))
+
+    def get_is_packaged(self, data):
+        return data['app_type'] != mkt.ADDON_WEBAPP_HOSTED
+
+    def get_last_updated(self, data):
+        return self.to_datetime(data.get('last_updated'))
+
+    def get_manifest_url(self, data):
+        return self.to_text(data.get('manifest_url'))
+
+    def get_modified(self, data):
+        return self.to_datetime(data.get('modified'))
+
+    def get_name(self, data):
+        return self.get_translations(data, 'name', data.get('default_locale'))
+
+    def get_package_path(self, data):
+        return data.get('package_path')
+
+    def get_payment_account(self, data):
+        if data.get('premium_type') not in mkt.ADDON_PREMIUMS:
+            return None
+        # This is a soon to be deprecated API property that only returns the
+        # Bango account for historic compatibility.
+        accounts = list(AddonPaymentAccount.objects.filter(
+            addon=data['id'], payment_account__provider=PROVIDER_BANGO)
+            .values_list('payment_account', flat=True))
+        if len(accounts) != 1:
+            return None
+        return reverse('payment-account-detail', args=[accounts[0]])
+
+    def get_payment_required(self, data):
+        prices = self._get_prices(data)
+        return bool(prices and Decimal(prices[0]))
+
+    def get_premium_type(self, data):
+        premium_type = data.get('premium_type')
+        if premium_type is None:
+            return None
+        return mkt.ADDON_PREMIUM_API.get(premium_type)
+
+    def get_previews(self, data):
+        return [OrderedDict([
+            ('filetype', self.to_text(p['filetype'])),
+            ('id', int(p['id'])),
+            ('image_url', get_preview_image_url(
+                p['id'], p['filetype'], self.to_datetime(p['modified']))),
+            ('thumbnail_url', get_preview_image_url(
+                p['id'], p['filetype'], self.to_datetime(p['modified']),
+                is_thumbnail=True)),
+        ]) for p in data['previews']]
+
+    def get_price(self, data):
+        prices = self._get_prices(data)
+        return prices[1] if prices else None
+
+    def get_price_locale(self, data):
+        prices = self._get_prices(data)
+        if prices and prices[1] is not None:
+            return price_locale(Decimal(prices[1]), prices[2])
+        return None
+
+    def get_privacy_policy(self, data):
+        return self._hyperlink('app-privacy-policy-detail', data['id'])
+
+    def get_promo_imgs(self, data):
+        images = ESAppImages(data)
+        return dict([(promo_img_size, images.get_promo_img_url(promo_img_size))
+                     for promo_img_size in mkt.PROMO_IMG_SIZES])
+
+    def get_public_stats(self, data):
+        return self.to_boolean(data['has_public_stats'])
+
+    def get_ratings(self, data):
+        return data.get('ratings', {})
+
+    def get_regions(self, data):
+        excluded = set(data['region_exclusions'])
+        return [region for region_id, region in self.serialized_regions
+                if region_id not in excluded]
+
+    def get_release_notes(self, data):
+        if self._is_deleted(data):
+            return None
+        return self.get_translations(data, 'release_notes',
+                                     data.get('default_locale'))
+
+    def get_resource_uri(self, data):
+        return self._hyperlink('app-detail', data['id'])
+
+    def get_reviewed(self, data):
+        return self.to_datetime(data.get('reviewed'))
+
+    def get_slug(self, data):
+        return self.to_text(data['app_slug'])
+
+    def get_status(self, data):
+        return data['status']
+
+    def get_support_email(self, data):
+        return self.get_translations(data, 'support_email',
+                                     data.get('default_locale'))
+
+    def get_support_url(self, data):
+        return self.get_translations(data, 'support_url',
+                                     data.get('default_locale'))
+
+    def get_supported_locales(self, data):
+        locs = '' if self._is_deleted(data) else data['supported_locales']
+        if locs:
+            return locs.split(',') if isinstance(locs, basestring) else locs
+        else:
+            return []
+
+    def get_tags(self, data):
+        return data['tags']
+
+    def get_upsell(self, data):
+        return get_es_upsell(data, self.context['request'].REGION.id)
+
+    def get_user(self, data):
+        request = self.context.get('request')
+        if request and request.user.is_authenticated():
+            user = request.user
+            return {
+                'developed': AddonUser.objects.filter(
+                    addon=data['id'], user=user,
+                    role=mkt.AUTHOR_ROLE_OWNER).exists(),
+                'installed': Installed.objects.filter(
+                    addon=data['id'], user=user).exists(),
+                'purchased': data['id'] in user.purchase_ids(),
+            }
+
+    def get_versions(self, data):
+        return dict((v['version'], v['resource_uri'])
+                    for v in data['versions'])
+
+
+class ESAppFeedDictSerializer(ESAppDictSerializer):
+    """
+    Like ESAppFeedSerializer, serializing apps straight from their ES data.
+    """
+    class Meta:
+        fields = ESAppFeedSerializer.Meta.fields
+
+    def get_icons(self, data):
+        """
+        Only need the 64px icon for Feed.
+        """
+        return {
+            '64': ESAppImages(data).get_icon_url(64)
+        }
+
+
+class ESAppFeedCollectionDictSerializer(ESAppFeedDictSerializer):
+    """
+    Like ESAppFeedCollectionSerializer, serializing apps straight from their
+    ES data.
+    """
+    class Meta:
+        fields = ESAppFeedCollectionSerializer.Meta.fields
+
+
 class SimpleAppSerializer(AppSerializer):
     """
     App serializer with fewer fields (and fewer db queries as a result).
@@ -636,9 +1006,8 @@ class SuggestionsESAppSerializer(ESAppSerializer):
         return app.get_icon_url(64)
 
 
-class RocketbarESAppSerializer(serializers.Serializer):
+class RocketbarESAppSerializer(BaseESDictSerializer):
     """Used by Firefox OS's Rocketbar apps viewer."""
-    name = ESTranslationSerializerField()
 
     @property
     def data(self):
@@ -648,25 +1017,17 @@ class RocketbarESAppSerializer(serializers.Serializer):
         return self._data
 
     def to_representation(self, obj):
-        # fake_app is a fake instance because we need to access a couple
-        # properties and methods on Webapp. It should never hit the database.
-        self.fake_app = Webapp(
-            id=obj['id'], icon_type='image/png',
-            default_locale=obj.get('default_locale', settings.LANGUAGE_CODE),
-            icon_hash=obj.get('icon_hash'),
-            modified=es_to_datetime(obj['modified']))
-        ESTranslationSerializerField.attach_translations(
-            self.fake_app, obj, 'name')
         return {
-            'name': self.fields['name'].to_representation(
-                self.fields['name'].get_attribute(self.fake_app)),
-            'icon': self.fake_app.get_icon_url(64),
+            'name': self.get_translations(
+                obj, 'name',
+                obj.get('default_locale', settings.LANGUAGE_CODE)),
+            'icon': ESAppImages(obj).get_icon_url(64),
             'slug': obj['slug'],
             'manifest_url': obj['manifest_url'],
         }
 
 
-class RocketbarESAppSerializerV2(AppSerializer, RocketbarESAppSerializer):
+class RocketbarESAppSerializerV2(RocketbarESAppSerializer):
     """
     Replaced `icon` key with `icons` for various pixel sizes: 128, 64, 48, 32.
     """
@@ -674,5 +1035,7 @@ class RocketbarESAppSerializerV2(AppSerializer, RocketbarESAppSerializer):
     def to_representation(self, obj):
         data = super(RocketbarESAppSerializerV2, self).to_representation(obj)
         del data['icon']
-        data['icons'] = self.get_icons(self.fake_app)
+        images = ESAppImages(obj)
+        data['icons'] = dict([(icon_size, images.get_icon_url(icon_size))
+                              for icon_size in mkt.CONTENT_ICON_SIZES])
         return data
@@ -334,6 +334,19 @@ def index_webapps(ids, **kw):
         WebappIndexer.index_ids(list(webapps), no_delay=True)
 
 
+def queue_index_webapps(ids):
+    """
+    Queue apps for indexing, coalescing updates made to the same apps (see
+    BaseIndexer.queue_index_ids). Apps are queued for both the webapp and
+    homescreen indexers, each of which only indexes what it can index.
+    """
+    if settings.ES_INDEX_QUEUE_DELAY:
+        WebappIndexer.queue_index_ids(ids)
+        HomescreenIndexer.queue_index_ids(ids)
+    else:
+        index_webapps.delay(ids)
+
+
 @post_request_task(acks_late=True)
 @use_master
 def unindex_webapps(ids, **kw):
@@ -1,11 +1,12 @@
 # -*- coding: utf-8 -*-
 import os
-from datetime import datetime
+from datetime import date, datetime
 
 from django.conf import settings
 from django.core.management import call_command
 
 import mock
+import numpy
 from nose.tools import eq_
 
 import mkt
@@ -19,8 +20,10 @@ from mkt.site.storage_utils import private_storage, public_storage
 from mkt.users.models import UserProfile
 from mkt.versions.models import Version
 from mkt.webapps import cron
-from mkt.webapps.cron import (_get_installs, _get_trending, clean_old_signed,
-                              mkt_gc, update_app_installs, update_app_trending)
+from mkt.site.utils import days_ago
+from mkt.webapps.cron import (_get_daily_installs, _get_popularity,
+                              _get_trending, clean_old_signed, mkt_gc,
+                              update_app_installs, update_app_trending)
 from mkt.webapps.models import Installs, Trending, Webapp
 
 
@@ -262,14 +265,35 @@ class TestGarbage(mkt.site.tests.TestCase):
         assert not public_mock.delete.called
 
 
+def daily_installs(app_ids, days, installs):
+    """
+    Build an installs array like `_get_daily_installs()` for `app_ids` over
+    `days` days from `installs`, a dict mapping app ids to dicts mapping
+    region slugs ('all' for the global installs) to dicts mapping the
+    number of days ago to the number of installs.
+    """
+    regions = [slug for _, slug in cron._get_score_regions()]
+    array = numpy.zeros((len(app_ids), len(regions), days))
+    for app_id, app_installs in installs.items():
+        for slug, daily in app_installs.items():
+            for ago, value in daily.items():
+                array[app_ids.index(app_id), regions.index(slug),
+                      days - ago] = value
+    return array
+
+
 class TestUpdateInstalls(mkt.site.tests.TestCase):
 
     def setUp(self):
         self.app = Webapp.objects.create(status=mkt.STATUS_PUBLIC)
 
-    @mock.patch('mkt.webapps.cron._get_installs')
+    def _mock_installs(self, _mock, installs):
+        _mock.side_effect = lambda app_ids, days: daily_installs(
+            app_ids, days, installs)
+
+    @mock.patch('mkt.webapps.cron._get_daily_installs')
     def test_installs_saved(self, _mock):
-        _mock.return_value = {'all': 12.0}
+        self._mock_installs(_mock, {self.app.id: {'all': {1: 12.0}}})
         update_app_installs()
 
         eq_(get_popularity(self.app), 12.0)
@@ -280,7 +304,7 @@ class TestUpdateInstalls(mkt.site.tests.TestCase):
                 eq_(get_popularity(self.app, region=region), 0.0)
 
         # Test running again updates the values as we'd expect.
-        _mock.return_value = {'all': 2.0}
+        self._mock_installs(_mock, {self.app.id: {'all': {1: 2.0}}})
         update_app_installs()
         eq_(get_popularity(self.app), 2.0)
         for region in mkt.regions.REGIONS_DICT.values():
@@ -289,44 +313,115 @@ class TestUpdateInstalls(mkt.site.tests.TestCase):
             else:
                 eq_(get_popularity(self.app, region=region), 0.0)
 
-    @mock.patch('mkt.webapps.cron._get_installs')
+    @mock.patch('mkt.webapps.cron._get_daily_installs')
     def test_installs_deleted(self, _mock):
         self.app.trending.get_or_create(region=0, value=12.0)
 
-        _mock.return_value = {'all': 0.0}
+        self._mock_installs(_mock, {self.app.id: {'all': {1: 0.0}}})
         update_app_installs()
 
         with self.assertRaises(Installs.DoesNotExist):
             self.app.popularity.get(region=0)
 
+    @mock.patch('mkt.webapps.cron.WebappIndexer.update_partial')
+    @mock.patch('mkt.webapps.cron._get_daily_installs')
+    def test_installs_update_partial(self, _mock, update_partial_mock):
+        # Not public anymore, so not scored.
+        app2 = Webapp.objects.create(status=mkt.STATUS_PENDING)
+        app2.popularity.create(region=0, value=3.0)
+        Installs.objects.update(modified=days_ago(2))
+        self._mock_installs(_mock, {self.app.id: {'all': {1: 12.0}}})
+        update_app_installs()
+
+        # The app with installs is updated, then the app whose installs were
+        # purged.
+        eq_(update_partial_mock.call_args_list,
+            [mock.call([self.app.id]), mock.call([app2.id])])
+
     @mock.patch('mkt.webapps.cron.get_monolith_client')
-    def test_get_trending(self, _mock):
+    def test_installs_regions(self, _mock):
+        app2 = Webapp.objects.create(status=mkt.STATUS_PUBLIC)
         client = mock.Mock()
-        client.raw.return_value = {
-            'aggregations': {
-                'popular': {'total_installs': {'value': 123}},
+        client.raw.return_value = self._return_value({
+            self.app.id: {'all': {1: 100, 2: 23}, 'br': {1: 12}},
+            app2.id: {'all': {90: 4}, 'br': {3: 4}, 'us': {1: -1}}})
+        _mock.return_value = client
+
+        update_app_installs()
+
+        # A single query to Monolith for all the apps.
+        eq_(client.raw.call_count, 1)
+        eq_(dict(self.app.popularity.values_list('region', 'value')),
+            {0: 123.0, mkt.regions.BRA.id: 12.0})
+        eq_(dict(app2.popularity.values_list('region', 'value')),
+            {0: 4.0, mkt.regions.BRA.id: 4.0})
+
+        # Values that are no longer positive are removed.
+        client.raw.return_value = self._return_value({
+            self.app.id: {'all': {1: 123}, 'br': {1: 0}}})
+        update_app_installs()
+        eq_(dict(self.app.popularity.values_list('region', 'value')),
+            {0: 123.0})
+        eq_(app2.popularity.count(), 0)
+
+    def _return_value(self, installs):
+        def daily(values):
+            return {'buckets': [{
+                'key': int((days_ago(ago).date() - date(1970, 1, 1))
+                           .total_seconds() * 1000),
+                'installs': {'value': value}
+            } for ago, value in values.items()]}
+
+        buckets = []
+        for app_id, app_installs in installs.items():
+            buckets.append({
+                'key': app_id,
+                'daily': daily(app_installs.get('all', {})),
                 'region': {
                     'buckets': [
-                        {
-                            'key': 'br',
-                            'popular': {'total_installs': {'value': 12}}
-                        }
+                        {'key': region, 'daily': daily(values)}
+                        for region, values in app_installs.items()
+                        if region != 'all'
                     ]
                 }
-            }
-        }
+            })
+        return {'aggregations': {'app': {'buckets': buckets}}}
+
+    @mock.patch('mkt.webapps.cron.get_monolith_client')
+    def test_get_daily_installs(self, _mock):
+        client = mock.Mock()
+        client.raw.return_value = self._return_value({
+            self.app.id: {'all': {1: 100, 2: 23, 91: 1000}, 'br': {1: 12}},
+            # Not requested.
+            self.app.id + 1: {'all': {1: 1}}})
         _mock.return_value = client
 
-        eq_(_get_installs(self.app.id)['all'], 123.0)
-        eq_(_get_installs(self.app.id)['br'], 12.0)
+        installs = _get_daily_installs([self.app.id], 90)
+        eq_(installs.shape, (1, len(cron._get_score_regions()), 90))
+        # Days out of the period are ignored.
+        eq_(installs.sum(), 135.0)
+        eq_(installs[0, 0, -1], 100.0)
+        eq_(installs[0, 0, -2], 23.0)
+        br = [slug for _, slug in cron._get_score_regions()].index('br')
+        eq_(installs[0, br, -1], 12.0)
 
     @mock.patch('mkt.webapps.cron.get_monolith_client')
-    def test_get_installs_error(self, _mock):
+    def test_get_daily_installs_error(self, _mock):
         client = mock.Mock()
         client.raw.side_effect = ValueError
         _mock.return_value = client
 
-        eq_(_get_installs(self.app.id), {})
+        eq_(_get_daily_installs([self.app.id], 90).sum(), 0.0)
+
+    def test_get_popularity(self):
+        installs = daily_installs([1, 2], 91, {
+            1: {'all': {1: 100, 10: 20, 91: 1000}, 'br': {90: 3}},
+            2: {'us': {5: 1}}})
+        popularity = _get_popularity(installs)
+        eq_(popularity.shape, (2, len(cron._get_score_regions())))
+        # Only the last 90 days count.
+        eq_(popularity[0, 0], 120.0)
+        eq_(popularity.sum(), 124.0)
 
 
 class TestUpdateTrending(mkt.site.tests.TestCase):
@@ -334,144 +429,94 @@ class TestUpdateTrending(mkt.site.tests.TestCase):
     def setUp(self):
         self.app = Webapp.objects.create(status=mkt.STATUS_PUBLIC)
 
-    @mock.patch('mkt.webapps.cron._get_trending')
+    @mock.patch('mkt.webapps.cron._get_daily_installs')
     def test_trending_saved(self, _mock):
-        _mock.return_value = {'all': 12.0}
+        # 1st week count: 255
+        # Prior 3 weeks get averaged: (255) / 3 = 85
+        # (255 - 85) / 85 = 2.0
+        _mock.side_effect = lambda app_ids, days: daily_installs(
+            app_ids, days, {self.app.id: {'all': {1: 255, 9: 255}}})
         update_app_trending()
 
-        eq_(get_trending(self.app), 12.0)
+        eq_(get_trending(self.app), 2.0)
         for region in mkt.regions.REGIONS_DICT.values():
             if region.adolescent:
-                eq_(get_trending(self.app, region=region), 12.0)
+                eq_(get_trending(self.app, region=region), 2.0)
             else:
                 eq_(get_trending(self.app, region=region), 0.0)
 
         # Test running again updates the values as we'd expect.
-        _mock.return_value = {'all': 2.0}
+        _mock.side_effect = lambda app_ids, days: daily_installs(
+            app_ids, days, {self.app.id: {'all': {1: 102, 20: 102}}})
         update_app_trending()
         eq_(get_trending(self.app), 2.0)
-        for region in mkt.regions.REGIONS_DICT.values():
-            if region.adolescent:
-                eq_(get_trending(self.app, region=region), 2.0)
-            else:
-                eq_(get_trending(self.app, region=region), 0.0)
 
-    @mock.patch('mkt.webapps.cron._get_trending')
+    @mock.patch('mkt.webapps.cron._get_daily_installs')
     def test_trending_deleted(self, _mock):
         self.app.trending.get_or_create(region=0, value=12.0)
 
-        _mock.return_value = {'all': 0.0}
+        _mock.side_effect = lambda app_ids, days: daily_installs(
+            app_ids, days, {})
         update_app_trending()
 
         with self.assertRaises(Trending.DoesNotExist):
             self.app.trending.get(region=0)
 
-    def _return_value(self, week1, week3):
-        return {
-            'aggregations': {
-                'week1': {'total_installs': {'value': week1}},
-                'week3': {'total_installs': {'value': week3}},
-            }
-        }
-
-    def _return_value_with_regions(self, week1, week3, rweek1, rweek3):
-        return {
-            'aggregations': {
-                'week1': {'total_installs': {'value': week1}},
-                'week3': {'total_installs': {'value': week3}},
-                'region': {
-                    'buckets': [
-                        {
-                            'key': 'br',
-                            'week1': {'total_installs': {'value': rweek1}},
-                            'week3': {'total_installs': {'value': rweek3}},
-                        },
-                    ]
-                }
-            }
-        }
-
-    @mock.patch('mkt.webapps.cron.get_monolith_client')
-    def test_get_trending(self, _mock):
-        client = mock.Mock()
-        client.raw.return_value = self._return_value(255, 255)
-        _mock.return_value = client
-
+    def _get_trending(self, week1, week3, rweek1=0, rweek3=0):
+        """
+        Return the global and Brazilian trending scores of an app with
+        `week1` installs yesterday and `week3` installs 9 days ago, and the
+        same for Brazil with `rweek1` and `rweek3`.
+        """
+        installs = daily_installs([self.app.id], cron.TRENDING_PERIOD, {
+            self.app.id: {'all': {1: week1, 9: week3},
+                          'br': {2: rweek1, 29: rweek3}}})
+        trending = _get_trending(installs)
+        br = [slug for _, slug in cron._get_score_regions()].index('br')
+        return trending[0, 0], trending[0, br]
+
+    def test_get_trending(self):
         # 1st week count: 255
         # Prior 3 weeks get averaged: (255) / 3 = 85
         # (255 - 85) / 85 = 2.0
-        eq_(_get_trending(self.app.id), {'all': 2.0})
-
-    @mock.patch('mkt.webapps.cron.get_monolith_client')
-    def test_get_trending_threshold(self, _mock):
-        client = mock.Mock()
-        client.raw.return_value = self._return_value(99, 2)
-        _mock.return_value = client
+        eq_(self._get_trending(255, 255)[0], 2.0)
 
+    def test_get_trending_threshold(self):
         # 1st week count: 99
-        # 99 is less than 100 so we return {} as not trending.
-        eq_(_get_trending(self.app.id), {})
-
-    @mock.patch('mkt.webapps.cron.get_monolith_client')
-    def test_get_trending_negative(self, _mock):
-        client = mock.Mock()
-        client.raw.return_value = self._return_value(100, 1000)
-        _mock.return_value = client
+        # 99 is less than 100 so it's not trending.
+        eq_(self._get_trending(99, 2)[0], 0.0)
 
+    def test_get_trending_negative(self):
         # 1st week count: 100
         # Prior 3 week count: 1000/3 = 333.3
         # (100 - 333.3) / 333.3 = -0.7 which gets set to 0.0.
-        eq_(_get_trending(self.app.id), {'all': 0.0})
+        eq_(self._get_trending(100, 1000)[0], 0.0)
 
-    @mock.patch('mkt.webapps.cron.get_monolith_client')
-    def test_get_trending_regional(self, _mock):
-        client = mock.Mock()
-        client.raw.return_value = self._return_value_with_regions(102, 102,
-                                                                  255, 102)
-        _mock.return_value = client
+    def test_get_trending_no_prior_installs(self):
+        eq_(self._get_trending(255, 0)[0], 0.0)
 
+    def test_get_trending_regional(self):
         # We set global counts to anything over 100. See above tests. I chose
         # 102 to divide equally by 3 w/o a crazy remainder.
         #
         # 1st week regional count: 255
         # Prior 3 week regional count: 102/3 = 34
         # (255 - 34) / 34 = 6.5
-        eq_(_get_trending(self.app.id)['br'], 6.5)
-        # Make sure global trending is still correct.
-        eq_(_get_trending(self.app.id)['all'], 2.0)
-
-    @mock.patch('mkt.webapps.cron.get_monolith_client')
-    def test_get_trending_regional_threshold(self, _mock):
-        client = mock.Mock()
-        client.raw.return_value = self._return_value_with_regions(102, 102,
-                                                                  99, 99)
-        _mock.return_value = client
-
-        # 1st week regional count: 99
-        # Prior 3 week regional count: 99/3 = 33
-        # (99 - 33) / 33 = 2.0 but week1 isn't > 100 so we set to zero.
-        eq_(_get_trending(self.app.id)['br'], 0.0)
         # Make sure global trending is still correct.
-        eq_(_get_trending(self.app.id)['all'], 2.0)
-
-    @mock.patch('mkt.webapps.cron.get_monolith_client')
-    def test_get_trending_regional_negative(self, _mock):
-        client = mock.Mock()
-        client.raw.return_value = self._return_value_with_regions(102, 102,
-                                                                  100, 1000)
-        _mock.return_value = client
+        eq_(self._get_trending(102, 102, 255, 102), (2.0, 6.5))
 
+    def test_get_trending_regional_threshold(self):
         # 1st week regional count: 99
         # Prior 3 week regional count: 99/3 = 33
         # (99 - 33) / 33 = 2.0 but week1 isn't > 100 so we set to zero.
-        eq_(_get_trending(self.app.id)['br'], 0.0)
-        # Make sure global trending is still correct.
-        eq_(_get_trending(self.app.id)['all'], 2.0)
+        eq_(self._get_trending(102, 102, 99, 99), (2.0, 0.0))
 
-    @mock.patch('mkt.webapps.cron.get_monolith_client')
-    def test_get_trending_error(self, _mock):
-        client = mock.Mock()
-        client.raw.side_effect = ValueError
-        _mock.return_value = client
+    def test_get_trending_regional_negative(self):
+        # 1st week regional count: 100
+        # Prior 3 week regional count: 1000/3 = 333.3
+        # (100 - 333.3) / 333.3 = -0.7 which gets set to 0.0.
+        eq_(self._get_trending(102, 102, 100, 1000), (2.0, 0.0))
 
-        eq_(_get_trending(self.app.id), {})
+    def test_get_trending_global_threshold(self):
+        # Apps that aren't trending globally aren't trending anywhere.
+        eq_(self._get_trending(99, 2, 255, 102), (0.0, 0.0))
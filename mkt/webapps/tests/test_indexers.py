@@ -1,12 +1,14 @@
 # -*- coding: utf-8 -*-
-from django.test.utils import override_settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
 
 import json
 import mock
+from operator import itemgetter
 from nose.tools import eq_, ok_
 
 import mkt
-from mkt.constants.applications import DEVICE_TYPES
+from mkt.constants.applications import DEVICE_GAIA, DEVICE_TYPES
 from mkt.reviewers.models import EscalationQueue, RereviewQueue
 from mkt.search.utils import BOOST_MULTIPLIER_FOR_PUBLIC_CONTENT, get_boost
 from mkt.site.fixtures import fixture
@@ -112,6 +114,18 @@ class TestWebappIndexer(TestCase):
         for k, v in doc['features'].iteritems():
             eq_(v, k in enabled)
 
+    def test_extract_price_data(self):
+        obj, doc = self._get_doc()
+        eq_(doc['price_data'], None)
+
+        self.make_premium(self.app)
+        obj, doc = self._get_doc()
+        eq_(doc['price_data']['price'], u'1.00')
+        eq_(sorted(doc['price_data']['prices'], key=itemgetter('region')),
+            [{'region': region_id, 'price': u'1.00', 'currency': 'USD'}
+             for region_id in sorted([mkt.regions.RESTOFWORLD.id,
+                                      mkt.regions.USA.id])])
+
     def test_extract_regions(self):
         self.app.addonexcludedregion.create(region=mkt.regions.BRA.id)
         self.app.addonexcludedregion.create(region=mkt.regions.GBR.id)
@@ -266,6 +280,61 @@ class TestWebappIndexer(TestCase):
         # Adolescent regions trending value is not stored.
         ok_('trending_2' not in doc)
 
+    def test_extract_documents(self):
+        app2 = app_factory()
+        EscalationQueue.objects.create(addon=app2)
+        self.app.addonexcludedregion.create(region=mkt.regions.BRA.id)
+        self.app.popularity.create(region=0, value=50.0)
+
+        apps = list(Webapp.objects.filter(id__in=[self.app.pk, app2.pk])
+                                  .order_by('id'))
+        docs = WebappIndexer.extract_documents(apps)
+        eq_([doc['id'] for doc in docs], [self.app.pk, app2.pk])
+        for app, doc in zip(apps, docs):
+            eq_(doc, WebappIndexer.extract_document(app.pk, app))
+        eq_(docs[0]['region_exclusions'], [mkt.regions.BRA.id])
+        eq_(docs[0]['popularity'], 50)
+        eq_(docs[1]['is_escalated'], True)
+
+    def test_extract_documents_num_queries(self):
+        def count_queries(apps):
+            with CaptureQueriesContext(connection) as context:
+                WebappIndexer.extract_documents(apps)
+            return len(context.captured_queries)
+
+        num_queries = count_queries(list(Webapp.objects.all()))
+        for i in range(3):
+            app_factory()
+        eq_(count_queries(list(Webapp.objects.all())), num_queries)
+
+    @mock.patch('mkt.webapps.indexers.WebappIndexer._extract_document')
+    def test_extract_documents_failure(self, _extract_document_mock):
+        _extract_document_mock.side_effect = Exception
+        eq_(WebappIndexer.extract_documents([self.app]), [])
+
+    def test_extract_partial_documents(self):
+        self.app.popularity.create(region=0, value=50.0)
+        self.app.trending.create(region=0, value=10.0)
+        AddonDeviceType.objects.create(
+            addon=self.app, device_type=DEVICE_GAIA.id)
+        app2 = app_factory()
+
+        apps = list(Webapp.objects.filter(id__in=[self.app.pk, app2.pk])
+                                  .order_by('id'))
+        docs = WebappIndexer.extract_partial_documents(apps)
+        eq_([doc['id'] for doc in docs], [self.app.pk, app2.pk])
+        for app, doc in zip(apps, docs):
+            full_doc = WebappIndexer.extract_document(app.pk, app)
+            for field, value in doc.items():
+                if field == 'name_suggest':
+                    eq_(value, {'weight': full_doc[field]['weight']})
+                else:
+                    eq_(value, full_doc[field])
+        eq_(docs[0]['popularity'], 50)
+        eq_(docs[0]['trending'], 10)
+        eq_(docs[0]['name_suggest'], {'weight': int(docs[0]['boost'])})
+        ok_('name_suggest' not in docs[1])
+
 
 class TestHomescreenIndexer(TestCase):
     fixtures = fixture('webapp_337141')
@@ -1519,6 +1519,49 @@ class TestExclusions(TestCase):
         ok_(mkt.regions.BRA.id in excluded)
         ok_(mkt.regions.DEU.id in excluded)
 
+    def test_cached(self):
+        eq_(self.app.get_excluded_region_mask(),
+            1 << mkt.regions.USA.id)
+        with self.assertNumQueries(0):
+            eq_(self.app.get_excluded_region_ids(), [mkt.regions.USA.id])
+
+    def test_cache_invalidation(self):
+        self.app.update(premium_type=mkt.ADDON_FREE)
+        eq_(self.app.get_excluded_region_ids(), [mkt.regions.USA.id])
+
+        aer = self.app.addonexcludedregion.create(region=mkt.regions.BRA.id)
+        eq_(self.app.get_excluded_region_ids(),
+            sorted([mkt.regions.USA.id, mkt.regions.BRA.id]))
+        aer.delete()
+        eq_(self.app.get_excluded_region_ids(), [mkt.regions.USA.id])
+
+        self.geodata.update(region_de_usk_exclude=True)
+        eq_(self.app.get_excluded_region_ids(),
+            sorted([mkt.regions.USA.id, mkt.regions.DEU.id]))
+
+        self.app.update(premium_type=mkt.ADDON_PREMIUM)
+        ok_(mkt.regions.NIC.id in self.app.get_excluded_region_ids())
+        self.make_tier()
+        app = Webapp.objects.get(pk=self.app.pk)
+        ok_(mkt.regions.NIC.id not in app.get_excluded_region_ids())
+        self.row.update(paid=False)
+        ok_(mkt.regions.NIC.id in app.get_excluded_region_ids())
+
+    def test_by_app(self):
+        self.make_tier()
+        free = Webapp.objects.create()
+        free.addonexcludedregion.create(region=mkt.regions.BRA.id)
+        expected = {self.app.id: self.app.get_excluded_region_ids(),
+                    free.id: [mkt.regions.BRA.id]}
+        eq_(Webapp.get_excluded_region_ids_by_app([self.app, free]),
+            expected)
+        # Both are cached now.
+        with self.assertNumQueries(0):
+            eq_(Webapp.get_excluded_region_ids_by_app([self.app, free]),
+                expected)
+            eq_(Webapp.get_excluded_region_masks_by_app([free]),
+                {free.id: 1 << mkt.regions.BRA.id})
+
 
 class TestPackagedAppManifestUpdates(mkt.site.tests.TestCase):
     # Note: More extensive tests for `.update_names` are above.
@@ -7,6 +7,7 @@ from django.test.utils import override_settings
 
 import mock
 from nose.tools import eq_, ok_
+from rest_framework.renderers import JSONRenderer
 
 import mkt
 import mkt.site.tests
@@ -26,7 +27,8 @@ from mkt.versions.models import Version
 from mkt.webapps.indexers import WebappIndexer
 from mkt.webapps.models import AddonDeviceType, Installed, Preview, Webapp
 from mkt.webapps.serializers import (AppFeaturesSerializer, AppSerializer,
-                                     ESAppSerializer, SimpleAppSerializer,
+                                     ESAppDictSerializer, ESAppSerializer,
+                                     SimpleAppSerializer,
                                      SimpleESAppSerializer)
 
 
@@ -440,6 +442,7 @@ class TestAppSerializerPrices(mkt.site.tests.TestCase):
 @mock.patch('mkt.versions.models.Version.is_privileged', False)
 class TestESAppSerializer(mkt.site.tests.ESTestCase):
     fixtures = fixture('user_2519', 'webapp_337141')
+    serializer_class = ESAppSerializer
 
     def setUp(self):
         self.profile = UserProfile.objects.get(pk=2519)
@@ -465,8 +468,8 @@ class TestESAppSerializer(mkt.site.tests.ESTestCase):
             'term', id=self.app.pk).execute().hits[0]
 
     def serialize(self):
-        serializer = ESAppSerializer(self.get_obj(),
-                                     context={'request': self.request})
+        serializer = self.serializer_class(self.get_obj(),
+                                           context={'request': self.request})
         return serializer.data
 
     def test_basic(self):
@@ -784,7 +787,7 @@ class TestESAppSerializer(mkt.site.tests.ESTestCase):
         app = WebappIndexer.search().filter(
             'term', id=self.app.pk).execute().hits[0]
         app['group_translations'] = [{'lang': 'en-US', 'string': 'My Group'}]
-        res = ESAppSerializer(app, context={'request': self.request})
+        res = self.serializer_class(app, context={'request': self.request})
         eq_(res.data['group'], {'en-US': 'My Group'})
 
     def test_feature_compatibility_always_none(self):
@@ -801,6 +804,70 @@ class TestESAppSerializer(mkt.site.tests.ESTestCase):
         eq_(res['feature_compatibility'], None)
 
 
+class TestESAppDictSerializer(TestESAppSerializer):
+    serializer_class = ESAppDictSerializer
+
+    def assert_same_output(self):
+        obj = self.get_obj()
+        context = {'request': self.request}
+        eq_(JSONRenderer().render(
+            ESAppDictSerializer(obj, context=context).data),
+            JSONRenderer().render(ESAppSerializer(obj, context=context).data))
+
+    def test_same_output(self):
+        self.assert_same_output()
+
+    def test_same_output_anonymous(self):
+        self.request.user = AnonymousUser()
+        self.assert_same_output()
+
+    def test_same_output_with_lang(self):
+        self.request = RequestFactory().get('/?lang=fr')
+        self.request.REGION = mkt.regions.BRA
+        self.request.user = AnonymousUser()
+        self.assert_same_output()
+
+    def test_same_output_packaged(self):
+        self.app.update(is_packaged=True)
+        self.app.save()
+        self.refresh('webapp')
+        self.assert_same_output()
+
+    def test_same_output_premium(self):
+        self.make_premium(self.app)
+        self.app.save()
+        self.refresh('webapp')
+        self.assert_same_output()
+
+        self.request.REGION = mkt.regions.BRA
+        self.assert_same_output()
+
+    def test_premium_num_queries(self):
+        # Only the payment account needs the db.
+        self.make_premium(self.app)
+        self.app.save()
+        self.refresh('webapp')
+        self.request.user = AnonymousUser()
+        with self.assertNumQueries(1):
+            res = self.serialize()
+        eq_(res['price'], '1.00')
+
+    def test_premium_without_price_data(self):
+        # Apps indexed before the price data was stored in the index.
+        self.make_premium(self.app)
+        data = WebappIndexer.extract_document(self.app.pk)
+        del data['price_data']
+
+        self.request.user = AnonymousUser()
+        # The payment account and the price, once for all the price fields.
+        with self.assertNumQueries(2):
+            res = ESAppDictSerializer(
+                data, context={'request': self.request}).data
+        eq_(res['price'], '1.00')
+        eq_(res['price_locale'], '$1.00')
+        eq_(res['payment_required'], True)
+
+
 class TestSimpleESAppSerializer(mkt.site.tests.ESTestCase):
     fixtures = fixture('webapp_337141')
 
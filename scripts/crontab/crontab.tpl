@@ -9,6 +9,11 @@ PATH=/opt/rh/python27/root/usr/bin
 
 HOME=/tmp
 
+# Every 10 minutes.
+*/10 * * * * %(z_cron)s flush_indexing_queue_cron
+*/10 * * * * %(z_cron)s update_queue_stats_cron
+*/10 * * * * %(django)s reindex --incremental --settings=settings_local_mkt
+
 # Once per hour.
 20 * * * * %(z_cron)s addon_last_updated
 50 * * * * %(z_cron)s cleanup_extracted_file
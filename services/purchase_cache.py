@@ -0,0 +1,85 @@
+"""
+Caching of the purchase lookups done by the receipt verification service.
+
+A purchase almost never changes once made, so the result of a lookup is kept
+for a short time in a small LRU in each process and in memcached. Recording a
+refund or a chargeback invalidates the memcached entry, the local ones expire
+on their own after `RECEIPT_PURCHASE_LOCAL_CACHE_TIMEOUT` seconds.
+
+This is imported by the Django app to invalidate the cache, so it must not
+import anything from the services that would need a database connection.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+
+from lib.utils import LocalLRUCache
+
+
+local_cache = LocalLRUCache(size=10000)
+
+
+def app_purchase_key(app_id, uuid):
+    """Cache key of the purchase of the app `app_id` by the user `uuid`."""
+    # The uuid comes from the receipt, hash it to get a valid memcached key.
+    return 'receipts:purchase:app:{0}:{1}'.format(
+        app_id, hashlib.md5(unicode(uuid).encode('utf-8')).hexdigest())
+
+
+def inapp_purchase_key(contribution_id):
+    """Cache key of the in-app purchase of the contribution."""
+    return 'receipts:purchase:inapp:{0}'.format(contribution_id)
+
+
+def get_purchase(key):
+    """Return the cached purchase for `key`, or None."""
+    value = local_cache.get(key)
+    if value is None:
+        value = cache.get(key)
+        if value is not None and settings.RECEIPT_PURCHASE_LOCAL_CACHE_TIMEOUT:
+            local_cache.set(key, value,
+                            settings.RECEIPT_PURCHASE_LOCAL_CACHE_TIMEOUT)
+    return value
+
+
+def get_purchases(keys):
+    """Return a dict of the cached purchases for `keys`."""
+    found = {}
+    for key in keys:
+        value = local_cache.get(key)
+        if value is not None:
+            found[key] = value
+    missing = [key for key in keys if key not in found]
+    if missing:
+        cached = cache.get_many(missing)
+        if settings.RECEIPT_PURCHASE_LOCAL_CACHE_TIMEOUT:
+            for key, value in cached.items():
+                local_cache.set(key, value,
+                                settings.RECEIPT_PURCHASE_LOCAL_CACHE_TIMEOUT)
+        found.update(cached)
+    return found
+
+
+def set_purchase(key, value):
+    """Cache the purchase `value` for `key`."""
+    if settings.RECEIPT_PURCHASE_LOCAL_CACHE_TIMEOUT:
+        local_cache.set(key, value,
+                        settings.RECEIPT_PURCHASE_LOCAL_CACHE_TIMEOUT)
+    cache.set(key, value, settings.RECEIPT_PURCHASE_CACHE_TIMEOUT)
+
+
+def set_purchases(purchases):
+    """Cache the purchases of the `purchases` dict, by key."""
+    if settings.RECEIPT_PURCHASE_LOCAL_CACHE_TIMEOUT:
+        for key, value in purchases.items():
+            local_cache.set(key, value,
+                            settings.RECEIPT_PURCHASE_LOCAL_CACHE_TIMEOUT)
+    cache.set_many(purchases, settings.RECEIPT_PURCHASE_CACHE_TIMEOUT)
+
+
+def invalidate_purchases(keys):
+    """Remove the purchases for `keys` from the cache."""
+    for key in keys:
+        local_cache.delete(key)
+    cache.delete_many(keys)
@@ -15,6 +15,9 @@ from lib.cef_loggers import receipt_cef
 from lib.crypto.receipt import sign
 from lib.utils import static_url
 
+from services.purchase_cache import (app_purchase_key, get_purchase,
+                                     get_purchases, inapp_purchase_key,
+                                     set_purchase, set_purchases)
 from services.utils import settings
 
 from utils import (CONTRIB_CHARGEBACK, CONTRIB_NO_CHARGE, CONTRIB_PURCHASE,
@@ -30,11 +33,16 @@ import receipts  # noqa
 status_codes = {
     200: '200 OK',
     204: '204 OK',
+    400: '400 Bad Request',
     405: '405 Method Not Allowed',
     500: '500 Internal Server Error',
 }
 
 
+# POSTing a JSON list of receipts to <verify URL>/batch/ checks all of them.
+BATCH_SUFFIX = 'batch/'
+
+
 class VerificationError(Exception):
     pass
 
@@ -51,6 +59,42 @@ class RefundedReceipt(Exception):
     pass
 
 
+class ReceiptVerifier(certs.ReceiptVerifier):
+    """
+    A ReceiptVerifier that remembers the certificate chains it verified, by
+    issuer. Receipts are all signed with the same few chains, so when the
+    verifier is shared between requests this saves checking their signatures
+    for every receipt, like the verifier already saves fetching the public
+    keys of the issuers.
+    """
+
+    def __init__(self, *args, **kw):
+        super(ReceiptVerifier, self).__init__(*args, **kw)
+        self.chains = {}
+
+    def verify_certificate_chain(self, certificates, now=None):
+        if not certificates:
+            return super(ReceiptVerifier, self).verify_certificate_chain(
+                certificates, now=now)
+        if now is None:
+            now = int(time())
+
+        issuer = certificates[0].payload['iss']
+        chain = tuple((cert.signed_data, cert.signature)
+                      for cert in certificates)
+        cert = self.chains.get(issuer, {}).get(chain)
+        # Expired chains go through the full verification to raise.
+        if cert and all(c.payload['exp'] >= now for c in certificates):
+            statsd.incr('services.verify.chain.hit')
+            return cert
+
+        statsd.incr('services.verify.chain.miss')
+        cert = super(ReceiptVerifier, self).verify_certificate_chain(
+            certificates, now=now)
+        self.chains.setdefault(issuer, {})[chain] = cert
+        return cert
+
+
 class Verify:
 
     def __init__(self, receipt, environ):
@@ -60,6 +104,13 @@ class Verify:
         # This is so the unit tests can override the connection.
         self.conn, self.cursor = None, None
 
+        # The parsed storedata, see get_storedata().
+        self._storedata = None
+
+        # The purchases looked up by a BatchVerify, by cache key. None if
+        # there is no purchase.
+        self.prefetched = {}
+
     def check_full(self):
         """
         This is the default that verify will use, this will
@@ -175,13 +226,16 @@ class Verify:
     def get_storedata(self):
         """
         Attempt to retrieve the storedata information from the receipt.
+        It is only parsed once.
         """
-        try:
-            storedata = self.decoded['product']['storedata']
-            return dict(parse_qsl(storedata))
-        except Exception, e:
-            log_info('Invalid store data: {err}'.format(err=e))
-            raise InvalidReceipt('WRONG_STOREDATA')
+        if self._storedata is None:
+            try:
+                storedata = self.decoded['product']['storedata']
+                self._storedata = dict(parse_qsl(storedata))
+            except Exception, e:
+                log_info('Invalid store data: {err}'.format(err=e))
+                raise InvalidReceipt('WRONG_STOREDATA')
+        return self._storedata
 
     def get_app_id(self, raise_exception=True):
         """
@@ -226,12 +280,25 @@ class Verify:
             self.conn = mypool.connect()
             self.cursor = self.conn.cursor()
 
+    def is_inapp(self):
+        """
+        Whether the receipt is for an inapp rather than an app.
+        """
+        return 'contrib' in self.get_storedata()
+
+    def get_cached_purchase(self, key):
+        """
+        Return the purchase for `key` if it was prefetched or cached.
+        """
+        if key in self.prefetched:
+            return self.prefetched[key]
+        return get_purchase(key)
+
     def check_purchase(self):
         """
         Verifies that the app or inapp has been purchased.
         """
-        storedata = self.get_storedata()
-        if 'contrib' in storedata:
+        if self.is_inapp():
             self.check_purchase_inapp()
         else:
             self.check_purchase_app()
@@ -240,15 +307,18 @@ class Verify:
         """
         Verifies that the inapp has been purchased.
         """
-        self.setup_db()
-        sql = """SELECT i.guid, c.type FROM stats_contributions c
-                 JOIN inapp_products i ON i.id=c.inapp_product_id
-                 WHERE c.id = %(contribution_id)s LIMIT 1;"""
-        self.cursor.execute(
-            sql,
-            {'contribution_id': self.get_contribution_id()}
-        )
-        result = self.cursor.fetchone()
+        contribution_id = self.get_contribution_id()
+        key = inapp_purchase_key(contribution_id)
+        result = self.get_cached_purchase(key)
+        if result is None and key not in self.prefetched:
+            self.setup_db()
+            sql = """SELECT i.guid, c.type FROM stats_contributions c
+                     JOIN inapp_products i ON i.id=c.inapp_product_id
+                     WHERE c.id = %(contribution_id)s LIMIT 1;"""
+            self.cursor.execute(sql, {'contribution_id': contribution_id})
+            result = self.cursor.fetchone()
+            if result:
+                set_purchase(key, result)
         if not result:
             log_info('Invalid in-app receipt, no purchase')
             raise InvalidReceipt('NO_PURCHASE')
@@ -266,18 +336,24 @@ class Verify:
         """
         Verifies that the app has been purchased by the user.
         """
-        self.setup_db()
-        sql = """SELECT type FROM addon_purchase
-                 WHERE addon_id = %(app_id)s
-                 AND uuid = %(uuid)s LIMIT 1;"""
-        self.cursor.execute(sql, {'app_id': self.get_app_id(),
-                                  'uuid': self.get_user()})
-        result = self.cursor.fetchone()
-        if not result:
+        app_id, uuid = self.get_app_id(), self.get_user()
+        key = app_purchase_key(app_id, uuid)
+        purchase_type = self.get_cached_purchase(key)
+        if purchase_type is None and key not in self.prefetched:
+            self.setup_db()
+            sql = """SELECT type FROM addon_purchase
+                     WHERE addon_id = %(app_id)s
+                     AND uuid = %(uuid)s LIMIT 1;"""
+            self.cursor.execute(sql, {'app_id': app_id, 'uuid': uuid})
+            result = self.cursor.fetchone()
+            if result:
+                purchase_type = result[0]
+                set_purchase(key, purchase_type)
+        if purchase_type is None:
             log_info('Invalid app receipt, no purchase')
             raise InvalidReceipt('NO_PURCHASE')
 
-        self.check_purchase_type(result[0])
+        self.check_purchase_type(purchase_type)
 
     def check_purchase_type(self, purchase_type):
         """
@@ -356,6 +432,113 @@ class Verify:
         return {'status': 'expired'}
 
 
+class BatchVerify:
+
+    def __init__(self, receipt_list, environ):
+        self.receipts = receipt_list
+        self.environ = environ
+
+        # This is so the unit tests can override the connection.
+        self.conn, self.cursor = None, None
+
+    def check_full(self):
+        """
+        Does what Verify.check_full() does for each receipt, but looks up
+        all the purchases at once. Returns the list of the results.
+        """
+        receipt_domain = urlparse(static_url('WEBAPPS_RECEIPT_URL')).netloc
+        results = [None] * len(self.receipts)
+        verifiers = {}
+        for i, receipt in enumerate(self.receipts):
+            verify = Verify(receipt, self.environ)
+            try:
+                verify.decoded = verify.decode()
+                verify.check_type('purchase-receipt')
+                verify.check_url(receipt_domain)
+            except InvalidReceipt, err:
+                results[i] = verify.invalid(str(err))
+            else:
+                verifiers[i] = verify
+
+        self.prefetch_purchases(verifiers.values())
+
+        for i, verify in verifiers.items():
+            try:
+                verify.check_purchase()
+            except InvalidReceipt, err:
+                results[i] = verify.invalid(str(err))
+            except RefundedReceipt:
+                results[i] = verify.refund()
+            else:
+                results[i] = verify.ok_or_expired()
+
+        return results
+
+    def setup_db(self):
+        """
+        Establish a connection to the database.
+        """
+        if not self.cursor:
+            self.conn = mypool.connect()
+            self.cursor = self.conn.cursor()
+
+    def prefetch_purchases(self, verifiers):
+        """
+        Looks up the purchases of `verifiers` that aren't cached, with one
+        query for the apps and one for the inapps, and gives them to each
+        verifier.
+        """
+        apps, inapps, keys = {}, {}, {}
+        for verify in verifiers:
+            try:
+                if verify.is_inapp():
+                    contribution_id = verify.get_contribution_id()
+                    key = inapp_purchase_key(contribution_id)
+                    inapps[key] = contribution_id
+                else:
+                    app_id, uuid = verify.get_app_id(), verify.get_user()
+                    key = app_purchase_key(app_id, uuid)
+                    apps[key] = uuid
+            except InvalidReceipt:
+                # The verifier will find out again in check_purchase().
+                continue
+            keys.setdefault(key, []).append(verify)
+
+        purchases = get_purchases(keys.keys())
+        found = {}
+
+        uuids = set(uuid for key, uuid in apps.items()
+                    if key not in purchases)
+        if uuids:
+            self.setup_db()
+            sql = """SELECT addon_id, uuid, type FROM addon_purchase
+                     WHERE uuid IN %(uuids)s;"""
+            self.cursor.execute(sql, {'uuids': tuple(uuids)})
+            for app_id, uuid, purchase_type in self.cursor.fetchall():
+                found[app_purchase_key(app_id, uuid)] = purchase_type
+
+        contribution_ids = set(contribution_id for key, contribution_id
+                               in inapps.items() if key not in purchases)
+        if contribution_ids:
+            self.setup_db()
+            sql = """SELECT c.id, i.guid, c.type FROM stats_contributions c
+                     JOIN inapp_products i ON i.id=c.inapp_product_id
+                     WHERE c.id IN %(contribution_ids)s;"""
+            self.cursor.execute(sql,
+                                {'contribution_ids': tuple(contribution_ids)})
+            for contribution_id, guid, purchase_type in self.cursor.fetchall():
+                found[inapp_purchase_key(contribution_id)] = (guid,
+                                                              purchase_type)
+
+        if found:
+            set_purchases(found)
+        purchases.update(found)
+
+        for key, key_verifiers in keys.items():
+            for verify in key_verifiers:
+                verify.prefetched[key] = purchases.get(key)
+
+
 def get_headers(length):
     return [('Access-Control-Allow-Origin', '*'),
             ('Access-Control-Allow-Methods', 'POST'),
@@ -366,6 +549,48 @@ def get_headers(length):
             ('Last-Modified', format_date_time(time()))]
 
 
+# The verifiers and keys shared by the requests of this process, with the time
+# they were created at.
+_verifiers = {}
+_keys = {}
+
+
+def get_verifier():
+    """
+    Return the ReceiptVerifier for the valid issuers. It is rebuilt every
+    RECEIPT_VERIFIER_REFRESH_INTERVAL seconds so that new keys of the issuers
+    get picked up.
+    """
+    issuers = tuple(settings.SIGNING_VALID_ISSUERS)
+    verifier, created = _verifiers.get(issuers, (None, 0))
+    if (verifier is None or
+            time() - created > settings.RECEIPT_VERIFIER_REFRESH_INTERVAL):
+        statsd.incr('services.verify.verifier.reload')
+        verifier = ReceiptVerifier(valid_issuers=list(issuers))
+        _verifiers[issuers] = (verifier, time())
+    else:
+        statsd.incr('services.verify.verifier.hit')
+    return verifier
+
+
+def get_receipt_key():
+    """
+    Return the key to decode receipts with when the signing server isn't
+    used. It is reloaded from disk every RECEIPT_VERIFIER_REFRESH_INTERVAL
+    seconds.
+    """
+    path = settings.WEBAPPS_RECEIPT_KEY
+    key, loaded = _keys.get(path, (None, 0))
+    if (key is None or
+            time() - loaded > settings.RECEIPT_VERIFIER_REFRESH_INTERVAL):
+        statsd.incr('services.verify.key.reload')
+        key = jwt.rsa_load(path)
+        _keys[path] = (key, time())
+    else:
+        statsd.incr('services.verify.key.hit')
+    return key
+
+
 def decode_receipt(receipt):
     """
     Cracks the receipt using the private key. This will probably change
@@ -373,8 +598,7 @@ def decode_receipt(receipt):
     """
     with statsd.timer('services.decode'):
         if settings.SIGNING_SERVER_ACTIVE:
-            verifier = certs.ReceiptVerifier(
-                valid_issuers=settings.SIGNING_VALID_ISSUERS)
+            verifier = get_verifier()
             try:
                 result = verifier.verify(receipt)
             except ExpiredSignatureError:
@@ -384,7 +608,7 @@ def decode_receipt(receipt):
                 raise VerificationError()
             return jwt.decode(receipt.split('~')[1], verify=False)
         else:
-            key = jwt.rsa_load(settings.WEBAPPS_RECEIPT_KEY)
+            key = get_receipt_key()
             raw = jwt.decode(receipt, key,
                              algorithms=settings.SUPPORTED_JWT_ALGORITHMS)
     return raw
@@ -421,6 +645,27 @@ def receipt_check(environ):
     return output
 
 
+def batch_receipt_check(environ):
+    with statsd.timer('services.verify.batch'):
+        try:
+            data = json.loads(environ['wsgi.input'].read())
+        except ValueError:
+            return 400, ''
+        if (not isinstance(data, list) or
+                len(data) > settings.RECEIPT_VERIFY_MAX_BATCH or
+                not all(isinstance(receipt, basestring) for receipt in data)):
+            return 400, ''
+
+        # The receipts were issued for the path of the single receipt check.
+        path = environ['PATH_INFO'][:-len(BATCH_SUFFIX)]
+        try:
+            verify = BatchVerify(data, dict(environ, PATH_INFO=path))
+            return 200, json.dumps(verify.check_full())
+        except:
+            log_exception('<none>')
+            return 500, ''
+
+
 def application(environ, start_response):
     body = ''
     path = environ.get('PATH_INFO', '')
@@ -429,7 +674,9 @@ def application(environ, start_response):
     else:
         # Only allow POST per verifier spec but also OPTIONS for CORS.
         method = environ.get('REQUEST_METHOD')
-        if method == 'POST':
+        if method == 'POST' and path.endswith('/' + BATCH_SUFFIX):
+            status, body = batch_receipt_check(environ)
+        elif method == 'POST':
             status, body = receipt_check(environ)
         elif method == 'OPTIONS':
             status = 204
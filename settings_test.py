@@ -58,6 +58,7 @@ ES_DEFAULT_NUM_REPLICAS = 0
 # See the following URL on why we set num_shards to 1 for tests:
 # http://www.elasticsearch.org/guide/en/elasticsearch/guide/current/relevance-is-broken.html
 ES_DEFAULT_NUM_SHARDS = 1
+ES_INDEX_QUEUE_DELAY = 0
 IARC_MOCK = True
 IN_TEST_SUITE = True
 INSTALLED_APPS += ('mkt.translations.tests.testapp',)
@@ -67,10 +68,14 @@ PASSWORD_HASHERS = (
 PAYMENT_PROVIDERS = ['bango', 'reference']
 # This is a precaution in case something isn't mocked right.
 PRE_GENERATE_APK_URL = 'http://you-should-never-load-this.com/'
+# The local cache isn't cleared between tests.
+RECEIPT_PURCHASE_LOCAL_CACHE_TIMEOUT = 0
 RUN_ES_TESTS = True
 SEND_REAL_EMAIL = True
 SITE_URL = 'http://testserver'
 STATIC_URL = SITE_URL + '/'
 TASK_USER_ID = '4043307'
 TEMPLATE_DEBUG = False
+# The local cache isn't cleared between tests.
+TRANSLATIONS_LOCAL_CACHE_TIMEOUT = 0
 VIDEO_LIBRARIES = ['lib.video.dummy']